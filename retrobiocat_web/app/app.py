@@ -16,6 +16,9 @@ import datetime
 from mongoengine import disconnect
 from mongoengine import Q
 from retrobiocat_web.analysis import queue_auto_jobs
+from retrobiocat_web.retro.generation.retrosynthesis_engine import expansion_cache
+from retrobiocat_web.retro.evaluation import score_cache
+from retrobiocat_web.retro.generation.retrosynthesis_engine.aizynthfinder_actions import aizynth_action_applier
 from datetime import timedelta
 
 csrf = CSRFProtect()
@@ -47,6 +50,11 @@ def create_app(config_class=Config, use_talisman=True):
 
     print("Init task queues...")
     app.redis = Redis.from_url(app.config['REDIS_URL'])
+    expansion_cache.configure_redis(app.redis, max_entries=app.config['EXPANSION_CACHE_MAX_ENTRIES'])
+    score_cache.configure_redis(app.redis, max_entries=app.config['SCSCORE_CACHE_MAX_ENTRIES'])
+    aizynth_action_applier.template_cache.max_size = app.config['AIZYNTH_TEMPLATE_CACHE_SIZE']
+    if app.config['AIZYNTH_POLICY_SOCKET'] is not None:
+        aizynth_action_applier.use_policy_server(app.config['AIZYNTH_POLICY_SOCKET'])
     app.osra_queue = rq.Queue('osra', connection=app.redis, default_timeout=600)
     app.task_queue = rq.Queue('tasks', connection=app.redis, default_timeout=600)
     app.network_queue = rq.Queue('network', connection=app.redis, default_timeout=600)
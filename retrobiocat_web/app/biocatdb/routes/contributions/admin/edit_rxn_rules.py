@@ -9,6 +9,7 @@ from retrobiocat_web.mongo.models.biocatdb_models import EnzymeType
 from retrobiocat_web.app.biocatdb.functions.reaction_rules import yaml_conversion
 from retrobiocat_web.app.biocatdb.functions.reaction_rules.reaction_tests import ReactionTester
 from retrobiocat_web.retro.generation.network_generation.network import Network
+from retrobiocat_web.retro.generation.load import load_from_mongo
 
 from retrobiocat_web.mongo.models.biocatdb_models import Activity
 
@@ -173,6 +174,7 @@ def save_reaction():
     reaction.requires_absence_of_water = requires_absence_of_water
 
     reaction.save()
+    load_from_mongo.bump_rules_version()
 
     refresh = 'False'
     if rxn_selection != reaction.name:
@@ -1,7 +1,7 @@
 from retrobiocat_web.app.biocatdb import bp
 from flask import render_template, flash, redirect, url_for, request, jsonify, session, current_app
 from flask_security import roles_required, current_user
-from retrobiocat_web.mongo.models.biocatdb_models import EnzymeType, Sequence, Activity, Paper, Molecule
+from retrobiocat_web.mongo.models.biocatdb_models import EnzymeType, Sequence, Activity, Paper, Molecule, bump_data_version
 from retrobiocat_web.app.app import user_datastore
 import json
 from retrobiocat_web.app.biocatdb.functions.activity import check_activity_data, cascade_activity_data
@@ -126,12 +126,14 @@ def task_update_fingerprints():
     # Delete old fingerprints
     mols = Molecule.objects(smiles__in=old_smiles)
     mols.delete()
+    bump_data_version(Molecule._get_collection_name())
 
 
 def delete_other_data(ids, paper):
     p_Q = db.Q(paper=paper)
     data_id_Q = db.Q(id__nin=ids)
     Activity.objects(p_Q & data_id_Q).delete()
+    bump_data_version(Activity._get_collection_name())
 
 def update_activity(data_dict, paper, user):
     if data_dict.get('_id', '') != '':
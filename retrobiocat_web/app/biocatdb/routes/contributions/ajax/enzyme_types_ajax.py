@@ -3,6 +3,7 @@ from flask import request, jsonify
 from flask_security import roles_required
 from retrobiocat_web.mongo.models.biocatdb_models import EnzymeType, Sequence, Activity
 from retrobiocat_web.mongo.models.reaction_models import Reaction
+from retrobiocat_web.retro.generation.load import load_from_mongo
 
 def change_enzyme_type_name(enz_type, new_name):
 
@@ -17,6 +18,7 @@ def change_enzyme_type_name(enz_type, new_name):
         reaction.enzyme_types.append(new_name)
         reaction.cofactors[new_name] = reaction.cofactors.pop(old_name)
         reaction.save()
+    load_from_mongo.bump_rules_version()
     for activity in Activity.objects(enzyme_type=old_name):
         activity.enzyme_type = new_name
         activity.save()
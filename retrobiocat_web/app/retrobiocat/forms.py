@@ -33,7 +33,7 @@ enzyme_node_choices = [('Substrate specificity', 'Substrate specificity'),
 
 edges_choices = [('Off', 'Off'), ('Complexity change', 'Complexity change')]
 
-score_substrates = [('Product only', 'Product only'), ('Product + substrates (slower)', 'Product + substrates (slower)')]
+score_substrates = [('Product + substrates', 'Product + substrates'), ('Product only', 'Product only')]
 
 class NetworkExploreForm(FlaskForm):
     target_smiles = StringField('Target SMILES', validators=[DataRequired(), is_accepted_by_rdkit])
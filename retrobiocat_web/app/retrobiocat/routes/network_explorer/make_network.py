@@ -59,8 +59,8 @@ def task_make_network(form_data):
                              "max_reactions": form_data["max_reactions"],
                              'only_reviewed_activity_data': bool(form_data["only_reviewed"])})
 
-    if form_data["specificity_scoring_mode"] == 'Product + substrates (slower)':
-        network.update_settings({'specificity_score_substrates' : True})
+    if form_data["specificity_scoring_mode"] == 'Product only':
+        network.update_settings({'specificity_score_substrates' : False})
 
     #print(f"include_experimental = {network.settings['include_experimental']}")
     #print(f"include_two_step = {network.settings['include_two_step']}")
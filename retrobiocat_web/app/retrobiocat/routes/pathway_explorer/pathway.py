@@ -133,8 +133,8 @@ def task_get_pathways(form_data):
                              "only_postitive_enzyme_data": not form_data['show_neg_enz'],
                              'only_reviewed_activity_data': bool(form_data["only_reviewed"])})
 
-    if form_data["specificity_scoring_mode"] == 'Product + substrates (slower)':
-        network.update_settings({'specificity_score_substrates': True})
+    if form_data["specificity_scoring_mode"] == 'Product only':
+        network.update_settings({'specificity_score_substrates': False})
 
     network.generate(form_data['target_smiles'], form_data['number_steps'], calculate_scores=False)
 
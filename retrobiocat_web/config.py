@@ -46,5 +46,10 @@ class Config(object):
     SESSION_REDIS = redis.from_url(REDIS_URL)
     SESSION_USE_SIGNER = True
 
+    EXPANSION_CACHE_MAX_ENTRIES = int(os.environ.get('EXPANSION_CACHE_MAX_ENTRIES') or 200000)
+    SCSCORE_CACHE_MAX_ENTRIES = int(os.environ.get('SCSCORE_CACHE_MAX_ENTRIES') or 500000)
+    AIZYNTH_TEMPLATE_CACHE_SIZE = int(os.environ.get('AIZYNTH_TEMPLATE_CACHE_SIZE') or 5000)
+    AIZYNTH_POLICY_SOCKET = os.environ.get('AIZYNTH_POLICY_SOCKET')
+
     OSRA_API_HOST = os.environ.get('OSRA_API_HOST') or 'http://localhost:8080'
 
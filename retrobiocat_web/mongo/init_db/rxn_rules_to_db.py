@@ -1,6 +1,6 @@
 import os
 import yaml
-from retrobiocat_web.mongo.models.reaction_models import Reaction
+from retrobiocat_web.mongo.models.reaction_models import Reaction, ReactionRulesVersion
 from retrobiocat_web.mongo.models.biocatdb_models import EnzymeType
 from pathlib import Path
 import mongoengine as db
@@ -39,6 +39,8 @@ def load_into_mongo(yaml_dict):
 
             reaction.save()
 
+    ReactionRulesVersion.objects().update_one(inc__version=1, upsert=True)
+
 def load_reaction_rules_into_mongo(yaml_file=YAML_PATH):
     yaml_dict = load_yaml_dict(yaml_file)
     load_into_mongo(yaml_dict)
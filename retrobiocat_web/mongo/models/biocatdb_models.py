@@ -169,7 +169,34 @@ class Sequence(db.Document):
 
     meta = {'indexes': ['enzyme_name', 'enzyme_type']}
 
-class Molecule(db.DynamicDocument):
+class DataVersion(db.Document):
+    """ A version number for a collection which is cached outside of mongo (eg the activity index), bumped on every write """
+    name = db.StringField(unique=True)
+    version = db.IntField(default=0)
+
+def bump_data_version(name):
+    DataVersion.objects(name=name).update_one(inc__version=1, upsert=True)
+
+class VersionedDocument():
+    """ Mixin which bumps the DataVersion of the collection when a document is saved or deleted, or it is dropped """
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        bump_data_version(self._get_collection_name())
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_data_version(self._get_collection_name())
+        return result
+
+    @classmethod
+    def drop_collection(cls):
+        result = super().drop_collection()
+        bump_data_version(cls._get_collection_name())
+        return result
+
+class Molecule(VersionedDocument, db.DynamicDocument):
     smiles = db.StringField()
     mol = db.BinaryField()
     #mfp2_2048 = db.StringField()
@@ -180,7 +207,7 @@ class Molecule(db.DynamicDocument):
 
     meta = {'indexes': ['smiles']}
 
-class Activity(db.Document):
+class Activity(VersionedDocument, db.Document):
     enzyme_type = db.StringField()
     enzyme_name = db.StringField()
     reaction = db.StringField()
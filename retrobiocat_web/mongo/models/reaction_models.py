@@ -42,3 +42,6 @@ class AutoProcessingRule(db.Document):
     min_steps = db.IntField()
     max_steps = db.IntField()
     ignore_substrate_two = db.BooleanField()
+
+class ReactionRulesVersion(db.Document):
+    version = db.IntField(default=0)
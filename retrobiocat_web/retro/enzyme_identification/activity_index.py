@@ -0,0 +1,132 @@
+"""
+An in memory index of the activity data, grouped by (reaction, enzyme_type), with the packed fingerprints of each
+group's products and substrates, so SubstrateSpecificityScorer.scoreReaction scores with numpy and without a
+mongo query for every reaction and enzyme.
+
+The index is built once per process (and fingerprint mode), and is rebuilt when the activity data changes
+(every save or delete of an Activity bumps its DataVersion).  Changes are checked for at most every CHECK_INTERVAL
+seconds.  RQ forks a new process for every job, so worker.py calls warm_activity_index before each job,
+and jobs inherit an index which is already built.
+"""
+
+import time
+import numpy as np
+from retrobiocat_web.retro.enzyme_identification import query_mongodb
+from retrobiocat_web.retro.enzyme_identification.load import make_fingerprints
+from retrobiocat_web.retro.enzyme_identification.similarity_search import PopcountSearchIndex
+
+CHECK_INTERVAL = 30
+
+
+# the stacked fingerprint matrices of an ActivityGroup
+PRODUCT, SUB_ONE, SUB_TWO = 0, 1, 2
+
+
+class ActivityGroup():
+
+    def __init__(self, index, rows):
+        """
+        The activity data for one (reaction, enzyme_type), as row numbers of index.df,
+        with the product, substrate 1 and substrate 2 fingerprints stacked into one (3, rows, words) array
+        """
+        self.rows = rows
+        self.binary = index.binary[rows]
+        self.reviewed = index.reviewed[rows]
+
+        fp_rows = [index.product_rows[rows], index.sub_one_rows[rows], index.sub_two_rows[rows]]
+        self.has_fp = np.stack([r != -1 for r in fp_rows])
+        self.has_product_fp = self.has_fp[PRODUCT]
+        self.has_sub_one_fp = self.has_fp[SUB_ONE]
+        self.has_sub_two_fp = self.has_fp[SUB_TWO]
+
+        fps, counts = zip(*[index.fingerprints.get_rows(r) for r in fp_rows])
+        self.fps = np.stack(fps)
+        self.counts = np.stack(counts)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ActivityIndex():
+
+    def __init__(self, activity_df, fingerprints, version=None):
+        self.df = activity_df.reset_index(drop=True)
+        self.fingerprints = fingerprints
+        self.version = version
+
+        self.product_rows = fingerprints.rows_for(list(self.df['product_1_smiles']))
+        self.sub_one_rows = fingerprints.rows_for(list(self.df['substrate_1_smiles']))
+        self.sub_two_rows = fingerprints.rows_for(list(self.df['substrate_2_smiles']))
+        self.binary = (self.df['binary'] == 1).to_numpy()
+        self.reviewed = (self.df['reviewed'] == True).to_numpy()
+
+        self.key_rows = {}
+        if len(self.df.index) != 0:
+            self.key_rows = dict(self.df.groupby(['reaction', 'enzyme_type']).indices)
+        self.groups = {}
+        self.product_search = None
+
+    def get_product_search(self):
+        """ A popcount bucketed search index of every product fingerprint """
+        if self.product_search is None:
+            self.product_search = PopcountSearchIndex(self.fingerprints, self.product_rows)
+        return self.product_search
+
+    def select_rows(self, listReactions, listEnzymes, only_reviewed=False):
+        """ Row numbers of the activity data for these reactions and enzymes, as query_specificity_data """
+        mask = np.ones(len(self.df.index), dtype=bool)
+        if not ("All" in listEnzymes or len(listEnzymes) == 0 or listEnzymes == ['']):
+            mask &= self.df['enzyme_type'].isin(listEnzymes).to_numpy()
+        if not ("All" in listReactions or len(listReactions) == 0 or listReactions == ['']):
+            mask &= self.df['reaction'].isin(listReactions).to_numpy()
+        if only_reviewed == True:
+            mask &= self.reviewed
+        return np.flatnonzero(mask)
+
+    def get_group(self, reaction, enzyme):
+        """ The ActivityGroup for reaction and enzyme, where 'All' or '' matches everything (as query_specificity_data) """
+        key = (reaction, enzyme)
+        if key not in self.groups:
+            self.groups[key] = ActivityGroup(self, self._select_rows(reaction, enzyme))
+        return self.groups[key]
+
+    def _select_rows(self, reaction, enzyme):
+        all_reactions = reaction in ['All', '']
+        all_enzymes = enzyme in ['All', '']
+        if not all_reactions and not all_enzymes:
+            return np.asarray(self.key_rows.get((reaction, enzyme), []), dtype=np.int64)
+
+        mask = np.ones(len(self.df.index), dtype=bool)
+        if not all_reactions:
+            mask &= (self.df['reaction'] == reaction).to_numpy()
+        if not all_enzymes:
+            mask &= (self.df['enzyme_type'] == enzyme).to_numpy()
+        return np.flatnonzero(mask)
+
+
+# {fingerprint mode: ActivityIndex}, with the time the version was last checked
+activity_indexes = {}
+last_checked = {}
+
+def get_activity_index(mode, fingerprints):
+    """ The activity index for this fingerprint mode, rebuilt if the activity data or fingerprints have changed """
+    index = activity_indexes.get(mode)
+    if index is not None and index.fingerprints is not fingerprints:
+        index = None
+    if index is not None and time.time() - last_checked.get(mode, 0) < CHECK_INTERVAL:
+        return index
+
+    version = query_mongodb.get_activity_version()
+    last_checked[mode] = time.time()
+    if index is None or index.version != version:
+        index = ActivityIndex(query_mongodb.query_all_activity_data(), fingerprints, version=version)
+        activity_indexes[mode] = index
+    return index
+
+def clear_activity_indexes():
+    activity_indexes.clear()
+    last_checked.clear()
+
+def warm_activity_index(mode=make_fingerprints.default_fp_mode):
+    """ Load (or bring up to date) the fingerprints and activity index for mode in this process """
+    get_activity_index(mode, make_fingerprints.load_fp_matrix(mode))
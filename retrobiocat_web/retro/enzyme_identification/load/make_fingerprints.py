@@ -1,7 +1,11 @@
 from rdkit import Chem
 import pandas as pd
+import time
+from pathlib import Path
 from rdkit.Chem import rdFingerprintGenerator
 from retrobiocat_web.mongo.models.biocatdb_models import Molecule
+from retrobiocat_web.retro.enzyme_identification import query_mongodb
+from retrobiocat_web.retro.enzyme_identification.packed_fingerprints import FingerprintMatrix
 from rdkit import DataStructs
 
 
@@ -10,6 +14,13 @@ fingerprint_options = {'mfp_default': ['morgan', {}],
 
 default_fp_mode = 'rdfp_default'
 
+fingerprint_folder = str(Path(__file__).parents[3]) + '/retro/data/fingerprints'
+
+# {mode: FingerprintMatrix} loaded in this process, and when the molecules version was last checked
+CHECK_INTERVAL = 30
+loaded_fp_matrices = {}
+last_checked = {}
+
 
 def make_fp_generator(fp_type, settings):
     if fp_type == 'morgan':
@@ -111,8 +122,42 @@ def load_fp_df_from_mongo(mode):
 
     return fp_df
 
+def make_fp_matrix_from_mongo(mode, version=None):
+    """ Pack the stored fingerprint bitstrings of every molecule, without making rdkit fingerprints """
+    query_result = Molecule.objects(**{f"{mode}__exists": True}).as_pymongo().only('smiles', mode)
+    smiles, bitstrings = [], []
+    for doc in query_result:
+        if doc.get(mode) and doc.get('smiles'):
+            smiles.append(doc['smiles'])
+            bitstrings.append(doc[mode])
+    return FingerprintMatrix.from_bitstrings(smiles, bitstrings, version=version)
+
+def load_fp_matrix(mode, folder=fingerprint_folder):
+    """
+    Returns a FingerprintMatrix for mode, shared by everything in this process.
+    It is loaded memory mapped from folder, and only rebuilt from mongo (and saved) when the molecules change.
+    """
+    fp_matrix = loaded_fp_matrices.get(mode)
+    if fp_matrix is not None and time.time() - last_checked.get(mode, 0) < CHECK_INTERVAL:
+        return fp_matrix
+
+    version = query_mongodb.get_data_version(Molecule)
+    last_checked[mode] = time.time()
+    if fp_matrix is not None and fp_matrix.version == version:
+        return fp_matrix
+
+    fp_matrix = FingerprintMatrix.load(folder, mode, version=version)
+    if fp_matrix is None:
+        fp_matrix = make_fp_matrix_from_mongo(mode, version=version)
+        try:
+            fp_matrix.save(folder, mode)
+        except OSError as e:
+            print(f'WARNING could not save fingerprint matrix to {folder} - {e}')
+
+    loaded_fp_matrices[mode] = fp_matrix
+    return fp_matrix
+
 if __name__ == "__main__":
-    import time
     from retrobiocat_web.mongo.default_connection import make_default_connection
     make_default_connection()
 
@@ -120,4 +165,9 @@ if __name__ == "__main__":
     fp_df2 = load_fp_df_from_mongo(default_fp_mode)
     t1 = time.time()
     print(fp_df2.head())
-    print(f"Time to load fingerprints from mongo = {round(t1 - t0, 4)} seconds")
\ No newline at end of file
+    print(f"Time to load fingerprints from mongo = {round(t1 - t0, 4)} seconds")
+
+    t0 = time.time()
+    fp_matrix = load_fp_matrix(default_fp_mode)
+    t1 = time.time()
+    print(f"Time to load fingerprint matrix of {len(fp_matrix)} molecules = {round(t1 - t0, 4)} seconds")
\ No newline at end of file
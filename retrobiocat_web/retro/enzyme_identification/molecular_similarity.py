@@ -1,10 +1,14 @@
 import pandas as pd
 import numpy as np
-from rdkit import DataStructs
 from rdkit.Chem import AllChem
 import time
 from retrobiocat_web.retro.enzyme_identification.load import make_fingerprints
-from retrobiocat_web.retro.enzyme_identification import query_mongodb
+from retrobiocat_web.retro.enzyme_identification import activity_index
+from retrobiocat_web.retro.enzyme_identification.activity_index import PRODUCT, SUB_ONE, SUB_TWO
+from retrobiocat_web.retro.enzyme_identification.packed_fingerprints import pack_fingerprint, popcount, tanimoto_pairs
+
+# categorical activity levels, in the order they are sorted on
+ACTIVITY_LEVELS = {'High': 3, 'Medium': 2, 'Low': 1, 'None': 0}
 
 def process_activity_data(activity_data):
     for i, record in enumerate(activity_data):
@@ -64,7 +68,7 @@ class SubstrateSpecificityScorer():
 
         self.mode = mode
 
-        self.fingerprintDf = make_fingerprints.load_fp_df_from_mongo(self.mode)
+        self.fingerprint_matrix = make_fingerprints.load_fp_matrix(self.mode)
 
         fingerprint_settings = make_fingerprints.fingerprint_options[self.mode]
         self.fp_gen = make_fingerprints.make_fp_generator(fingerprint_settings[0],
@@ -76,6 +80,9 @@ class SubstrateSpecificityScorer():
         self.print_log = print_log
         self.log_times = log_times
 
+        self.activity_index = None
+        self.packed_fingerprints = {}
+
     def scoreReaction(self, reaction, enzyme, p1, s1, s2, sim_cutoff=0.7, onlyActive=True, maxEnzymes=1, maxHits=4, only_reviewed=False):
         """
         scoreReaction is called when generating a network, to score whether a similar reaction is in the database.
@@ -84,14 +91,19 @@ class SubstrateSpecificityScorer():
         We need to edit this dict so it contains more information from the query, so that this can be displayed.
         """
 
-        spec_df = query_mongodb.query_specificity_data([reaction], [enzyme], only_reviewed=only_reviewed)
-        if len(spec_df.index) != 0:
-            spec_df_f = self.get_fingerprints(spec_df)
-            spec_df_f = self.drop_fingerprint_nan(spec_df_f, p1, s1, s2)
+        group = self.get_activity_index().get_group(reaction, enzyme)
+        if len(group) != 0:
+            keep = self.rows_with_fingerprints(group, p1, s1, s2)
+            if only_reviewed == True:
+                keep &= group.reviewed
 
-            if len(spec_df_f.index) != 0:
-                sim_df = self.calculate_similarity(spec_df_f, p1, s1, s2)
-                top_df = self.get_top_similarity_df(sim_df, sim_cutoff, onlyActive)
+            similarity = self.calculate_group_similarity(group, p1, s1, s2)
+            keep &= similarity[self.cols.simScoreCol] >= sim_cutoff
+            if onlyActive == True:
+                keep &= group.binary
+
+            if keep.any():
+                top_df = self.group_similarity_df(group, keep, similarity)
                 bestEnzDf = self.get_best_enzymes(top_df, maxEnzymes, maxHits)
 
                 if len(bestEnzDf) != 0:
@@ -105,14 +117,83 @@ class SubstrateSpecificityScorer():
 
         return 0, False
 
+    def get_activity_index(self):
+        """ The process wide activity index, fetched (and checked for changes) once per scorer """
+        if self.activity_index is None:
+            self.activity_index = activity_index.get_activity_index(self.mode, self.fingerprint_matrix)
+        return self.activity_index
+
+    def rows_with_fingerprints(self, group, p, s1, s2):
+        """ A mask of the rows of an ActivityGroup with fingerprints for every molecule being scored """
+        keep = np.ones(len(group), dtype=bool)
+        if p != None and p != '':
+            keep &= group.has_product_fp
+
+        if self.score_substrates==True:
+            if s1 != None and s1 != '':
+                keep &= group.has_sub_one_fp
+            if s2 != None and s2 != '':
+                keep &= group.has_sub_two_fp
+        return keep
+
+    def calculate_group_similarity(self, group, productSmi, substrateOneSmi, substrateTwoSmi):
+        """
+        The similarity of each row of an ActivityGroup to the query, as a dict of similarity arrays.
+        Every product and substrate similarity needed is calculated in a single pass over the group's fingerprints.
+        """
+        queries = [self._get_packed_fingerprint(smi) for smi in [productSmi, substrateOneSmi, substrateTwoSmi]]
+
+        pairs = []
+        if queries[0] is not None:
+            pairs.append((0, PRODUCT))
+        if self.score_substrates==True and queries[1] is not None:
+            pairs.append((1, SUB_ONE))
+            if queries[2] is not None:
+                pairs.extend([(2, SUB_TWO), (1, SUB_TWO), (2, SUB_ONE)])
+
+        similarity = {}
+        if len(pairs) != 0:
+            num_words = group.fps.shape[2]
+            query_matrix = np.stack([q if q is not None else np.zeros(num_words, dtype=np.uint64) for q in queries])
+            sims = tanimoto_pairs(query_matrix, popcount(query_matrix), group.fps, group.counts, pairs)
+
+            if pairs[0] == (0, PRODUCT):
+                similarity[self.cols.prodSimCol] = sims[0]
+                sims = sims[1:]
+            if len(sims) == 1:
+                similarity[self.cols.subSimCol] = sims[0]
+            elif len(sims) == 4:
+                # the best of substrate 1 to 1 and 2 to 2, or substrate 1 to 2 and 2 to 1
+                similarity[self.cols.subSimCol] = np.maximum(sims[0] + sims[1], sims[2] + sims[3])
+
+        if self.cols.prodSimCol in similarity and self.cols.subSimCol in similarity:
+            similarity[self.cols.simScoreCol] = (similarity[self.cols.prodSimCol] + similarity[self.cols.subSimCol]) / 2
+        elif self.cols.prodSimCol in similarity:
+            similarity[self.cols.simScoreCol] = similarity[self.cols.prodSimCol]
+        elif self.cols.subSimCol in similarity:
+            similarity[self.cols.simScoreCol] = similarity[self.cols.subSimCol]
+        else:
+            similarity[self.cols.simScoreCol] = np.zeros(len(group))
+
+        return similarity
+
+    def group_similarity_df(self, group, keep, similarity):
+        """ The kept rows of an ActivityGroup as a dataframe with similarity columns, sorted by similarity """
+        order = np.argsort(-similarity[self.cols.simScoreCol][keep], kind='stable')
+        sim_df = self.get_activity_index().df.iloc[group.rows[keep][order]].copy()
+        for col, values in similarity.items():
+            sim_df[col] = values[keep][order]
+        return sim_df
+
     def querySpecificityDf(self, productSmi, listReactionNames, listEnzymes,
                            dataLevel='All', numEnzymes=5, numHits=2, simCutoff=0.65,
                            include_auto_generated=True, only_reviewed=False):
 
 
 
-        spec_df = query_mongodb.query_specificity_data(listReactionNames, listEnzymes, only_reviewed=only_reviewed)
-        self._log(f'Queried mongodb, retrieved {len(spec_df.index)} entries')
+        index = self.get_activity_index()
+        spec_df = index.df.iloc[index.select_rows(listReactionNames, listEnzymes, only_reviewed=only_reviewed)]
+        self._log(f'Selected {len(spec_df.index)} entries from the activity index')
 
         spec_df = self.filter_df_by_data_level(spec_df, dataLevel)
 
@@ -126,13 +207,13 @@ class SubstrateSpecificityScorer():
 
         if productSmi != '':
             self._log('Product entered, getting similar products..')
-            spec_df_f = self.get_fingerprints(spec_df)
-            spec_df_f = self.drop_fingerprint_nan(spec_df_f, productSmi, None, None)
-            self._log(f"Fingerprint entries = {len(spec_df_f.index)}")
+            product_rows = index.product_rows[spec_df.index.to_numpy()]
+            spec_df = spec_df[product_rows != -1]
+            product_rows = product_rows[product_rows != -1]
+            self._log(f"Fingerprint entries = {len(spec_df.index)}")
 
-            if len(spec_df_f.index) != 0:
-                sim_df = self.calculate_similarity(spec_df_f, productSmi, None, None)
-                top_df = self.get_top_similarity_df(sim_df, simCutoff, False)
+            if len(spec_df.index) != 0:
+                top_df = self.search_similar_products(index, spec_df, product_rows, productSmi, simCutoff, numHits)
                 return self.get_best_enzymes(top_df, numEnzymes, numHits)
             else:
                 self._log("No similar fingerprints found")
@@ -142,105 +223,76 @@ class SubstrateSpecificityScorer():
             self._log('No product, getting best enzymes..')
             return self.get_best_enzymes(spec_df, numEnzymes, False)
 
-    def get_fingerprints(self, spec_df):
-        how = 'left'
-
-        spec_df = spec_df.merge(self.fingerprintDf, how=how, left_on=self.cols.prodOneSmiCol, right_on='smiles')
-        spec_df = spec_df.rename(columns={"fp": self.cols.prodOneFingCol})
-        spec_df = spec_df.drop(columns=['smiles'])
-
-        if self.score_substrates==True:
-            spec_df = spec_df.merge(self.fingerprintDf, how=how, left_on=self.cols.subOneSmiCol, right_on='smiles')
-            spec_df = spec_df.rename(columns={"fp": self.cols.subOneFingCol})
-            spec_df = spec_df.drop(columns=['smiles'])
-
-            spec_df = spec_df.merge(self.fingerprintDf, how=how, left_on=self.cols.subTwoSmiCol, right_on='smiles')
-            spec_df = spec_df.rename(columns={"fp": self.cols.subTwoFingCol})
-            spec_df = spec_df.drop(columns=['smiles'])
-
-        return spec_df
-
-    def drop_fingerprint_nan(self, df, p, s1, s2):
-        if p != None and p != '':
-            df = df.dropna(subset=[self.cols.prodOneFingCol])
-
-        if self.score_substrates==True:
-            if s1 != None and s1 != '':
-                df = df.dropna(subset=[self.cols.subOneFingCol])
-            if s2 != None and s2 != '':
-                df = df.dropna(subset=[self.cols.subTwoFingCol])
-        return df
-
-    def calculate_similarity(self, spec_df_f, productSmi, substrateOneSmi, substrateTwoSmi):
-        productFp = self._get_fingerprint(productSmi)
-        substrateOneFp = self._get_fingerprint(substrateOneSmi)
-        substrateTwoFp = self._get_fingerprint(substrateTwoSmi)
-
-        if productFp != None:
-            spec_df_f[self.cols.prodSimCol] = DataStructs.BulkTanimotoSimilarity(productFp, list(spec_df_f[self.cols.prodOneFingCol]))
-
-        if self.score_substrates==True:
-            if substrateOneFp != None:
-                if substrateTwoFp == None:
-                    spec_df_f[self.cols.subSimCol] = DataStructs.BulkTanimotoSimilarity(substrateOneFp, list(spec_df_f[self.cols.subOneFingCol]))
-                else:
-                    spec_df_f['s1_s1'] = DataStructs.BulkTanimotoSimilarity(substrateOneFp, list(spec_df_f[self.cols.subOneFingCol]))
-                    spec_df_f['s1_s2'] = DataStructs.BulkTanimotoSimilarity(substrateOneFp,
-                                                                            list(spec_df_f[self.cols.subTwoFingCol]))
-                    spec_df_f['s2_s1'] = DataStructs.BulkTanimotoSimilarity(substrateTwoFp,
-                                                                            list(spec_df_f[self.cols.subOneFingCol]))
-                    spec_df_f['s2_s2'] = DataStructs.BulkTanimotoSimilarity(substrateTwoFp,
-                                                                            list(spec_df_f[self.cols.subTwoFingCol]))
-
-                    spec_df_f['1_2'] = spec_df_f['s1_s1'] + spec_df_f['s2_s2']
-                    spec_df_f['2_1'] = spec_df_f['s1_s2'] + spec_df_f['s2_s1']
-                    spec_df_f[self.cols.subSimCol] = spec_df_f[['1_2', '2_1']].max(axis=1)
-
-        if self.cols.prodSimCol in spec_df_f.columns:
-            if self.cols.subSimCol in spec_df_f.columns:
-                spec_df_f[self.cols.simScoreCol] = (spec_df_f[self.cols.prodSimCol] + spec_df_f[self.cols.subSimCol]) / 2
-            else:
-                spec_df_f[self.cols.simScoreCol] = spec_df_f[self.cols.prodSimCol]
-
-        elif self.cols.subSimCol in spec_df_f.columns:
-            spec_df_f[self.cols.simScoreCol] = spec_df_f[self.cols.subSimCol]
-
-        else:
-            spec_df_f[self.cols.simScoreCol] = 0
-
-        spec_df_f = spec_df_f.sort_values((self.cols.simScoreCol), ascending=False)
-        return spec_df_f
+    def search_similar_products(self, index, spec_df, product_rows, productSmi, simCutoff, numHits):
+        """
+        The rows of spec_df (with product fingerprint rows product_rows) with a product similarity of at least simCutoff,
+        sorted by similarity.  Only the products needed for the best numHits are searched for.
+        """
+        search = index.get_product_search()
+        allowed = np.zeros(len(index.fingerprints), dtype=bool)
+        allowed[product_rows] = True
+
+        k = numHits if numHits else None
+        productFp = self._get_packed_fingerprint(productSmi)
+        rows, sims = search.search(productFp, cutoff=float(simCutoff), k=k, allowed=allowed)
+        self._log(f"Searched {search.last_scanned} of {len(search)} product fingerprints")
+
+        similarity_of_row = np.full(len(index.fingerprints), -1.0)
+        similarity_of_row[rows] = sims
+        similarity = similarity_of_row[product_rows]
+
+        keep = similarity != -1
+        order = np.argsort(-similarity[keep], kind='stable')
+        sim_df = spec_df[keep].iloc[order].copy()
+        sim_df[self.cols.prodSimCol] = similarity[keep][order]
+        sim_df[self.cols.simScoreCol] = similarity[keep][order]
+        return sim_df
 
-    def get_top_similarity_df(self, simDf, cutoff, onlyActive):
+    def get_best_enzymes(self, topDf, numEnzymes, maxHits):
+        """
+        For the first maxHits (substrates, product) combinations in topDf (all if maxHits is False),
+        the numEnzymes rows with the highest activity, in a single sort.
+        """
+        if len(topDf.index) == 0:
+            return pd.DataFrame()
 
-        topDf = simDf[simDf[self.cols.simScoreCol] >= cutoff]
+        smi_cols = [self.cols.subOneSmiCol, self.cols.subTwoSmiCol, self.cols.prodOneSmiCol]
+        hit = topDf[smi_cols].groupby(smi_cols, sort=False, dropna=False).ngroup().to_numpy()
 
-        if onlyActive == True:
-            topDf = topDf[topDf[self.cols.binaryCol] == 1]
+        activity = self._activity_values_to_sort_on(topDf, hit)
+        sort_key = np.where(np.isnan(activity), np.inf, -activity)
+        order = np.lexsort((np.arange(len(hit)), sort_key, hit))
 
-        return topDf
+        sorted_hits = hit[order]
+        hit_starts = np.flatnonzero(np.concatenate([[True], sorted_hits[1:] != sorted_hits[:-1]]))
+        rank_in_hit = np.arange(len(order)) - np.repeat(hit_starts, np.diff(np.append(hit_starts, len(order))))
 
-    def get_best_enzymes(self, topDf, numEnzymes, maxHits):
+        keep = rank_in_hit < numEnzymes
+        if maxHits != False:
+            keep &= sorted_hits < maxHits
 
-        top_enzymes = pd.DataFrame()
+        return topDf.iloc[order[keep]]
 
-        listSmi = []
-        numHits = 0
-        for index, row in topDf.iterrows():
-            rowSmi = str([row[self.cols.subOneSmiCol], row[self.cols.subTwoSmiCol], row[self.cols.prodOneSmiCol]])
-            if (rowSmi not in listSmi) and (numHits<maxHits or maxHits==False):
-                listSmi.append(rowSmi)
-                numHits += 1
-                candidates = topDf[(topDf[self.cols.subOneSmiCol]).isin([row[self.cols.subOneSmiCol]]) &
-                                   (topDf[self.cols.subTwoSmiCol].isin([row[self.cols.subTwoSmiCol]])) &
-                                   (topDf[self.cols.prodOneSmiCol].isin([row[self.cols.prodOneSmiCol]]))]
+    def _activity_values_to_sort_on(self, df, hit):
+        """
+        For each row, the activity measure its hit is sorted on, as floats.
+        A hit is sorted on specific activity if every row of it has one, otherwise on conversion if every row has one,
+        otherwise on the categorical activity level (High > Medium > Low > None) if every row has one,
+        otherwise on binary activity.
+        """
+        num_hits = hit.max() + 1
+        specific_activity = pd.to_numeric(df[self.cols.sa], errors='coerce').to_numpy(dtype=float)
+        conversion = pd.to_numeric(df[self.cols.conversion], errors='coerce').to_numpy(dtype=float)
+        categorical = df[self.cols.categorical].map(ACTIVITY_LEVELS).to_numpy(dtype=float)
+        binary = np.where(df[self.cols.binaryCol].isnull(), np.nan, (df[self.cols.binaryCol] == True).astype(float))
 
-                column_to_sort_on = self._find_activity_to_sort_on(candidates)
-                candidates = candidates.sort_values(column_to_sort_on, ascending=False)
-                candidates = candidates.iloc[0:numEnzymes]
-                top_enzymes = top_enzymes.append(candidates)
+        all_specific = np.bincount(hit, weights=np.isnan(specific_activity), minlength=num_hits) == 0
+        all_conversion = np.bincount(hit, weights=np.isnan(conversion), minlength=num_hits) == 0
+        all_categorical = np.bincount(hit, weights=np.isnan(categorical), minlength=num_hits) == 0
 
-        return top_enzymes
+        return np.where(all_specific[hit], specific_activity,
+                        np.where(all_conversion[hit], conversion,
+                                 np.where(all_categorical[hit], categorical, binary)))
 
     def info_from_top_df(self, top_df):
         def make_smiles_reaction(product, sub1, sub2):
@@ -294,6 +346,15 @@ class SubstrateSpecificityScorer():
         self._log(f'Filtered by data level {data_level}, {len(df.index)} entries returned')
         return df
 
+    def _get_packed_fingerprint(self, smi):
+        """ _get_fingerprint packed for numpy, remembered as the same smiles are scored for every possible enzyme """
+        if smi not in self.packed_fingerprints:
+            if len(self.packed_fingerprints) > 10000:
+                self.packed_fingerprints = {}
+            fp = self._get_fingerprint(smi)
+            self.packed_fingerprints[smi] = pack_fingerprint(fp) if fp is not None else None
+        return self.packed_fingerprints[smi]
+
     def _get_fingerprint(self, smi):
         if smi is None:
             return None
@@ -307,34 +368,6 @@ class SubstrateSpecificityScorer():
 
         return fp
 
-    def _find_activity_to_sort_on(self, df):
-        specific = True
-        conversion = True
-        categorical = True
-        binary = True
-
-        for index, row in df.iterrows():
-            if np.isnan(row[self.cols.sa]) == True:
-                specific = False
-            if np.isnan(row[self.cols.conversion]) == True:
-                conversion = False
-            if row[self.cols.categorical] != type(str):
-                categorical = False
-            # if np.isnan(row['Binary Activity (True or False)']) == True:
-            # binary = False
-
-        if specific == True:
-            return self.cols.sa
-        elif conversion == True:
-            return self.cols.conversion
-        elif categorical == True:
-            return self.cols.categorical
-        elif binary == True:
-            return self.cols.binaryCol
-        else:
-            print('Error no activity category is suitable')
-            return None
-
     def _log_time(self, msg):
         if self.log_times==True:
             print(msg)
@@ -0,0 +1,167 @@
+"""
+Fingerprints packed into rows of a uint64 matrix, so tanimoto similarities can be calculated with numpy
+(popcount of bitwise and) against many fingerprints at once, in place of BulkTanimotoSimilarity.
+
+Rows are looked up by a 64 bit hash of their smiles, with a sorted array of hashes and the row of each,
+so an index never has to be built in python.  A FingerprintMatrix can be saved to a folder as {name}.npy (the matrix),
+{name}_counts.npy (bits set per row), {name}_keys.npy and {name}_key_rows.npy (the sorted hashes and their rows)
+and {name}.json (format, version stamp and size), and loaded back with every array memory mapped.
+"""
+
+import json
+import os
+import numpy as np
+from retrobiocat_web.retro.evaluation.building_block_index import hash_many
+
+FORMAT_VERSION = 2
+ARRAYS = ['', '_counts', '_keys', '_key_rows']
+
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(packed):
+    """ The number of set bits in each row of a packed matrix (or in a single packed fingerprint) """
+    packed = np.ascontiguousarray(packed)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(packed).sum(axis=-1, dtype=np.int64)
+    return POPCOUNT_TABLE[packed.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+def pack_bitstrings(bitstrings, num_bits=None):
+    """ Pack a list of '0101..' bitstrings (all the same length) into a uint64 matrix, one row per bitstring """
+    if num_bits is None:
+        num_bits = len(bitstrings[0]) if len(bitstrings) != 0 else 0
+    num_words = (num_bits + 63) // 64
+
+    bits = np.frombuffer(''.join(bitstrings).encode('ascii'), dtype=np.uint8).reshape(len(bitstrings), num_bits) == ord('1')
+    packed = np.zeros((len(bitstrings), num_words * 8), dtype=np.uint8)
+    packed[:, :(num_bits + 7) // 8] = np.packbits(bits, axis=1)
+    return packed.view(np.uint64)
+
+def pack_fingerprint(fp):
+    """ Pack an rdkit ExplicitBitVect into a uint64 array """
+    return pack_bitstrings([fp.ToBitString()])[0]
+
+def tanimoto(query, matrix, counts=None, query_count=None):
+    """ Tanimoto similarity of a packed query fingerprint to every row of matrix (0 where both are empty, as rdkit) """
+    if counts is None:
+        counts = popcount(matrix)
+    if query_count is None:
+        query_count = popcount(query)
+
+    common = popcount(np.bitwise_and(matrix, query))
+    union = counts + query_count - common
+    # common is 0 where union is, so two empty fingerprints have a similarity of 0
+    return common / np.maximum(union, 1)
+
+def tanimoto_pairs(queries, query_counts, targets, target_counts, pairs):
+    """
+    Tanimoto similarities for a list of (query, target) pairs in one pass, where queries is a (num queries, words)
+    matrix and targets a stack of (num targets, n, words) matrices.  Returns a (len(pairs), n) array.
+    """
+    query_idx = np.array([pair[0] for pair in pairs], dtype=np.int64)
+    target_idx = np.array([pair[1] for pair in pairs], dtype=np.int64)
+
+    common = popcount(np.bitwise_and(targets[target_idx], queries[query_idx][:, None, :]))
+    union = target_counts[target_idx] + query_counts[query_idx][:, None] - common
+    # common is 0 where union is, so two empty fingerprints have a similarity of 0
+    return common / np.maximum(union, 1)
+
+
+class FingerprintMatrix():
+
+    def __init__(self, matrix, keys, key_rows, counts=None, version=None):
+        """ A packed matrix of fingerprints, where keys are the sorted smiles hashes of the rows and key_rows their rows """
+        self.matrix = matrix
+        self.keys = keys
+        self.key_rows = key_rows
+        self.version = version
+        if counts is None:
+            counts = popcount(matrix) if len(matrix) != 0 else np.zeros(0, dtype=np.int64)
+        self.counts = counts
+        self.num_words = matrix.shape[1] if matrix.ndim == 2 else 0
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @classmethod
+    def from_smiles(cls, smiles, matrix, counts=None, version=None):
+        """ A FingerprintMatrix where row i is the fingerprint of smiles[i] (the first row is used for a repeated smiles) """
+        hashes = hash_many(list(smiles))
+        keys, key_rows = np.unique(hashes, return_index=True)
+        return cls(matrix, keys, key_rows.astype(np.int64), counts=counts, version=version)
+
+    def rows_for(self, list_smiles):
+        """ The row of each smiles, or -1 where there is no fingerprint (or no smiles - '', None or NaN from mongo) """
+        rows = np.full(len(list_smiles), -1, dtype=np.int64)
+        is_smiles = np.array([type(smi) == str and smi != '' for smi in list_smiles], dtype=bool)
+        if not is_smiles.any() or len(self.keys) == 0:
+            return rows
+
+        query = hash_many([smi for smi, valid in zip(list_smiles, is_smiles) if valid])
+        positions = np.searchsorted(self.keys, query)
+        positions[positions == len(self.keys)] = 0
+        is_match = self.keys[positions] == query
+        found = np.full(len(query), -1, dtype=np.int64)
+        found[is_match] = self.key_rows[positions[is_match]]
+        rows[is_smiles] = found
+        return rows
+
+    def get_rows(self, rows):
+        """ The packed fingerprints and counts of rows, with missing rows (-1) as empty fingerprints """
+        rows = np.asarray(rows, dtype=np.int64)
+        fps = np.zeros((len(rows), self.num_words), dtype=np.uint64)
+        counts = np.zeros(len(rows), dtype=np.int64)
+        present = rows != -1
+        fps[present] = self.matrix[rows[present]]
+        counts[present] = self.counts[rows[present]]
+        return fps, counts
+
+    def save(self, folder, name):
+        """ Write the arrays and metadata, each to a temporary file which is then moved into place """
+        os.makedirs(folder, exist_ok=True)
+        path = f"{folder}/{name}"
+        tmp = f".{os.getpid()}.tmp"
+
+        arrays = [np.ascontiguousarray(self.matrix), np.asarray(self.counts, dtype=np.int64),
+                  np.asarray(self.keys, dtype=np.uint64), np.asarray(self.key_rows, dtype=np.int64)]
+        for suffix, array in zip(ARRAYS, arrays):
+            with open(f"{path}{suffix}.npy{tmp}", 'wb') as f:
+                np.save(f, array, allow_pickle=False)
+        with open(f"{path}.json{tmp}", 'w') as f:
+            json.dump({'format': FORMAT_VERSION, 'version': self.version, 'num_words': self.num_words,
+                       'num_rows': len(self)}, f)
+
+        # the json goes last, so a reader never sees metadata without its arrays
+        for suffix in ARRAYS:
+            os.replace(f"{path}{suffix}.npy{tmp}", f"{path}{suffix}.npy")
+        os.replace(f"{path}.json{tmp}", f"{path}.json")
+
+    @classmethod
+    def load(cls, folder, name, version=None):
+        """ Load a saved matrix (memory mapped), or return None if it is missing, another format, or not version """
+        path = f"{folder}/{name}"
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            if meta.get('format') != FORMAT_VERSION:
+                return None
+            if version is not None and meta.get('version') != version:
+                return None
+
+            if meta['num_rows'] == 0:
+                return cls(np.zeros((0, meta['num_words']), dtype=np.uint64), np.zeros(0, dtype=np.uint64),
+                           np.zeros(0, dtype=np.int64), counts=np.zeros(0, dtype=np.int64), version=meta['version'])
+            matrix, counts, keys, key_rows = [np.load(f"{path}{suffix}.npy", mmap_mode='r') for suffix in ARRAYS]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if matrix.shape[0] != meta['num_rows'] or counts.shape[0] != meta['num_rows'] or len(keys) != len(key_rows):
+            return None
+        return cls(matrix, keys, key_rows, counts=counts, version=meta['version'])
+
+    @classmethod
+    def from_bitstrings(cls, smiles, bitstrings, version=None, chunk_size=20000):
+        """ Pack '0101..' bitstrings chunk_size at a time """
+        chunks = [pack_bitstrings(bitstrings[i:i+chunk_size]) for i in range(0, len(bitstrings), chunk_size)]
+        matrix = np.concatenate(chunks) if len(chunks) != 0 else np.zeros((0, 0), dtype=np.uint64)
+        return cls.from_smiles(smiles, matrix, version=version)
@@ -1,4 +1,4 @@
-from retrobiocat_web.mongo.models.biocatdb_models import Sequence, EnzymeType, Activity
+from retrobiocat_web.mongo.models.biocatdb_models import Sequence, EnzymeType, Activity, DataVersion
 from mongoengine.queryset.visitor import Q
 import pandas as pd
 
@@ -63,6 +63,27 @@ def query_specificity_data(listReactions, listEnzymes, only_reviewed=False):
 
     return spec_df
 
+def query_all_activity_data():
+    """ Every activity record, with the reviewed column, for building an activity index """
+    result = Activity.objects().as_pymongo()
+    spec_df = pd.DataFrame(list(result))
+    spec_df = spec_df.reindex(columns=COLUMNS + ['reviewed'])
+    return spec_df
+
+def get_data_version(document):
+    """
+    Returns a stamp which changes whenever documents in the collection are saved or deleted (see VersionedDocument).
+    The id of the DataVersion is included, so the stamp is not reused if the database is replaced.
+    """
+    name = document._get_collection_name()
+    version_doc = DataVersion.objects(name=name).first()
+    if version_doc is None:
+        version_doc = DataVersion.objects(name=name).modify(upsert=True, new=True, set_on_insert__version=0)
+    return f"{version_doc.id}-{version_doc.version}"
+
+def get_activity_version():
+    return get_data_version(Activity)
+
 def get_reactions_in_db():
     reactions = Activity.objects().distinct('reaction')
     return reactions
@@ -0,0 +1,95 @@
+"""
+Tanimoto similarity search over packed fingerprints, without scanning every fingerprint.
+
+Fingerprints are bucketed by popcount.  The tanimoto similarity of fingerprints with a and b bits set
+can be at most min(a, b) / max(a, b), so buckets are searched best bound first, and the search stops once
+no remaining bucket can reach the cutoff (or beat the k-th best similarity found so far).
+"""
+
+import numpy as np
+from retrobiocat_web.retro.enzyme_identification.packed_fingerprints import popcount, tanimoto
+
+EPSILON = 1e-9
+
+
+def tanimoto_upper_bound(counts, query_count):
+    counts = np.asarray(counts, dtype=np.float64)
+    largest = np.maximum(counts, query_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(largest == 0, 1.0, np.minimum(counts, query_count) / np.maximum(largest, 1))
+
+
+class PopcountSearchIndex():
+
+    def __init__(self, fingerprints, rows):
+        """ An index of rows of a FingerprintMatrix (-1 is ignored), sorted into popcount buckets """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        rows = rows[rows != -1]
+        counts = np.asarray(fingerprints.counts[rows])
+
+        order = np.argsort(counts, kind='stable')
+        self.rows = rows[order]
+        self.counts = counts[order]
+        self.matrix = np.asarray(fingerprints.matrix[self.rows])
+
+        self.bucket_counts, self.bucket_starts = np.unique(self.counts, return_index=True)
+        self.bucket_ends = np.append(self.bucket_starts[1:], len(self.rows)).astype(np.int64)
+        self.last_scanned = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query, cutoff=0, k=None, allowed=None):
+        """
+        Returns (rows, similarities) of the fingerprints with a similarity to query of at least cutoff, best first.
+        k limits the result to the k best.  allowed is an optional boolean mask over the rows of the FingerprintMatrix.
+        """
+        query_count = int(popcount(query))
+        bounds = tanimoto_upper_bound(self.bucket_counts, query_count)
+        bucket_order = np.argsort(-bounds, kind='stable')
+
+        found_rows, found_sims = [], []
+        num_found = 0
+        kth_best = -1
+        self.last_scanned = 0
+
+        for b in bucket_order:
+            if bounds[b] < max(cutoff, kth_best) - EPSILON:
+                break
+
+            start, end = self.bucket_starts[b], self.bucket_ends[b]
+            rows, fps, counts = self.rows[start:end], self.matrix[start:end], self.counts[start:end]
+            if allowed is not None:
+                selected = allowed[rows]
+                if not selected.any():
+                    continue
+                rows, fps, counts = rows[selected], fps[selected], counts[selected]
+
+            self.last_scanned += len(rows)
+            sims = tanimoto(query, fps, counts, query_count)
+            keep = sims >= cutoff
+            if not keep.any():
+                continue
+
+            found_rows.append(rows[keep])
+            found_sims.append(sims[keep])
+            num_found += int(keep.sum())
+
+            if k is not None and num_found >= k:
+                found_rows, found_sims = self._best(found_rows, found_sims, k)
+                found_rows, found_sims = [found_rows], [found_sims]
+                num_found = len(found_rows[0])
+                kth_best = found_sims[0][-1]
+
+        return self._best(found_rows, found_sims, k)
+
+    @staticmethod
+    def _best(found_rows, found_sims, k):
+        if len(found_rows) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        rows = np.concatenate(found_rows)
+        sims = np.concatenate(found_sims)
+        order = np.lexsort((rows, -sims))
+        if k is not None:
+            order = order[:k]
+        return rows[order], sims[order]
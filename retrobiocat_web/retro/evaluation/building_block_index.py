@@ -0,0 +1,182 @@
+"""
+An in memory index of building block smiles, to replace one sqlite query per substrate.
+
+Smiles are stored as a sorted array of 64 bit hashes (saved next to the database as a .npy file and memory mapped
+on later loads), so nothing has to be built when an index is loaded.
+contains_many tests a whole list of smiles at once with a numpy searchsorted.
+A 64 bit hash collision between a substrate and a building block is possible, but with ~10 million
+building blocks the chance for any one query is around 1 in 10^12.
+
+Indexes compiled by scripts/buyable/compile_building_blocks.py are a single versioned .bbi file -
+a header, the sorted hashes, and optionally a bitmask per hash of the vendors which stock it.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import numpy as np
+
+BBI_MAGIC = b'RBCBBIDX'
+BBI_VERSION = 1
+# magic, version, bytes per vendor mask (0 for none), number of hashes, length of the vendor json
+BBI_HEADER = struct.Struct('<8sIIQQ')
+MASK_DTYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+
+def smiles_hash(smi):
+    """ A 64 bit hash of a smiles which is the same in every process (unlike hash()) """
+    return int.from_bytes(hashlib.blake2b(smi.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def hash_many(list_smiles):
+    return np.fromiter((smiles_hash(smi) for smi in list_smiles), dtype=np.uint64, count=len(list_smiles))
+
+
+def mask_bytes_for(num_vendors):
+    if num_vendors == 0:
+        return 0
+    for num_bytes in sorted(MASK_DTYPES):
+        if num_vendors <= num_bytes * 8:
+            return num_bytes
+    raise ValueError(f'A maximum of 64 vendors is supported, not {num_vendors}')
+
+def _aligned(offset):
+    return offset + (-offset % 8)
+
+def write_bbi_header(f, count, vendors):
+    """ Write the header of a .bbi file, returning the offset the hashes start at """
+    vendors_json = json.dumps(list(vendors)).encode('utf-8')
+    f.write(BBI_HEADER.pack(BBI_MAGIC, BBI_VERSION, mask_bytes_for(len(vendors)), count, len(vendors_json)))
+    f.write(vendors_json)
+    offset = BBI_HEADER.size + len(vendors_json)
+    f.write(b'\0' * (_aligned(offset) - offset))
+    return _aligned(offset)
+
+def read_bbi(path):
+    """ Returns (hashes, masks, vendors) from a .bbi file, with the arrays memory mapped """
+    with open(path, 'rb') as f:
+        magic, version, mask_bytes, count, vendors_len = BBI_HEADER.unpack(f.read(BBI_HEADER.size))
+        if magic != BBI_MAGIC:
+            raise ValueError(f'{path} is not a building block index')
+        if version != BBI_VERSION:
+            raise ValueError(f'{path} is building block index version {version}, expected {BBI_VERSION}')
+        vendors = json.loads(f.read(vendors_len).decode('utf-8'))
+
+    offset = _aligned(BBI_HEADER.size + vendors_len)
+    if count == 0:
+        hashes = np.zeros(0, dtype=np.uint64)
+        masks = None if mask_bytes == 0 else np.zeros(0, dtype=MASK_DTYPES[mask_bytes])
+        return hashes, masks, vendors
+
+    hashes = np.memmap(path, dtype=np.uint64, mode='r', offset=offset, shape=(count,))
+    masks = None
+    if mask_bytes != 0:
+        masks = np.memmap(path, dtype=MASK_DTYPES[mask_bytes], mode='r', offset=offset + count * 8, shape=(count,))
+    return hashes, masks, vendors
+
+
+class BuildingBlockIndex():
+
+    def __init__(self, hashes, masks=None, vendors=None):
+        """ hashes must be a sorted, unique uint64 array, with masks (if given) the vendor bitmask of each hash """
+        self.hashes = hashes
+        self.masks = masks
+        self.vendors = vendors if vendors is not None else []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _lookup(self, list_smiles):
+        """ The position of each smiles in self.hashes, or -1 if it is not there """
+        found = np.full(len(list_smiles), -1, dtype=np.int64)
+        if len(list_smiles) == 0 or len(self.hashes) == 0:
+            return found
+
+        query = hash_many(list_smiles)
+        positions = np.searchsorted(self.hashes, query)
+        positions[positions == len(self.hashes)] = 0
+        is_match = self.hashes[positions] == query
+        found[is_match] = positions[is_match]
+        return found
+
+    def contains_many(self, list_smiles):
+        """ A boolean array, True where the smiles is a building block """
+        return self._lookup(list_smiles) != -1
+
+    def vendors_many(self, list_smiles):
+        """ A list of the vendors stocking each smiles (empty if it is not a building block, or there are no vendor masks) """
+        positions = self._lookup(list_smiles)
+        result = []
+        for position in positions:
+            if position == -1 or self.masks is None:
+                result.append([])
+            else:
+                mask = int(self.masks[position])
+                result.append([vendor for i, vendor in enumerate(self.vendors) if mask & (1 << i)])
+        return result
+
+    def contains(self, smi):
+        return bool(self.contains_many([smi])[0])
+
+    @classmethod
+    def from_smiles(cls, list_smiles):
+        return cls(np.unique(hash_many(list_smiles)))
+
+    @classmethod
+    def from_sqlite(cls, db_path, table='BUYABLE', batch_size=100000):
+        """ Hash every smiles in the database, reading batch_size rows at a time """
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT SMILES FROM {table};")
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            chunks.append(hash_many([row[0] for row in rows if row[0] is not None]))
+        conn.close()
+
+        hashes = np.unique(np.concatenate(chunks)) if len(chunks) != 0 else np.zeros(0, dtype=np.uint64)
+        return cls(hashes)
+
+    def save(self, path):
+        np.save(path, np.asarray(self.hashes))
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith('.bbi'):
+            hashes, masks, vendors = read_bbi(path)
+            return cls(hashes, masks=masks, vendors=vendors)
+        return cls(np.load(path, mmap_mode='r'))
+
+
+def index_path_for_db(db_path):
+    return os.path.splitext(db_path)[0] + '_hashes.npy'
+
+def load_index_for_db(db_path, print_log=False):
+    """ Load the saved index for a building blocks database, building (and saving) it if missing or out of date """
+    if db_path.endswith('.bbi'):
+        return BuildingBlockIndex.load(db_path)
+
+    index_path = index_path_for_db(db_path)
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(db_path):
+        return BuildingBlockIndex.load(index_path)
+
+    if print_log == True:
+        print(f"Building building block index for {db_path}")
+    index = BuildingBlockIndex.from_sqlite(db_path)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        print(f"WARNING - could not save building block index to {index_path} - {e}")
+    return index
+
+
+# one index per database per process, shared by every StartingMaterialEvaluator
+loaded_indexes = {}
+
+def get_index(db_path, print_log=False):
+    if db_path not in loaded_indexes:
+        loaded_indexes[db_path] = load_index_for_db(db_path, print_log=print_log)
+    return loaded_indexes[db_path]
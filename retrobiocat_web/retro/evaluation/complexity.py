@@ -1,16 +1,33 @@
 from retrobiocat_web.retro.generation.node_analysis import rdkit_smile
+from retrobiocat_web.retro.evaluation import score_cache
 
 
-def add_scscore(graph, substrate_nodes, sc_score_model):
-    for node in list(graph.nodes):
+def add_scscore(graph, substrate_nodes, sc_score_model, nodes=None):
+    """ Add complexity to nodes which don't have it yet - every node in graph, or only those in nodes if given """
+    to_score = nodes_to_scscore(graph, substrate_nodes, nodes=nodes)
+    for node, attributes in scscore_attributes(to_score, sc_score_model).items():
+        graph.nodes[node]['attributes'].update(attributes)
+
+    return graph
+
+def nodes_to_scscore(graph, substrate_nodes, nodes=None):
+    """ The substrate nodes without a complexity, setting the complexity of any other node without one to 0 """
+    if nodes is None:
+        nodes = graph.nodes
+
+    to_score = []
+    for node in list(nodes):
         if 'complexity' not in graph.nodes[node]['attributes']:
             if node in substrate_nodes:
-                (smile, score) = sc_score_model.get_score_from_smi(node)
-                graph.nodes[node]['attributes']['complexity'] = round(score, 4)
+                to_score.append(node)
             else:
                 graph.nodes[node]['attributes']['complexity'] = 0
+    return to_score
 
-    return graph
+def scscore_attributes(list_smiles, sc_score_model):
+    """ {smiles: {'complexity': score}}, without touching the graph """
+    scores = score_cache.get_scscores(list_smiles, sc_score_model)
+    return {smi: {'complexity': round(scores[smi], 4)} for smi in list_smiles}
 
 def max_complexity(graph, list_nodes):
     complexity = 0
@@ -19,8 +36,11 @@ def max_complexity(graph, list_nodes):
             complexity = graph.nodes[node]['attributes']['complexity']
     return complexity
 
-def add_change_in_complexity(graph):
-    for node in list(graph):
+def add_change_in_complexity(graph, nodes=None):
+    if nodes is None:
+        nodes = graph.nodes
+
+    for node in list(nodes):
         if 'change_in_complexity' not in graph.nodes[node]['attributes']:
             successors = list(graph.successors(node))
             predecessors = list(graph.predecessors(node))
@@ -29,11 +49,14 @@ def add_change_in_complexity(graph):
 
     return graph
 
-def add_relative_complexity(graph, target_smile):
+def add_relative_complexity(graph, target_smile, nodes=None):
+    if nodes is None:
+        nodes = graph.nodes
+
     target_smile = rdkit_smile(target_smile)
     tm_complexity = graph.nodes[target_smile]['attributes']['complexity']
 
-    for node in list(graph):
+    for node in list(nodes):
         if graph.nodes[node]['attributes']['node_type'] == 'substrate':
             if 'relative_complexity' not in graph.nodes[node]['attributes']:
                 complexity = graph.nodes[node]['attributes']['complexity']
@@ -42,10 +65,13 @@ def add_relative_complexity(graph, target_smile):
 
     return graph
 
-def add_reaction_relative_complexity(graph, target_smile):
+def add_reaction_relative_complexity(graph, target_smile, nodes=None):
+    if nodes is None:
+        nodes = graph.nodes
+
     tm_complexity = graph.nodes[target_smile]['attributes']['complexity']
 
-    for node in list(graph):
+    for node in list(nodes):
         if graph.nodes[node]['attributes']['node_type'] == 'reaction':
             if 'reaction_avg_relative_complexity' not in graph.nodes[node]['attributes']:
 
@@ -0,0 +1,84 @@
+"""
+A canonical smiles -> SCScore cache, shared between networks (and with a shared tier, between processes and jobs).
+
+Uses the same tiers as the expansion cache - an in-process LRU, in front of an optional redis or sqlite tier.
+"""
+
+from retrobiocat_web.retro.generation.retrosynthesis_engine.expansion_cache import LRUTier, RedisTier, SQLiteTier
+
+
+class ScoreCache():
+
+    def __init__(self, max_memory_entries=100000, print_log=False):
+        self.memory_tier = LRUTier(max_entries=max_memory_entries)
+        self.shared_tier = None
+        self.print_log = print_log
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, list_smiles):
+        """ Returns {smiles: score} for the smiles which are cached """
+        found = {}
+        not_in_memory = []
+        for smi in list_smiles:
+            score = self.memory_tier.get(smi)
+            if score is None:
+                not_in_memory.append(smi)
+            else:
+                found[smi] = score
+
+        if len(not_in_memory) != 0 and self.shared_tier is not None:
+            try:
+                shared = self.shared_tier.get_many(not_in_memory)
+            except Exception as e:
+                self._log(f"Score cache shared tier get failed - {e}")
+                shared = {}
+            for smi, score in shared.items():
+                self.memory_tier.set(smi, score)
+                found[smi] = score
+
+        self.hits += len(found)
+        self.misses += len(list_smiles) - len(found)
+        return found
+
+    def set_many(self, scores):
+        for smi, score in scores.items():
+            self.memory_tier.set(smi, score)
+        if self.shared_tier is not None:
+            try:
+                self.shared_tier.set_many(scores)
+            except Exception as e:
+                self._log(f"Score cache shared tier set failed - {e}")
+
+    def clear(self):
+        self.memory_tier.clear()
+        if self.shared_tier is not None:
+            self.shared_tier.clear()
+
+    def _log(self, msg):
+        if self.print_log == True:
+            print(msg)
+
+
+scscore_cache = ScoreCache()
+
+def configure_redis(connection, max_entries=500000):
+    """ Share scores between processes using redis """
+    scscore_cache.shared_tier = RedisTier(connection, max_entries=max_entries, prefix='scscore_cache')
+
+def configure_disk(path, max_entries=500000):
+    """ Share scores between processes using an sqlite file at path """
+    scscore_cache.shared_tier = SQLiteTier(path, max_entries=max_entries)
+
+def get_scscores(list_smiles, sc_score_model, cache=scscore_cache):
+    """ Returns {smiles: score}, scoring any not in the cache as a single batch """
+    list_smiles = list(dict.fromkeys(list_smiles))
+    scores = cache.get_many(list_smiles)
+
+    to_score = [smi for smi in list_smiles if smi not in scores]
+    if len(to_score) != 0:
+        new_scores = {smi: float(score) for smi, score in zip(to_score, sc_score_model.get_scores_from_smis(to_score))}
+        cache.set_many(new_scores)
+        scores.update(new_scores)
+
+    return scores
@@ -55,8 +55,9 @@ class SCScorer():
                 if mol is None:
                     return np.zeros((self.FP_len,), dtype=np.float32)
                 return np.array(AllChem.GetMorganFingerprintAsBitVect(mol, self.FP_rad, nBits=self.FP_len,
-                    useChirality=True), dtype=np.bool)
+                    useChirality=True), dtype=bool)
         self.mol_to_fp = mol_to_fp
+        self._counts_fp = 'uint8' in weight_path or 'counts' in weight_path
 
         self._restored = True
         return self
@@ -80,6 +81,43 @@ class SCScorer():
         x = 1 + (score_scale - 1) * sigmoid(x)
         return x
 
+    def apply_batch(self, x):
+        """ apply for a matrix of fingerprints, one per row, returning an array of scores """
+        if not self._restored:
+            raise ValueError('Must restore model weights!')
+        for i in range(0, len(self.vars), 2):
+            last_layer = (i == len(self.vars)-2)
+            x = np.matmul(x, self.vars[i]) + self.vars[i+1]
+            if not last_layer:
+                x = x * (x > 0) # ReLU
+        x = 1 + (score_scale - 1) / (1 + np.exp(-x))
+        return x.reshape(-1)
+
+    def smis_to_fp_matrix(self, smis):
+        """ Fingerprint smis straight into the rows of one float32 matrix """
+        fps = np.zeros((len(smis), self.FP_len), dtype=np.float32)
+        for i, smi in enumerate(smis):
+            if not smi:
+                continue
+            mol = Chem.MolFromSmiles(smi)
+            if mol is None:
+                continue
+            if self._counts_fp:
+                fps[i] = self.mol_to_fp(self, mol)
+            else:
+                bitvect = AllChem.GetMorganFingerprintAsBitVect(mol, self.FP_rad, nBits=self.FP_len, useChirality=True)
+                fps[i, list(bitvect.GetOnBits())] = 1
+        return fps
+
+    def get_scores_from_smis(self, smis):
+        """ Scores for a list of smiles in a single pass, 0 for any without a fingerprint (as get_score_from_smi) """
+        if len(smis) == 0:
+            return np.zeros(0)
+        fps = self.smis_to_fp_matrix(smis)
+        scores = self.apply_batch(fps)
+        scores[fps.sum(axis=1) == 0] = 0.
+        return scores
+
     def get_score_from_smi(self, smi='', v=False):
         if not smi:
             return ('', 0.)
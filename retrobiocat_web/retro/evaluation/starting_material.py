@@ -1,8 +1,7 @@
 import os
-import pandas as pd
 from pathlib import Path
-import sqlite3
 import time
+from retrobiocat_web.retro.evaluation import building_block_index
 
 
 data_folder = str(Path(__file__).parents[2]) + '/retro/data/buyability'
@@ -10,7 +9,9 @@ data_folder = str(Path(__file__).parents[2]) + '/retro/data/buyability'
 
 class StartingMaterialEvaluator():
 
-    if os.path.exists(data_folder + '/building_blocks.db'):
+    if os.path.exists(data_folder + '/building_blocks.bbi'):
+        sqlite_db_path = data_folder + '/building_blocks.bbi'
+    elif os.path.exists(data_folder + '/building_blocks.db'):
         sqlite_db_path = data_folder + '/building_blocks.db'
     else:
         sqlite_db_path = data_folder + '/building_blocks_small.db'
@@ -20,21 +21,32 @@ class StartingMaterialEvaluator():
         self.print_log = print_log
 
         if alternative_db_path != None:
-            self.conn = sqlite3.connect(alternative_db_path)
+            self.index = building_block_index.get_index(alternative_db_path, print_log=print_log)
         elif os.path.exists(self.sqlite_db_path):
-            self.conn = sqlite3.connect(self.sqlite_db_path)
+            self.index = building_block_index.get_index(self.sqlite_db_path, print_log=print_log)
         else:
-            self.conn = False
+            self.index = None
 
     def eval(self, smiles):
-        cursor = self.conn.cursor()
-        query = f"SELECT EXISTS(SELECT 1 FROM BUYABLE WHERE SMILES='{smiles}');"
-
-        cursor.execute(query)
-        result = cursor.fetchall()[0][0]
+        result = self.eval_many([smiles])[0]
         self._log(f"Query for {smiles} = {result}")
         return result
 
+    def eval_many(self, list_smiles):
+        """ 1 or 0 for each smiles, depending on whether it is a building block """
+        if self.index is None:
+            return [0 for smi in list_smiles]
+        return [int(found) for found in self.index.contains_many(list_smiles)]
+
+    def vendors(self, smiles):
+        return self.vendors_many([smiles])[0]
+
+    def vendors_many(self, list_smiles):
+        """ The vendors stocking each smiles - only available with a .bbi index compiled with vendors """
+        if self.index is None:
+            return [[] for smi in list_smiles]
+        return self.index.vendors_many(list_smiles)
+
     def _log(self, msg):
         if self.print_log == True:
             print(msg)
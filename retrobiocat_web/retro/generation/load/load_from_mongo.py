@@ -3,7 +3,7 @@ import mongoengine as db
 import time
 from retrobiocat_web.retro.rdchiral.main import rdchiralReaction
 from retrobiocat_web.mongo.models.biocatdb_models import EnzymeType
-from retrobiocat_web.mongo.models.reaction_models import Reaction
+from retrobiocat_web.mongo.models.reaction_models import Reaction, ReactionRulesVersion
 from retrobiocat_web.mongo import default_connection
 
 def get_reactions(include_experimental=False, include_two_step=False, include_requires_absence_of_water=False):
@@ -25,6 +25,20 @@ def get_reactions(include_experimental=False, include_two_step=False, include_re
     return Reaction.objects(q_exp & q_two & q_water)
 
 
+def get_rules_version():
+    """
+    Returns the current version stamp of the reaction rules, which changes whenever rules are edited.
+    The id of the ReactionRulesVersion is included, so the stamp is not reused if the database is replaced.
+    """
+    version_doc = ReactionRulesVersion.objects().first()
+    if version_doc is None:
+        version_doc = ReactionRulesVersion.objects().modify(upsert=True, new=True, set_on_insert__version=0)
+    return f"{version_doc.id}-{version_doc.version}"
+
+def bump_rules_version():
+    """ Increment the reaction rules version stamp, invalidating any cached rule sets """
+    ReactionRulesVersion.objects().update_one(inc__version=1, upsert=True)
+
 def load_rxns(query_result):
     rxns = {}
     for rxn in query_result:
@@ -0,0 +1,129 @@
+"""
+Precompiled reaction rule bundles, so rules can be loaded from disk in a single read
+rather than queried from mongo and compiled from SMARTS.
+
+A bundle holds the serialized rdchiral reactions (see rdchiralReaction.to_dict), the enzyme map
+and the cofactor dict for one combination of rule options, stamped with the rules version it was built from.
+Bundles are only written by export_bundles (run this module), to RULE_BUNDLE_FOLDER if it is set -
+loading rules never writes them.
+"""
+
+import os
+import pickle
+from pathlib import Path
+from retrobiocat_web.retro.rdchiral.main import rdchiralReaction
+
+BUNDLE_FORMAT_VERSION = 2
+
+bundle_folder = os.environ.get('RULE_BUNDLE_FOLDER') or str(Path(__file__).parents[2]) + '/data/rule_bundles'
+
+def bundle_path_for_options(include_experimental=False, include_two_step=False, include_requires_absence_of_water=False,
+                            folder=bundle_folder):
+    filename = f"rules_exp{int(bool(include_experimental))}" \
+               f"_two{int(bool(include_two_step))}" \
+               f"_water{int(bool(include_requires_absence_of_water))}.pkl"
+    return f"{folder}/{filename}"
+
+def make_bundle(rule_set, options=(False, False, False)):
+    """ Make a bundle dict from a rule_set dict (as made by rxn_class.load_mongo_rule_set) """
+    serialized_rxns = {}
+    for name, rxn_list in rule_set['rxns'].items():
+        serialized_rxns[name] = [rxn.to_dict() for rxn in rxn_list]
+
+    bundle = {'format_version': BUNDLE_FORMAT_VERSION,
+              'rules_version': rule_set['version'],
+              'options': tuple(options),
+              'rxns': serialized_rxns,
+              'reactions': rule_set['reactions'],
+              'enzymes': rule_set['enzymes'],
+              'reaction_enzyme_map': rule_set['reaction_enzyme_map'],
+              'reactionEnzymeCofactorDict': rule_set['reactionEnzymeCofactorDict']}
+    return bundle
+
+def save_bundle(bundle, path):
+    """ Write bundle to path, via a temporary file so other processes never read a partial bundle """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def read_bundle(path, rules_version=None):
+    """
+    Returns the bundle dict at path, or None if it is missing, unreadable,
+    in an old format, or (when rules_version is given) built from a different rules version stamp.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            bundle = pickle.load(f)
+    except Exception as e:
+        print(f'WARNING could not read rule bundle {path} - {e}')
+        return None
+
+    if bundle.get('format_version') != BUNDLE_FORMAT_VERSION:
+        return None
+    if rules_version is not None and bundle['rules_version'] != rules_version:
+        return None
+
+    return bundle
+
+def rule_set_from_bundle(bundle):
+    """ Convert a bundle dict back into a rule_set dict of compiled rdchiralReactions """
+    rxns = {}
+    for name, rxn_dicts in bundle['rxns'].items():
+        rxns[name] = [rdchiralReaction.from_dict(rxn_dict) for rxn_dict in rxn_dicts]
+
+    rule_set = {'version': bundle['rules_version'],
+                'rxns': rxns,
+                'reactions': bundle['reactions'],
+                'enzymes': bundle['enzymes'],
+                'reaction_enzyme_map': bundle['reaction_enzyme_map'],
+                'reactionEnzymeCofactorDict': bundle['reactionEnzymeCofactorDict']}
+    return rule_set
+
+def load_rule_set(path, rules_version=None):
+    """ Returns the rule_set dict from the bundle at path, or None if there is no usable bundle """
+    bundle = read_bundle(path, rules_version=rules_version)
+    if bundle is None:
+        return None
+
+    try:
+        return rule_set_from_bundle(bundle)
+    except Exception as e:
+        print(f'WARNING could not restore rules from bundle {path} - {e}')
+        return None
+
+def export_bundles(folder=bundle_folder):
+    """ Export a bundle for every combination of rule options from mongo """
+    from retrobiocat_web.retro.generation.load.rxn_class import load_mongo_rule_set
+
+    paths = []
+    for include_experimental in [False, True]:
+        for include_two_step in [False, True]:
+            for include_requires_absence_of_water in [False, True]:
+                options = (include_experimental, include_two_step, include_requires_absence_of_water)
+                rule_set = load_mongo_rule_set(*options, use_bundle=False)
+                path = bundle_path_for_options(*options, folder=folder)
+                save_bundle(make_bundle(rule_set, options=options), path)
+                paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    import time
+    from retrobiocat_web.mongo.default_connection import make_default_connection
+    make_default_connection()
+
+    t0 = time.time()
+    import sys
+    exported = export_bundles(folder=sys.argv[1] if len(sys.argv) > 1 else bundle_folder)
+    t1 = time.time()
+    print(f"Exported {len(exported)} rule bundles in {round(t1-t0, 3)} seconds")
+
+    t0 = time.time()
+    rule_set = load_rule_set(exported[0])
+    t1 = time.time()
+    print(f"Time to load rules from bundle = {round(t1-t0, 3)}")
@@ -1,16 +1,66 @@
-from retrobiocat_web.retro.generation.load import load_rule_yamls, load_from_mongo
+from retrobiocat_web.retro.generation.load import load_rule_yamls, load_from_mongo, rule_bundle
 from pathlib import Path
 
 yaml_path = str(Path(__file__).parents[3]) + '/data/rxn_yaml/reaction_rules.yaml'
 
+# Process wide cache of compiled rule sets from mongo,
+# {(include_experimental, include_two_step, include_requires_absence_of_water): rule_set_dict}
+mongo_rule_set_cache = {}
+
+def load_mongo_rule_set(include_experimental=False, include_two_step=False, include_requires_absence_of_water=False,
+                        use_bundle=True):
+    """
+    Returns a dict of compiled rxns, reactions, enzymes, reaction_enzyme_map and cofactors for these options.
+    Rule sets are compiled once per process, and only recompiled when the rules version stamp changes.
+    If use_bundle is True, an on-disk rule bundle for the current version is used in place of compiling, if one
+    has been exported (see rule_bundle.export_bundles). Bundles are only read here, never written.
+    """
+    key = (bool(include_experimental), bool(include_two_step), bool(include_requires_absence_of_water))
+    version = load_from_mongo.get_rules_version()
+
+    if key in mongo_rule_set_cache and mongo_rule_set_cache[key]['version'] == version:
+        return mongo_rule_set_cache[key]
+
+    rule_set = None
+    if use_bundle == True:
+        rule_set = rule_bundle.load_rule_set(rule_bundle.bundle_path_for_options(*key), rules_version=version)
+
+    if rule_set is None:
+        query_result = load_from_mongo.get_reactions(include_experimental=key[0],
+                                                     include_two_step=key[1],
+                                                     include_requires_absence_of_water=key[2])
+        reactions, enzymes, reaction_enzyme_map = load_from_mongo.load_reactions_and_enzymes(query_result)
+        rule_set = {'version': version,
+                    'rxns': load_from_mongo.load_rxns(query_result),
+                    'reactions': reactions,
+                    'enzymes': enzymes,
+                    'reaction_enzyme_map': reaction_enzyme_map,
+                    'reactionEnzymeCofactorDict': load_from_mongo.load_cofactors(query_result)}
+
+    mongo_rule_set_cache[key] = rule_set
+    return rule_set
+
+def clear_rule_set_cache():
+    mongo_rule_set_cache.clear()
+
+def get_rule_set_id(rxns):
+    """ Returns an id (rules version and options) if rxns is a cached mongo rule set, otherwise None """
+    for key, rule_set in mongo_rule_set_cache.items():
+        if rule_set['rxns'] is rxns:
+            options = ''.join(str(int(option)) for option in key)
+            return f"{rule_set['version']}-{options}"
+    return None
+
 class RetroBioCat_Reactions():
-    def __init__(self, mode='mongo', yaml_path=yaml_path, include_experimental=False, include_two_step=False, include_requires_absence_of_water=False):
+    def __init__(self, mode='mongo', yaml_path=yaml_path, include_experimental=False, include_two_step=False,
+                 include_requires_absence_of_water=False, use_cache=True, bundle_path=None):
         self.rxns_strings = None
         self.rules_by_type = None
         self.mode = mode
         self.include_experimental = include_experimental
         self.include_requires_absence_of_water = include_requires_absence_of_water
         self.include_two_step = include_two_step
+        self.version = None
 
         if mode=='yaml':
             yaml_dict = load_rule_yamls.load_yamls(yaml_path)
@@ -18,6 +68,25 @@ class RetroBioCat_Reactions():
             self.reactions, self.enzymes, self.reaction_enzyme_map = load_rule_yamls.load_reactions_and_enzymes(yaml_dict)
             self.reactionEnzymeCofactorDict = load_rule_yamls.load_cofactors(yaml_dict)
 
+        elif mode=='mongo' and use_cache == True:
+            # rxns and maps are shared with other instances, so reassign rather than modify them in place
+            rule_set = load_mongo_rule_set(include_experimental=self.include_experimental,
+                                           include_two_step=self.include_two_step,
+                                           include_requires_absence_of_water=self.include_requires_absence_of_water)
+            self._set_rule_set(rule_set)
+
+        elif mode=='bundle':
+            # load from an exported rule bundle, without needing a mongo connection
+            if bundle_path is None:
+                bundle_path = rule_bundle.bundle_path_for_options(include_experimental=self.include_experimental,
+                                                                  include_two_step=self.include_two_step,
+                                                                  include_requires_absence_of_water=self.include_requires_absence_of_water)
+            rule_set = rule_bundle.load_rule_set(bundle_path)
+            if rule_set is None:
+                print(f'WARNING NO RULES LOADED - COULD NOT LOAD BUNDLE {bundle_path}')
+            else:
+                self._set_rule_set(rule_set)
+
         elif mode=='mongo':
             query_result = load_from_mongo.get_reactions(include_experimental=self.include_experimental,
                                                          include_two_step=self.include_two_step,
@@ -28,6 +97,14 @@ class RetroBioCat_Reactions():
         else:
             print(f'WARNING NO RULES LOADED - MODE {mode} NOT RECOGNISED')
 
+    def _set_rule_set(self, rule_set):
+        self.version = rule_set['version']
+        self.rxns = rule_set['rxns']
+        self.reactions = rule_set['reactions']
+        self.enzymes = rule_set['enzymes']
+        self.reaction_enzyme_map = rule_set['reaction_enzyme_map']
+        self.reactionEnzymeCofactorDict = rule_set['reactionEnzymeCofactorDict']
+
     def load_additional_info(self):
         if self.mode=='yaml':
             yaml_dict = load_rule_yamls.load_yamls(yaml_path)
@@ -44,4 +121,4 @@ if __name__ == '__main__':
         t0 = time.time()
         rxns_class = RetroBioCat_Reactions()
         t1 = time.time()
-        print(t1-t0)
\ No newline at end of file
+        print(t1-t0)
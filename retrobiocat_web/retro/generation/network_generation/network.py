@@ -24,9 +24,13 @@ class Network(object):
                                              include_requires_absence_of_water=include_requires_absence_of_water)
         self.rxns = self.rxn_obj.rxns
 
-        self.substrate_nodes = []
-        self.reaction_nodes = []
-        self.end_nodes = []
+        # node type indexes, kept up to date as nodes are added and removed (see index_node and remove_node)
+        self.substrate_nodes = set()
+        self.reaction_nodes = set()
+        self.end_nodes = set()
+
+        # nodes added or changed since scores were last calculated, so a step only scores what it added
+        self.changed_nodes = set()
 
         self.evaluator = NetworkEvaluator(self, print_log=print_log)
         self.retrosynthesisEngine = RetrosynthesisEngine(self)
@@ -58,7 +62,7 @@ class Network(object):
                          "molSize": (300,300),
                          'prune_on_substrates' : False,
                          'max_reactions' : False,
-                         'specificity_score_substrates' : False,
+                         'specificity_score_substrates' : True,
                          'include_experimental' : include_experimental,
                          'include_two_step': include_two_step,
                          'include_requires_absence_of_water': include_requires_absence_of_water,
@@ -67,16 +71,28 @@ class Network(object):
                          'rr_max_reactions': 1,
                          'aizynth_reaction_mode': 'policy',
                          'retrobiocat_reaction_mode': 'complexity',
+                         'prefilter_rules': True,
+                         'use_expansion_cache': True,
+                         'parallel_processes': False,
+                         'parallel_min_frontier': 8,
+                         'scoring_threads': 3, #threads to run the scoring stages on at once, or False for one after another
+                         'expansion_mode': 'breadth_first', #breadth_first, best_first or chemical
+                         'best_first_priority': 'complexity', #complexity or change_in_complexity
+                         'time_budget': False,
                          'only_reviewed_activity_data': False}
+        self.evaluator.specficity_scorer.score_substrates = self.settings['specificity_score_substrates']
 
     def update_settings(self, settings):
         self.settings.update(settings)
         self.evaluator.specficity_scorer.score_substrates = self.settings['specificity_score_substrates']
         self.evaluator.buyable_scorer.mode = self.settings['building_blocks_db_mode']
 
-        if ('include_experimental' in settings) or ('two_step' in settings):
+        rule_options = ['include_experimental', 'include_two_step', 'include_requires_absence_of_water']
+        if any(option in settings for option in rule_options):
+            # compiled rule sets are cached per process, so this is cheap unless the rules have changed
             self.rxn_obj = RetroBioCat_Reactions(include_experimental=self.settings['include_experimental'],
-                                                 include_two_step=self.settings['include_two_step'])
+                                                 include_two_step=self.settings['include_two_step'],
+                                                 include_requires_absence_of_water=self.settings['include_requires_absence_of_water'])
             self.rxns = self.rxn_obj.rxns
 
 
@@ -92,6 +108,8 @@ class Network(object):
                                                             'node_type': 'substrate',
                                                             'node_num': 0,
                                                             'substrate_num' : 1})
+        self.get_node_types()
+        self.changed_nodes = {self.target_smiles}
 
         return [self.target_smiles]
 
@@ -120,19 +138,28 @@ class Network(object):
         """
 
         listSmiles, listReactions = self.retrosynthesisEngine.single_step(smiles,self.rxns,self.graph)
-        self.get_node_types()
 
         if calculate_scores == True:
-            self.evaluator.calculate_scores(self)
+            self.evaluator.calculate_scores(self, nodes=self.pop_changed_nodes())
 
         return listSmiles, listReactions
     
     def add_chemical_step(self, smiles, calculate_scores=True):
         listSmiles, listReactions = self.retrosynthesisEngine.single_aizynth_step(smiles, self.graph)
-        self.get_node_types()
 
         if calculate_scores == True:
-            self.evaluator.calculate_scores(self)
+            self.evaluator.calculate_scores(self, nodes=self.pop_changed_nodes())
+
+        return listSmiles, listReactions
+
+    def add_chemical_steps(self, list_smiles, calculate_scores=True):
+        """
+        Add a chemical step to each of list_smiles, with the policy run on them as one batch
+        """
+        listSmiles, listReactions = self.retrosynthesisEngine.aizynth_frontier_step(list_smiles, self.graph)
+
+        if calculate_scores == True:
+            self.evaluator.calculate_scores(self, nodes=self.pop_changed_nodes())
 
         return listSmiles, listReactions
 
@@ -142,14 +169,9 @@ class Network(object):
         product_smiles = rdkit_smile(product_smiles, warning=True)
         new_substrates, new_reactions = self.retrosynthesisEngine.custom_reaction(self.graph, product_smiles, substrate_smiles, reaction_name)
 
-        self.substrate_nodes.extend(new_substrates)
-        if product_smiles not in self.substrate_nodes:
-            self.substrate_nodes.append(product_smiles)
-        self.reaction_nodes.extend(new_reactions)
-
         self._log('Custom reaction added: ' + str(product_smiles) + '<--' + str(new_reactions) + '<--' + str(new_substrates))
 
-        self.calculate_scores()
+        self.evaluator.calculate_scores(self, nodes=self.pop_changed_nodes())
 
         new_substrates.append(product_smiles)
 
@@ -158,9 +180,14 @@ class Network(object):
     def calculate_scores(self):
         self.evaluator.calculate_scores(self)
 
+    def pop_changed_nodes(self):
+        """ Return the nodes added or changed since scores were last calculated, and clear them """
+        changed_nodes = self.changed_nodes
+        self.changed_nodes = set()
+        return changed_nodes
+
     def delete_reaction_node(self, reaction_node_to_remove):
         deleted = self.retrosynthesisEngine.graphPruner.delete_reaction_node(self, reaction_node_to_remove)
-        self.get_node_types()
         return deleted
 
     def visualise(self, height='750px', width='1000px', options=None):
@@ -171,9 +198,41 @@ class Network(object):
         return nodes, edges
 
     def get_node_types(self):
-        self.substrate_nodes = node_analysis.get_substrate_nodes(self.graph)
-        self.reaction_nodes = node_analysis.get_reaction_nodes(self.graph)
-        self.end_nodes = node_analysis.get_nodes_with_no_successors(self.graph)
+        """ Rebuild the node type indexes from the whole graph """
+        self.substrate_nodes = set(node_analysis.get_substrate_nodes(self.graph))
+        self.reaction_nodes = set(node_analysis.get_reaction_nodes(self.graph))
+        self.end_nodes = set(node_analysis.get_nodes_with_no_successors(self.graph))
+
+    def index_node(self, node):
+        """ Add a node which has just been added to the graph to the node type indexes """
+        node_type = self.graph.nodes[node]['attributes'].get('node_type')
+        if node_type == 'substrate':
+            self.substrate_nodes.add(node)
+        elif node_type == 'reaction':
+            self.reaction_nodes.add(node)
+
+        if self.graph.out_degree(node) == 0:
+            self.end_nodes.add(node)
+        self.changed_nodes.add(node)
+
+    def index_edge(self, source, target):
+        """ Update the node type indexes for an edge which has just been added to the graph """
+        self.end_nodes.discard(source)
+        self.changed_nodes.add(source)
+        self.changed_nodes.add(target)
+
+    def remove_node(self, node):
+        """ Remove a node from the graph and the node type indexes """
+        predecessors = list(self.graph.predecessors(node))
+        self.graph.remove_node(node)
+
+        self.substrate_nodes.discard(node)
+        self.reaction_nodes.discard(node)
+        self.end_nodes.discard(node)
+        self.changed_nodes.discard(node)
+        for predecessor in predecessors:
+            if self.graph.out_degree(predecessor) == 0:
+                self.end_nodes.add(predecessor)
 
     def _log(self, to_log):
         if self.settings['print_log'] == True:
@@ -184,8 +243,7 @@ class Network(object):
         for node in list(self.graph):
             att_dict[node] = self.graph.nodes[node]['attributes']
 
-        self.substrate_nodes = node_analysis.get_substrate_nodes(self.graph)
-        self.reaction_nodes = node_analysis.get_reaction_nodes(self.graph)
+        self.get_node_types()
         return att_dict
 
     def add_attributes(self, attributes_dict):
@@ -1,9 +1,11 @@
+import time
 from retrobiocat_web.retro.generation.load import load_rule_yamls
 from retrobiocat_web.retro.evaluation import complexity
 from retrobiocat_web.retro.evaluation.scscore.standalone_model_numpy import SCScorer
 from retrobiocat_web.retro.generation import node_analysis
 from retrobiocat_web.retro.enzyme_identification.molecular_similarity import SubstrateSpecificityScorer
 from retrobiocat_web.retro.evaluation.starting_material import StartingMaterialEvaluator
+from retrobiocat_web.retro.generation.network_generation.scoring_scheduler import ScoringScheduler, merge_attributes
 
 class NetworkEvaluator():
 
@@ -18,34 +20,113 @@ class NetworkEvaluator():
         self.enzyme_reaction_map = network.rxn_obj.reaction_enzyme_map
         self.reactionEnzymeCofactorDict = network.rxn_obj.reactionEnzymeCofactorDict
 
-    def calculate_scores(self, network):
+        # wall time in seconds of each stage of the last calculate_scores
+        self.stage_times = {}
 
-        self._log("Calculating scores")
-        self.add_scores_substrate_availability(network)
-        self.add_enzymes(network)
-        self.add_cofactors(network)
-        self.add_scores_is_enzyme(network)
-        self.add_scores_complexity(network)
-        self.add_scores_specificity(network)
+    def calculate_scores(self, network, nodes=None):
+        """
+        Score every node in the graph, or if nodes is given only those nodes and their neighbours
+        (eg the nodes added by a step, from network.pop_changed_nodes()).
 
-        self._log("Scores calculated")
+        The building block, sc score and specificity stages are independent, so are run at the same time
+        (see scoring_scheduler), with their results merged into the graph once all have finished.
+        """
+        t0 = time.perf_counter()
+
+        if nodes is None:
+            self._log("Calculating scores")
+            network.changed_nodes = set()
+        else:
+            nodes = self.nodes_to_score(network, nodes)
+            self._log(f"Calculating scores for {len(nodes)} nodes")
+
+        t1 = time.perf_counter()
+        self.add_enzymes(network, nodes=nodes)
+        self.add_cofactors(network, nodes=nodes)
+        self.add_scores_is_enzyme(network, nodes=nodes)
+        enzymes_time = time.perf_counter() - t1
+
+        stages = [self.substrate_availability_stage(network, nodes=nodes),
+                  self.complexity_stage(network, nodes=nodes),
+                  self.specificity_stage(network, nodes=nodes)]
+        stages = [stage for stage in stages if stage is not None]
+
+        scheduler = ScoringScheduler(max_workers=network.settings.get('scoring_threads', 3))
+        for updates in scheduler.run(stages):
+            merge_attributes(network.graph, updates)
+
+        t1 = time.perf_counter()
+        self.add_complexity_changes(network, nodes=nodes)
+        self.select_best_enzyme(network, nodes=nodes)
+
+        self.stage_times = {'enzymes': round(enzymes_time, 4)}
+        self.stage_times.update(scheduler.stage_times)
+        self.stage_times['after_merge'] = round(time.perf_counter() - t1, 4)
+        self.stage_times['total'] = round(time.perf_counter() - t0, 4)
+
+        self._log(f"Scores calculated - stage times (seconds) {self.stage_times}")
+
+    @staticmethod
+    def nodes_to_score(network, nodes):
+        """ nodes which are still in the graph, their predecessors and successors, and the target """
+        graph = network.graph
+        to_score = set()
+        for node in nodes:
+            if node in graph:
+                to_score.add(node)
+                to_score.update(graph.predecessors(node))
+                to_score.update(graph.successors(node))
+
+        if network.target_smiles in graph:
+            to_score.add(network.target_smiles)
+        return to_score
+
+    @staticmethod
+    def _substrate_nodes(network, nodes):
+        if nodes is None:
+            return network.substrate_nodes
+        return [node for node in nodes if node in network.substrate_nodes]
+
+    @staticmethod
+    def _reaction_nodes(network, nodes):
+        if nodes is None:
+            return network.reaction_nodes
+        return [node for node in nodes if node in network.reaction_nodes]
 
     def _log(self, msg):
         if self.print_log == True:
             print(msg)
 
-    def add_scores_complexity(self, network):
+    def add_scores_complexity(self, network, nodes=None):
+        stage = self.complexity_stage(network, nodes=nodes)
+        if stage is not None:
+            merge_attributes(network.graph, stage[1]())
+        self.add_complexity_changes(network, nodes=nodes)
+
+    def complexity_stage(self, network, nodes=None):
+        """ The sc score stage, as (name, function returning the attributes to merge), or None if it is off """
         if network.settings['calculate_complexities'] == True:
             self._log('- molecular complexity')
-            complexity.add_scscore(network.graph, network.substrate_nodes, self.sc_score_model)
-            complexity.add_change_in_complexity(network.graph)
-            complexity.add_relative_complexity(network.graph, network.target_smiles)
-            complexity.add_reaction_relative_complexity(network.graph, network.target_smiles)
+            to_score = complexity.nodes_to_scscore(network.graph, network.substrate_nodes, nodes=nodes)
+            return 'complexity', lambda: complexity.scscore_attributes(to_score, self.sc_score_model)
+        return None
+
+    def add_complexity_changes(self, network, nodes=None):
+        """ The complexity scores worked out from the sc scores of neighbouring nodes """
+        if network.settings['calculate_complexities'] == True:
+            complexity.add_change_in_complexity(network.graph, nodes=nodes)
+            complexity.add_relative_complexity(network.graph, network.target_smiles, nodes=nodes)
+            complexity.add_reaction_relative_complexity(network.graph, network.target_smiles, nodes=nodes)
 
-    def add_enzymes(self, network):
+    def add_complexity_to_nodes(self, network, nodes):
+        """ Add only the sc score complexity, and only to nodes (eg when pruning end nodes) """
+        if network.settings['calculate_complexities'] == True:
+            complexity.add_scscore(network.graph, network.substrate_nodes, self.sc_score_model, nodes=nodes)
+
+    def add_enzymes(self, network, nodes=None):
         enzyme_map = self.enzyme_reaction_map
 
-        for node in network.reaction_nodes:
+        for node in self._reaction_nodes(network, nodes):
             if 'possible_enzymes' not in network.graph.nodes[node]['attributes']:
                 reaction = network.graph.nodes[node]['attributes']['name']
                 if reaction in enzyme_map:
@@ -57,29 +138,28 @@ class NetworkEvaluator():
 
         return network
 
-    def add_cofactors(self, network):
+    def add_cofactors(self, network, nodes=None):
         """
         Add a dict of enzymes and their cofactors to graph under as {Enz : ['Cofactor +', 'Cofactor -']}
         """
         self._log('- adding cofactors')
 
-        for node in list(network.graph):
-            if network.graph.nodes[node]['attributes']['node_type'] == 'reaction':
-                if 'enzyme_cofactors' not in network.graph.nodes[node]['attributes']:
-                    reaction_name = network.graph.nodes[node]['attributes']['name']
-                    if reaction_name in self.reactionEnzymeCofactorDict:
-                        enzyme_cofactors = self.reactionEnzymeCofactorDict[reaction_name]
-                    else:
-                        enzyme_cofactors = {}
+        for node in self._reaction_nodes(network, nodes):
+            if 'enzyme_cofactors' not in network.graph.nodes[node]['attributes']:
+                reaction_name = network.graph.nodes[node]['attributes']['name']
+                if reaction_name in self.reactionEnzymeCofactorDict:
+                    enzyme_cofactors = self.reactionEnzymeCofactorDict[reaction_name]
+                else:
+                    enzyme_cofactors = {}
 
-                    if len(list(enzyme_cofactors.keys())) > 0:
-                        network.graph.nodes[node]['attributes']['selected_enzyme'] = list(enzyme_cofactors.keys())[0]
+                if len(list(enzyme_cofactors.keys())) > 0:
+                    network.graph.nodes[node]['attributes']['selected_enzyme'] = list(enzyme_cofactors.keys())[0]
 
-                    network.graph.nodes[node]['attributes']['enzyme_cofactors'] = enzyme_cofactors
+                network.graph.nodes[node]['attributes']['enzyme_cofactors'] = enzyme_cofactors
 
-    def add_scores_is_enzyme(self, network):
+    def add_scores_is_enzyme(self, network, nodes=None):
         self._log('- is enzyme')
-        for node in network.reaction_nodes:
+        for node in self._reaction_nodes(network, nodes):
             if 'is_enzyme' not in network.graph.nodes[node]['attributes']:
                 reaction_name = network.graph.nodes[node]['attributes']['name']
                 if reaction_name in self.enzyme_reaction_map:
@@ -91,7 +171,14 @@ class NetworkEvaluator():
                 else:
                     network.graph.nodes[node]['attributes']['is_enzyme'] = 0
 
-    def add_scores_specificity(self, network):
+    def add_scores_specificity(self, network, nodes=None):
+        stage = self.specificity_stage(network, nodes=nodes)
+        if stage is not None:
+            merge_attributes(network.graph, stage[1]())
+        self.select_best_enzyme(network, nodes=nodes)
+
+    def specificity_stage(self, network, nodes=None):
+        """ The substrate specificity stage, as (name, function returning the attributes to merge), or None if it is off """
         def determine_subOne_subTwo(listSubstrateSmiles):
             subOne = None
             subTwo = None
@@ -102,49 +189,68 @@ class NetworkEvaluator():
                     subTwo = smi
             return subOne, subTwo
 
-        if network.settings['calculate_substrate_specificity'] == True:
-            self._log('- specificity scores')
+        if network.settings['calculate_substrate_specificity'] != True:
+            return None
+
+        self._log('- specificity scores')
 
-            only_active = network.settings["only_postitive_enzyme_data"]
-            sim_cuttoff = network.settings['similarity_score_threshold']
-            only_reviewed = network.settings['only_reviewed_activity_data']
+        only_active = network.settings["only_postitive_enzyme_data"]
+        sim_cuttoff = network.settings['similarity_score_threshold']
+        only_reviewed = network.settings['only_reviewed_activity_data']
 
-            for node in network.reaction_nodes:
-                if 'specificity_scores' not in network.graph.nodes[node]['attributes']:
-                    network.graph.nodes[node]['attributes']['specificity_scores'] = {}
-                    network.graph.nodes[node]['attributes']['enzyme_info'] = {}
+        to_score = []
+        for node in self._reaction_nodes(network, nodes):
+            if 'specificity_scores' not in network.graph.nodes[node]['attributes']:
+                possible_enzymes = network.graph.nodes[node]['attributes']['possible_enzymes']
+                reaction_name = network.graph.nodes[node]['attributes']['name']
 
-                    possible_enzymes = network.graph.nodes[node]['attributes']['possible_enzymes']
-                    reaction_name = network.graph.nodes[node]['attributes']['name']
+                product = list(network.graph.predecessors(node))[0]
+                subOne, subTwo = determine_subOne_subTwo(list(network.graph.successors(node)))
+                to_score.append((node, reaction_name, possible_enzymes, product, subOne, subTwo))
 
-                    product = list(network.graph.predecessors(node))[0]
-                    subOne, subTwo = determine_subOne_subTwo(list(network.graph.successors(node)))
+        def score_reactions():
+            updates = {}
+            for node, reaction_name, possible_enzymes, product, subOne, subTwo in to_score:
+                updates[node] = {'specificity_scores': {}, 'enzyme_info': {}}
+                for enz in possible_enzymes:
+                    score, info, = self.specficity_scorer.scoreReaction(reaction_name, enz, product, subOne, subTwo,
+                                                                       sim_cutoff=sim_cuttoff,
+                                                                       onlyActive=only_active,
+                                                                       only_reviewed=only_reviewed)
 
-                    for enz in possible_enzymes:
-                        score, info, = self.specficity_scorer.scoreReaction(reaction_name, enz, product, subOne, subTwo,
-                                                                           sim_cutoff=sim_cuttoff,
-                                                                           onlyActive=only_active,
-                                                                           only_reviewed=only_reviewed)
+                    updates[node]['specificity_scores'][enz] = score
+                    updates[node]['enzyme_info'][enz] = info
+            return updates
 
-                        network.graph.nodes[node]['attributes']['specificity_scores'][enz] = score
-                        network.graph.nodes[node]['attributes']['enzyme_info'][enz] = info
+        return 'specificity', score_reactions
 
-        self.select_best_enzyme(network)
+    def add_scores_substrate_availability(self, network, nodes=None):
+        stage = self.substrate_availability_stage(network, nodes=nodes)
+        if stage is not None:
+            merge_attributes(network.graph, stage[1]())
 
-    def add_scores_substrate_availability(self, network):
-        if network.settings['get_building_blocks'] == True:
+    def substrate_availability_stage(self, network, nodes=None):
+        """ The building block stage, as (name, function returning the attributes to merge), or None if it is off """
+        if network.settings['get_building_blocks'] != True:
+            return None
 
-            self._log('- substrate availability')
+        self._log('- substrate availability')
 
+        if nodes is None:
             substrate_nodes = node_analysis.get_substrate_nodes(network.graph)
+        else:
+            substrate_nodes = self._substrate_nodes(network, nodes)
+        to_eval = [node for node in substrate_nodes if 'is_starting_material' not in network.graph.nodes[node]['attributes']]
+
+        def eval_building_blocks():
+            return {node: {'is_starting_material': is_starting_material}
+                    for node, is_starting_material in zip(to_eval, self.buyable_scorer.eval_many(to_eval))}
 
-            for node in substrate_nodes:
-                if 'is_starting_material' not in network.graph.nodes[node]['attributes']:
-                    network.graph.nodes[node]['attributes']['is_starting_material'] = self.buyable_scorer.eval(node)
+        return 'substrate_availability', eval_building_blocks
 
-    def select_best_enzyme(self, network):
+    def select_best_enzyme(self, network, nodes=None):
         if network.settings['calculate_substrate_specificity'] == True:
-            for node in network.reaction_nodes:
+            for node in self._reaction_nodes(network, nodes):
                 current_enz = network.graph.nodes[node]['attributes']['selected_enzyme']
                 current_score = network.graph.nodes[node]['attributes']['specificity_scores'][current_enz]
                 current_score_neg = True
@@ -0,0 +1,50 @@
+"""
+Runs the independent scoring stages of NetworkEvaluator (building blocks, sc score and substrate specificity)
+at the same time on a thread pool, then merges the attributes they return into the graph.
+
+Stages are given plain lists of smiles and reactions taken from the graph beforehand, and return
+{node: {attribute: value}} rather than writing to the graph, so they never see each other's results.
+Their expensive parts are numpy - the sc score model, packed fingerprint tanimoto and the building block
+searchsorted - plus the odd mongo version check or shared score cache round trip, all of which release the GIL.
+Threads overlap these without the sc score model, fingerprints and activity index being copied into other processes.
+The caches the stages share (the score cache tiers) hold a lock around each use.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScoringScheduler():
+
+    def __init__(self, max_workers=3):
+        """ max_workers=True uses a thread per stage, and False or 1 runs the stages one after another """
+        self.max_workers = max_workers
+        self.stage_times = {}
+
+    def run(self, stages):
+        """
+        Run a list of (name, function) stages, returning the attribute updates of each in the same order.
+        The wall time of each stage is recorded in stage_times.
+        """
+        self.stage_times = {}
+
+        workers = len(stages) if self.max_workers is True else min(int(self.max_workers or 1), len(stages))
+        if workers <= 1:
+            return [self._timed(name, func) for name, func in stages]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._timed, name, func) for name, func in stages]
+            return [future.result() for future in futures]
+
+    def _timed(self, name, func):
+        t0 = time.perf_counter()
+        updates = func()
+        self.stage_times[name] = round(time.perf_counter() - t0, 4)
+        return updates
+
+
+def merge_attributes(graph, updates):
+    """ Merge {node: {attribute: value}} into the attributes of the graph nodes """
+    for node, attributes in updates.items():
+        if node in graph:
+            graph.nodes[node]['attributes'].update(attributes)
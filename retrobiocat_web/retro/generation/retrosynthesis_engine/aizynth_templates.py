@@ -0,0 +1,108 @@
+"""
+Templates for the AIZynthfinder policy.
+
+TemplateStore is a row indexed, memory mapped copy of uspto_templates.hdf5, so rows are read from disk
+as they are needed rather than loading every template into a pandas dataframe.
+Build it once with build_template_store().
+
+CompiledTemplateCache is an LRU cache of compiled rdchiralReactions keyed by template_code,
+as the same popular templates are predicted over and over again.
+"""
+
+import json
+import os
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from retrobiocat_web.retro.rdchiral.main import rdchiralReaction
+
+data_folder = str(Path(__file__).parents[3]) + '/retro/data/aizynthfinder'
+templates_hdf_path = data_folder + '/uspto_templates.hdf5'
+template_store_folder = data_folder + '/uspto_templates_store'
+
+
+def _to_python(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def build_template_store(hdf_path=templates_hdf_path, folder=template_store_folder):
+    """ Write the templates dataframe as one json row per template, with an array of row offsets """
+    import pandas as pd
+    templates = pd.read_hdf(hdf_path, "table")
+
+    os.makedirs(folder, exist_ok=True)
+    offsets = [0]
+    with open(f"{folder}/rows.bin", 'wb') as f:
+        for index, row in templates.iterrows():
+            row_dict = {str(key): _to_python(value) for key, value in row.items()}
+            encoded = json.dumps([_to_python(index), row_dict]).encode('utf-8')
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+    np.save(f"{folder}/offsets.npy", np.array(offsets, dtype=np.int64))
+    return folder
+
+
+class TemplateStore():
+
+    def __init__(self, folder=template_store_folder):
+        self.folder = folder
+        self.offsets = np.load(f"{folder}/offsets.npy", mmap_mode='r')
+        self.rows = np.memmap(f"{folder}/rows.bin", dtype=np.uint8, mode='r')
+
+    @staticmethod
+    def exists(folder=template_store_folder):
+        return os.path.exists(f"{folder}/offsets.npy") and os.path.exists(f"{folder}/rows.bin")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_row(self, i):
+        """ Returns (template_code, row dict) for row i """
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        template_code, row = json.loads(self.rows[start:end].tobytes().decode('utf-8'))
+        return template_code, row
+
+    def get_rows(self, list_i):
+        return [self.get_row(int(i)) for i in list_i]
+
+
+class CompiledTemplateCache():
+
+    def __init__(self, max_size=5000):
+        self.max_size = max_size
+        self.rxns = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_code, smarts):
+        """ Returns the compiled rdchiralReaction for template_code, compiling smarts on a miss """
+        if template_code in self.rxns:
+            self.hits += 1
+            self.rxns.move_to_end(template_code)
+            return self.rxns[template_code]
+
+        self.misses += 1
+        rxn = rdchiralReaction(smarts)
+        if self.max_size != 0:
+            self.rxns[template_code] = rxn
+            while len(self.rxns) > self.max_size:
+                self.rxns.popitem(last=False)
+        return rxn
+
+    def clear(self):
+        self.rxns.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.rxns)}
+
+
+if __name__ == '__main__':
+    import time
+    t0 = time.time()
+    build_template_store()
+    t1 = time.time()
+    print(f"Built template store in {round(t1-t0, 2)} seconds")
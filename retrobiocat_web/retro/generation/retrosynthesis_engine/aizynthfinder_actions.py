@@ -5,35 +5,41 @@ from rdkit.Chem import AllChem
 import numpy as np
 import pandas as pd
 import functools
-from tensorflow.keras.metrics import top_k_categorical_accuracy
-from tensorflow.keras.models import load_model
-import tensorflow
 import logging
 import os
 from pathlib import Path
-from retrobiocat_web.retro.rdchiral.main import rdchiralReaction
+from retrobiocat_web.retro.generation.retrosynthesis_engine import numpy_policy
+from retrobiocat_web.retro.generation.retrosynthesis_engine.aizynth_templates import TemplateStore, CompiledTemplateCache
+from retrobiocat_web.retro.generation.retrosynthesis_engine.policy_server import PolicyClient
 
 import warnings
 
 os.environ['KMP_DUPLICATE_LIB_OK']='True'
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
-top10_acc = functools.partial(top_k_categorical_accuracy, k=10)
-top10_acc.__name__ = "top10_acc"
+# tensorflow is only imported when the policy model is first loaded,
+# so importing this module (and so Network) doesn't load tensorflow unless add_chemical_step is used.
 
-top50_acc = functools.partial(top_k_categorical_accuracy, k=50)
-top50_acc.__name__ = "top50_acc"
+def get_custom_objects():
+    from tensorflow.keras.metrics import top_k_categorical_accuracy
 
-CUSTOM_OBJECTS = {"top10_acc": top10_acc, "top50_acc": top50_acc}
+    top10_acc = functools.partial(top_k_categorical_accuracy, k=10)
+    top10_acc.__name__ = "top10_acc"
 
-tf_logger = tensorflow.get_logger()
-tf_logger.setLevel(logging.WARNING)
-os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+    top50_acc = functools.partial(top_k_categorical_accuracy, k=50)
+    top50_acc.__name__ = "top50_acc"
+
+    return {"top10_acc": top10_acc, "top50_acc": top50_acc}
 
 data_folder = str(Path(__file__).parents[3]) + '/retro/data/aizynthfinder'
 
 class LocalKerasModel:
     def __init__(self, filename):
-        self.model = load_model(filename, custom_objects=CUSTOM_OBJECTS)
+        import tensorflow
+        from tensorflow.keras.models import load_model
+        tensorflow.get_logger().setLevel(logging.WARNING)
+
+        self.model = load_model(filename, custom_objects=get_custom_objects())
         try:
             self._model_dimensions = int(self.model.input.shape[1])
         except AttributeError:
@@ -53,29 +59,75 @@ class ActionApplier():
         self.cutoff_cumulative = 0.995
         self.cutoff_number = 50
         self.template_column = 'retro_template'
+        self.template_cache = CompiledTemplateCache(max_size=5000)
+        self.policy_client = None
+
+    def use_policy_server(self, socket_path, timeout=60):
+        """ Get actions from a policy server (see policy_server.py) rather than loading the model in this process """
+        self.policy_client = PolicyClient(socket_path, timeout=timeout)
+
+    def _get_actions_from_server(self, list_smiles):
+        """ Returns actions for list_smiles from the policy server, or None if there isn't one or it fails """
+        if self.policy_client is None:
+            return None
+        try:
+            return self.policy_client.get_actions_batch(list_smiles)
+        except Exception as e:
+            print(f"WARNING policy server at {self.policy_client.socket_path} failed, using local model - {e}")
+            return None
 
     def load_model(self):
         if self.policy_model == None:
-            policy_path = data_folder + '/uspto_model.hdf5'
-            self.policy_model = LocalKerasModel(policy_path)
-        if self.templates == None:
-            templates_path = data_folder + '/uspto_templates.hdf5'
-            self.templates = pd.read_hdf(templates_path, "table")
+            # use the numpy export of the policy if there is one, so tensorflow isn't needed
+            if os.path.exists(numpy_policy.numpy_model_path):
+                self.policy_model = numpy_policy.NumpyPolicyModel(numpy_policy.numpy_model_path)
+            else:
+                policy_path = data_folder + '/uspto_model.hdf5'
+                self.policy_model = LocalKerasModel(policy_path)
+        if self.templates is None:
+            # use the memory mapped template store if it has been built, rather than loading every template
+            if TemplateStore.exists():
+                self.templates = TemplateStore()
+            else:
+                templates_path = data_folder + '/uspto_templates.hdf5'
+                self.templates = pd.read_hdf(templates_path, "table")
 
     def get_actions(self, smi):
+        mol = Chem.MolFromSmiles(smi)
+        all_transforms_prop = self._predict(mol)
+        return self._actions_from_predictions(all_transforms_prop)
+
+    def get_actions_batch(self, list_smi):
+        """
+        get_actions for a list of smiles, with the policy run once on all of them.
+        Smiles rdkit can't parse get no actions, rather than failing the batch.
+        """
+        mols = [Chem.MolFromSmiles(smi) for smi in list_smi]
+        valid = [i for i, mol in enumerate(mols) if mol is not None]
+        for i, mol in enumerate(mols):
+            if mol is None:
+                print(f"WARNING could not parse {list_smi[i]} for the policy, no chemical steps will be applied to it")
+
+        actions = [[] for smi in list_smi]
+        if len(valid) == 0:
+            return actions
+
+        predictions = self._predict_batch([mols[i] for i in valid])
+        for i, row in zip(valid, predictions):
+            actions[i] = self._actions_from_predictions(row)
+        return actions
+
+    def _actions_from_predictions(self, all_transforms_prop):
         reactions = []
         priors = []
 
-        mol = Chem.MolFromSmiles(smi)
-
-        all_transforms_prop = self._predict(mol)
         probable_transforms_idx = self._cutoff_predictions(all_transforms_prop)
 
-        possible_moves = self.templates.iloc[probable_transforms_idx]
+        possible_moves = self._get_template_rows(probable_transforms_idx)
         probs = all_transforms_prop[probable_transforms_idx]
 
         priors.extend(probs)
-        for idx, (move_index, move) in enumerate(possible_moves.iterrows()):
+        for idx, (move_index, move) in enumerate(possible_moves):
             reaction = {}
             metadata = dict(move)
             del metadata[self.template_column]
@@ -90,11 +142,38 @@ class ActionApplier():
 
         return reactions
 
+    def _get_template_rows(self, idx):
+        """ Returns a list of (template_code, row) for template rows idx """
+        if isinstance(self.templates, TemplateStore):
+            return self.templates.get_rows(idx)
+        return list(self.templates.iloc[idx].iterrows())
+
     def get_rxns(self, smile):
+        served = self._get_actions_from_server([smile])
+        if served is not None:
+            return self._rxns_from_actions(served[0])
+
         if self.policy_model == None:
             self.load_model()
 
         reactions = self.get_actions(smile)
+        return self._rxns_from_actions(reactions)
+
+    def get_rxns_batch(self, list_smiles):
+        """ Returns a list of (rxns, metadata), one for each smiles, running the policy as a single batch """
+        if len(list_smiles) == 0:
+            return []
+
+        served = self._get_actions_from_server(list_smiles)
+        if served is not None:
+            return [self._rxns_from_actions(reactions) for reactions in served]
+
+        if self.policy_model == None:
+            self.load_model()
+
+        return [self._rxns_from_actions(reactions) for reactions in self.get_actions_batch(list_smiles)]
+
+    def _rxns_from_actions(self, reactions):
         rxns = {}
         metadata = {}
         for reaction in reactions:
@@ -105,7 +184,7 @@ class ActionApplier():
                 extra_string = f"_{num}"
                 num += 1
             name = name+extra_string
-            rxns[name] = [rdchiralReaction(reaction['smarts'])]
+            rxns[name] = [self.template_cache.get(reaction['metadata']['template_code'], reaction['smarts'])]
             metadata[name] = reaction['metadata']
         return rxns, metadata
 
@@ -114,6 +193,11 @@ class ActionApplier():
         fp_arr = fingerprint.reshape([1, len(self.policy_model)])
         return np.array(self.policy_model.predict(fp_arr)).flatten()
 
+    def _predict_batch(self, mols):
+        """ Stack the fingerprints of mols into one matrix, and predict with a single forward pass """
+        fp_matrix = np.vstack([self._get_fingerprint(mol, 2, nbits=len(self.policy_model)) for mol in mols])
+        return np.array(self.policy_model.predict(fp_matrix)).reshape(len(mols), -1)
+
     def _get_fingerprint(self, rd_mol, radius, nbits=None):
         """
         Returns the Morgan fingerprint of the molecule
@@ -134,7 +218,8 @@ class ActionApplier():
             * cumulative probability less than a threshold (cutoff_cumulative)
             * or at most N (cutoff_number)
         """
-        sortidx = np.argsort(predictions)[::-1]
+        # no more than cutoff_number are ever returned, so only the top cutoff_number need sorting
+        sortidx = numpy_policy.top_k(predictions, self.cutoff_number)
         cumsum = np.cumsum(predictions[sortidx])
         if any(cumsum >= self.cutoff_cumulative):
             maxidx = np.argmin(cumsum < self.cutoff_cumulative)
@@ -0,0 +1,227 @@
+"""
+Memoized single step expansions, shared across networks (and with a shared tier, across processes and users).
+
+Entries are the precursor dicts from RuleApplicator, {rxn_name: [[precursor smiles, ..], ..]},
+keyed by (smiles, rule set id, combine_enantiomers, clean_brackets, remove_simple).
+An in-process LRU tier sits in front of an optional shared tier, either redis or an sqlite file on disk.
+Both shared tiers evict the least recently used entries once they hold more than max_entries, in batches
+(down to EVICT_TO x max_entries) so eviction is rare rather than a cost on every set.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+EVICT_TO = 0.9
+
+
+class LRUTier():
+
+    def __init__(self, max_entries=5000):
+        """ Shared by every network in the process, which may be scored on other threads, so every use holds self.lock """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisTier():
+
+    def __init__(self, connection, max_entries=200000, prefix='expansion_cache'):
+        self.connection = connection
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.index_key = f"{prefix}:index"
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """ Returns {key: value} for the keys which are present, in one round trip """
+        if len(keys) == 0:
+            return {}
+        pipe = self.connection.pipeline()
+        pipe.mget([f"{self.prefix}:{key}" for key in keys])
+        # xx only refreshes the last used time of keys which are already in the index
+        pipe.zadd(self.index_key, {key: time.time() for key in keys}, xx=True)
+        values = pipe.execute()[0]
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        """ Set every {key: value} in one pipeline """
+        if len(values) == 0:
+            return
+        now = time.time()
+        pipe = self.connection.pipeline()
+        pipe.mset({f"{self.prefix}:{key}": json.dumps(value) for key, value in values.items()})
+        pipe.zadd(self.index_key, {key: now for key in values})
+        pipe.zcard(self.index_key)
+        self._evict_if_full(pipe.execute()[-1])
+
+    def _evict_if_full(self, num_entries):
+        if num_entries <= self.max_entries:
+            return
+        num_to_evict = num_entries - int(self.max_entries * EVICT_TO)
+        oldest = self.connection.zrange(self.index_key, 0, num_to_evict - 1)
+        if len(oldest) != 0:
+            pipe = self.connection.pipeline()
+            pipe.delete(*[f"{self.prefix}:{k.decode() if isinstance(k, bytes) else k}" for k in oldest])
+            pipe.zrem(self.index_key, *oldest)
+            pipe.execute()
+
+    def clear(self):
+        keys = self.connection.zrange(self.index_key, 0, -1)
+        if len(keys) != 0:
+            self.connection.delete(*[f"{self.prefix}:{k.decode() if isinstance(k, bytes) else k}" for k in keys])
+        self.connection.delete(self.index_key)
+
+
+class SQLiteTier():
+
+    def __init__(self, path, max_entries=200000):
+        """ The connection may be used from several threads (eg by the scoring stages), so every use holds self.lock """
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS EXPANSIONS (KEY TEXT PRIMARY KEY, VALUE TEXT, LAST_USED REAL);")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS LAST_USED_IDX ON EXPANSIONS (LAST_USED);")
+            self.conn.commit()
+            self.num_entries = self._count()
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM EXPANSIONS;").fetchone()[0]
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f"SELECT KEY, VALUE FROM EXPANSIONS WHERE KEY IN ({placeholders});", chunk).fetchall()
+                found.update({key: json.loads(value) for key, value in rows})
+            if len(found) != 0:
+                now = time.time()
+                self.conn.executemany("UPDATE EXPANSIONS SET LAST_USED=? WHERE KEY=?;", [(now, key) for key in found])
+                self.conn.commit()
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        """ Insert every {key: value} with one executemany and commit """
+        if len(values) == 0:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO EXPANSIONS (KEY, VALUE, LAST_USED) VALUES (?, ?, ?);",
+                                  [(key, json.dumps(value), now) for key, value in values.items()])
+            # a running count (an over estimate when a key is replaced, or other processes evict),
+            # only checked against the table once it passes max_entries
+            self.num_entries += len(values)
+            self._evict_if_full()
+            self.conn.commit()
+
+    def _evict_if_full(self):
+        if self.num_entries <= self.max_entries:
+            return
+        self.num_entries = self._count()
+        if self.num_entries > self.max_entries:
+            num_to_evict = self.num_entries - int(self.max_entries * EVICT_TO)
+            self.conn.execute("DELETE FROM EXPANSIONS WHERE KEY IN "
+                              "(SELECT KEY FROM EXPANSIONS ORDER BY LAST_USED ASC LIMIT ?);", (num_to_evict,))
+            self.num_entries -= num_to_evict
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM EXPANSIONS;")
+            self.conn.commit()
+            self.num_entries = 0
+
+
+class ExpansionCache():
+
+    def __init__(self, max_memory_entries=5000, print_log=False):
+        self.memory_tier = LRUTier(max_entries=max_memory_entries)
+        self.shared_tier = None
+        self.print_log = print_log
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(smiles, rule_set_id, combine_enantiomers, clean_brackets, remove_simple):
+        options = f"{int(bool(combine_enantiomers))}{int(bool(clean_brackets))}{int(bool(remove_simple))}"
+        return f"{rule_set_id}|{options}|{smiles}"
+
+    def get(self, key):
+        value = self.memory_tier.get(key)
+
+        if value is None and self.shared_tier is not None:
+            try:
+                value = self.shared_tier.get(key)
+            except Exception as e:
+                self._log(f"Expansion cache shared tier get failed - {e}")
+                value = None
+            if value is not None:
+                self.memory_tier.set(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.memory_tier.set(key, value)
+        if self.shared_tier is not None:
+            try:
+                self.shared_tier.set(key, value)
+            except Exception as e:
+                self._log(f"Expansion cache shared tier set failed - {e}")
+
+    def clear(self):
+        self.memory_tier.clear()
+        if self.shared_tier is not None:
+            self.shared_tier.clear()
+
+    def _log(self, msg):
+        if self.print_log == True:
+            print(msg)
+
+
+expansion_cache = ExpansionCache()
+
+def configure_redis(connection, max_entries=200000):
+    """ Share expansions between processes using redis """
+    expansion_cache.shared_tier = RedisTier(connection, max_entries=max_entries)
+
+def configure_disk(path, max_entries=200000):
+    """ Share expansions between processes using an sqlite file at path """
+    expansion_cache.shared_tier = SQLiteTier(path, max_entries=max_entries)
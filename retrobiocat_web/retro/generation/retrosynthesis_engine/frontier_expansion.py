@@ -0,0 +1,67 @@
+"""
+Parallel expansion of a frontier of molecules, using a process pool.
+
+Workers are forked, so they inherit the compiled rules from the parent rather than having them pickled.
+Applying rules has no side effects, so workers only return precursor dicts (with the rule prefilter counts
+for them), which the parent merges into the graph in frontier order - giving the same network as expanding
+one molecule at a time.
+"""
+
+import multiprocessing
+import os
+
+# Set in each worker process by init_worker
+worker_state = {}
+
+class SettingsOnlyNetwork():
+    """ Stands in for a Network in the worker processes, where only the settings are needed """
+
+    def __init__(self, settings):
+        self.settings = settings
+
+def init_worker(rule_applicator_class, rxns, settings):
+    worker_state['rule_applicator'] = rule_applicator_class(SettingsOnlyNetwork(settings))
+    worker_state['rxns'] = rxns
+
+def find_precursors_in_worker(smile):
+    """ Returns the precursor dict for smile, and the prefilter counts from applying rules to it """
+    rule_applicator = worker_state['rule_applicator']
+    rule_applicator.rule_index.reset_counts()
+    precursor_dict = rule_applicator.find_precursors(smile, worker_state['rxns'])
+    return precursor_dict, rule_applicator.rule_index.report()
+
+class FrontierPool():
+
+    def __init__(self, processes, rule_applicator, rxns, context):
+        """ A pool of forked workers, each holding a rule applicator and the rxns to apply """
+        self.processes = processes
+        self.pool = context.Pool(processes=processes,
+                                 initializer=init_worker,
+                                 initargs=(type(rule_applicator), rxns, dict(rule_applicator.network.settings)))
+
+    def find_precursors(self, list_smiles):
+        """ Returns a list of (precursor dict, prefilter counts), in the same order as list_smiles """
+        chunksize = max(1, len(list_smiles) // (self.processes * 4))
+        return self.pool.map(find_precursors_in_worker, list_smiles, chunksize=chunksize)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+def make_pool(processes, rule_applicator, rxns):
+    """
+    Returns a FrontierPool ready to apply rxns, or None if processes is not more than 1,
+    or fork is not available on this platform.  processes=True uses every core.
+    """
+    if processes is True:
+        processes = os.cpu_count()
+    if not processes or processes <= 1:
+        return None
+
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        print('WARNING fork is not available, frontier will be expanded in a single process')
+        return None
+
+    return FrontierPool(processes, rule_applicator, rxns, context)
@@ -0,0 +1,96 @@
+"""
+A numpy only version of the AIZynthfinder expansion policy (a fingerprint -> softmax MLP),
+in the same spirit as the standalone numpy SCScorer.  Weights are exported once from uspto_model.hdf5
+(which needs tensorflow), after which the policy runs without tensorflow.
+"""
+
+import numpy as np
+from pathlib import Path
+
+data_folder = str(Path(__file__).parents[3]) + '/retro/data/aizynthfinder'
+keras_model_path = data_folder + '/uspto_model.hdf5'
+numpy_model_path = data_folder + '/uspto_model.npz'
+
+def relu(x):
+    return np.maximum(x, 0)
+
+def elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=1, keepdims=True))
+    return e / np.sum(e, axis=1, keepdims=True)
+
+def linear(x):
+    return x
+
+ACTIVATIONS = {'relu': relu, 'elu': elu, 'sigmoid': sigmoid, 'tanh': np.tanh, 'softmax': softmax, 'linear': linear}
+
+def export_keras_weights(keras_path=keras_model_path, numpy_path=numpy_model_path):
+    """ Export the dense layers of the keras policy model to a compressed numpy archive """
+    from retrobiocat_web.retro.generation.retrosynthesis_engine.aizynthfinder_actions import LocalKerasModel
+    model = LocalKerasModel(keras_path).model
+
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        layer_type = type(layer).__name__
+        if layer_type in ['InputLayer', 'Dropout']:
+            continue
+        if layer_type != 'Dense':
+            raise ValueError(f'Can not export layer of type {layer_type} to numpy')
+
+        activation = layer.activation.__name__
+        if activation not in ACTIVATIONS:
+            raise ValueError(f'Can not export activation {activation} to numpy')
+
+        kernel, bias = layer.get_weights()
+        arrays[f"W{len(activations)}"] = kernel.astype(np.float32)
+        arrays[f"b{len(activations)}"] = bias.astype(np.float32)
+        activations.append(activation)
+
+    np.savez_compressed(numpy_path, activations=np.array(activations), **arrays)
+    return numpy_path
+
+
+class NumpyPolicyModel():
+
+    def __init__(self, filename=numpy_model_path):
+        with np.load(filename) as data:
+            self.activations = [str(a) for a in data['activations']]
+            self.weights = [data[f"W{i}"] for i in range(len(self.activations))]
+            self.biases = [data[f"b{i}"] for i in range(len(self.activations))]
+
+        self._model_dimensions = int(self.weights[0].shape[0])
+
+    def __len__(self):
+        return self._model_dimensions
+
+    def predict(self, input_):
+        x = np.asarray(input_, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+
+        for W, b, activation in zip(self.weights, self.biases, self.activations):
+            x = ACTIVATIONS[activation](np.matmul(x, W) + b)
+        return x
+
+def top_k(predictions, k):
+    """ Indices of the k largest predictions, largest first, without sorting every prediction """
+    k = min(k, len(predictions))
+    if k < len(predictions):
+        idx = np.argpartition(-predictions, k - 1)[:k]
+    else:
+        idx = np.arange(len(predictions))
+    return idx[np.argsort(-predictions[idx], kind='stable')]
+
+
+if __name__ == '__main__':
+    import time
+    t0 = time.time()
+    path = export_keras_weights()
+    t1 = time.time()
+    print(f"Exported policy weights to {path} in {round(t1-t0, 2)} seconds")
@@ -0,0 +1,218 @@
+"""
+A local policy server, so every web and worker process can share one copy of the AIZynthfinder policy and templates.
+
+The server listens on a unix socket.  Requests which arrive within batch_window seconds of each other
+are run through the policy as a single batch (up to max_batch molecules).
+Messages are length prefixed json - a request is {'smiles': [..]}, the reply {'actions': [..]}
+with a list of actions (see ActionApplier.get_actions) for each smiles, or {'error': msg}.
+
+Run with:  python -m retrobiocat_web.retro.generation.retrosynthesis_engine.policy_server /path/to/policy.sock
+and set AIZYNTH_POLICY_SOCKET to the same path so ActionApplier uses it.
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+
+HEADER = struct.Struct('!I')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Can not convert {type(value)} to json')
+
+def send_message(sock, message):
+    encoded = json.dumps(message, default=_json_default).encode('utf-8')
+    sock.sendall(HEADER.pack(len(encoded)) + encoded)
+
+def _recv_exactly(sock, num_bytes):
+    chunks = []
+    while num_bytes > 0:
+        chunk = sock.recv(min(num_bytes, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Policy server connection closed')
+        chunks.append(chunk)
+        num_bytes -= len(chunk)
+    return b''.join(chunks)
+
+def recv_message(sock):
+    length = HEADER.unpack(_recv_exactly(sock, HEADER.size))[0]
+    return json.loads(_recv_exactly(sock, length).decode('utf-8'))
+
+
+class PolicyRequest():
+
+    def __init__(self, list_smiles):
+        self.list_smiles = list_smiles
+        self.actions = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher():
+
+    def __init__(self, action_applier, batch_window=0.005, max_batch=64, print_log=False):
+        """ Collects requests for batch_window seconds, and runs them through the policy together """
+        self.action_applier = action_applier
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.print_log = print_log
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.action_applier.policy_model is None:
+            self.action_applier.load_model()
+        self.thread.start()
+
+    def submit(self, list_smiles):
+        request = PolicyRequest(list_smiles)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.actions
+
+    def _collect_batch(self):
+        batch = [self.requests.get()]
+        num_smiles = len(batch[0].list_smiles)
+        deadline = time.time() + self.batch_window
+        while num_smiles < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            num_smiles += len(request.list_smiles)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._run_batch(batch)
+            except Exception:
+                # eg one unparsable smiles - retry each request alone, so only the bad one gets the error
+                for request in batch:
+                    try:
+                        self._run_batch([request])
+                    except Exception as e:
+                        request.error = str(e)
+                        request.done.set()
+
+    def _run_batch(self, batch):
+        all_smiles = [smi for request in batch for smi in request.list_smiles]
+        all_actions = self.action_applier.get_actions_batch(all_smiles) if len(all_smiles) != 0 else []
+
+        self._log(f"Policy batch of {len(all_smiles)} molecules from {len(batch)} requests")
+        i = 0
+        for request in batch:
+            request.actions = all_actions[i:i + len(request.list_smiles)]
+            i += len(request.list_smiles)
+            request.done.set()
+
+    def _log(self, msg):
+        if self.print_log == True:
+            print(msg)
+
+
+class PolicyRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, struct.error):
+                return
+
+            try:
+                actions = self.server.batcher.submit(message['smiles'])
+                for reactions in actions:
+                    for reaction in reactions:
+                        reaction['prior'] = float(reaction['prior'])
+                send_message(self.request, {'actions': actions})
+            except Exception as e:
+                send_message(self.request, {'error': str(e)})
+
+
+class PolicyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, action_applier, batch_window=0.005, max_batch=64, print_log=False):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, PolicyRequestHandler)
+        self.batcher = MicroBatcher(action_applier, batch_window=batch_window, max_batch=max_batch, print_log=print_log)
+        self.batcher.start()
+
+
+class PolicyClient():
+
+    def __init__(self, socket_path, timeout=60):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def get_actions_batch(self, list_smiles):
+        with self.lock:
+            try:
+                return self._request(list_smiles)
+            except socket.timeout:
+                # the server is still working on this batch, so don't send it again -
+                # and drop the connection, or its late reply would be read as the reply to the next request
+                self.close()
+                raise
+            except ConnectionError:
+                # refused, reset or closed - the server may have restarted, so reconnect once
+                self.close()
+                return self._request(list_smiles)
+
+    def _request(self, list_smiles):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.socket_path)
+
+        send_message(self.sock, {'smiles': list(list_smiles)})
+        reply = recv_message(self.sock)
+        if 'error' in reply:
+            raise RuntimeError(f"Policy server error - {reply['error']}")
+        return reply['actions']
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+
+def serve(socket_path, batch_window=0.005, max_batch=64, print_log=True):
+    from retrobiocat_web.retro.generation.retrosynthesis_engine.aizynthfinder_actions import ActionApplier
+
+    server = PolicyServer(socket_path, ActionApplier(), batch_window=batch_window, max_batch=max_batch, print_log=print_log)
+    print(f"Policy server listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else (os.environ.get('AIZYNTH_POLICY_SOCKET') or '/tmp/retrobiocat_policy.sock')
+    serve(path)
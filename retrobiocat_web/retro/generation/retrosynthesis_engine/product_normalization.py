@@ -0,0 +1,89 @@
+"""
+Normalization of rdchiral outcomes into lists of canonical precursor smiles.
+
+Each outcome is parsed once, split into fragments from that mol, and each fragment canonicalized.
+Results are memoized - outcomes in an outcome table, and fragments in an intern table of canonical smiles -
+so outcomes which come up repeatedly (from many rules, or many molecules) are only parsed the first time.
+The products are the same as cleaning brackets, checking, splitting and canonicalizing one step at a time.
+"""
+
+from rdkit.Chem import AllChem, rdmolops
+from retrobiocat_web.retro.generation.node_analysis import rdkit_smile
+from retrobiocat_web.retro.rdchiral.clean import combine_enantiomers_into_racemic
+
+
+def stereo_stripped_key(smi):
+    """ Smiles which are the same apart from @/@@ or / and \\ share this key """
+    return smi.replace('@', '').replace('/', '').replace('\\', '')
+
+def combine_enantiomers(outcomes):
+    """
+    Same as combine_enantiomers_into_racemic, but only does the regex search when a pair of outcomes
+    share a stereo stripped key.  When every key is unique there are no enantiomers or cis/trans pairs
+    to combine, so outcomes are returned as they are.
+    """
+    keys = set()
+    for smi in outcomes:
+        key = stereo_stripped_key(smi)
+        if key in keys:
+            return combine_enantiomers_into_racemic(outcomes)
+        keys.add(key)
+    return outcomes
+
+
+class ProductNormalizer():
+
+    def __init__(self, bracket_cleaner, max_entries=100000):
+        self.bracket_cleaner = bracket_cleaner
+        self.max_entries = max_entries
+        self.outcome_table = {}
+        self.canonical_table = {}
+        self.num_parsed = 0
+
+    def normalize(self, smi, clean_brackets=True):
+        """ Returns the list of canonical product smiles for an outcome, or None if it is not valid """
+        key = (smi, clean_brackets)
+        if key in self.outcome_table:
+            products = self.outcome_table[key]
+            if products is None:
+                return None
+            return list(products)
+
+        products = self._normalize(smi, clean_brackets)
+
+        if len(self.outcome_table) >= self.max_entries:
+            self.outcome_table.clear()
+        self.outcome_table[key] = products
+
+        if products is None:
+            return None
+        return list(products)
+
+    def canonical(self, smi):
+        """ Returns the interned canonical smiles for smi """
+        if smi not in self.canonical_table:
+            if len(self.canonical_table) >= self.max_entries:
+                self.canonical_table.clear()
+            self.canonical_table[smi] = rdkit_smile(smi)
+        return self.canonical_table[smi]
+
+    def clear(self):
+        self.outcome_table.clear()
+        self.canonical_table.clear()
+
+    def _normalize(self, smi, clean_brackets):
+        if smi is None:
+            return None
+
+        if clean_brackets == True:
+            smi = self.bracket_cleaner.clean_brackets(smi)
+
+        mol = AllChem.MolFromSmiles(smi)
+        self.num_parsed += 1
+        if mol is None:
+            return None
+
+        products = []
+        for frag in rdmolops.GetMolFrags(mol, asMols=True):
+            products.append(self.canonical(AllChem.MolToSmiles(frag)))
+        return tuple(products)
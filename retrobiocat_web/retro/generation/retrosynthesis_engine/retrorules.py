@@ -135,8 +135,7 @@ class RetroRulesReactionSelector(ReactionSelector):
 
         for reaction in listReactions:
             if reaction not in to_keep:
-                self.network.graph.remove_node(reaction)
-                self.network.reaction_nodes.remove(reaction)
+                self.network.remove_node(reaction)
 
         return listProducts, to_keep
 
@@ -214,6 +213,8 @@ class RetroRulesGraphManipulator(GraphManipulator):
                                                          'retrorule' : True})
 
         graph.add_edge(source_smile, unique_reaction_name)
+        self._index_node(graph, unique_reaction_name)
+        self._index_edge(graph, source_smile, unique_reaction_name)
         return unique_reaction_name
 
 class RetroRulesRetrosynthesisEngine(RetrosynthesisEngine):
@@ -310,10 +311,9 @@ class RetroRules():
         smiles = node_analysis.rdkit_smile(smiles)
 
         listSmiles, listReactions = self.retrosynthesisEngine.single_step(smiles, self.retrorules_rxns, self.network.graph)
-        self.network.get_node_types()
 
         if calculate_scores == True:
-            self.network.evaluator.calculate_scores(self.network)
+            self.network.evaluator.calculate_scores(self.network, nodes=self.network.pop_changed_nodes())
 
         return listSmiles, listReactions
 
@@ -2,11 +2,19 @@ from rdkit.Chem import AllChem, rdmolops
 from rdkit import Chem
 from retrobiocat_web.retro.generation.node_analysis import rdkit_smile
 from retrobiocat_web.retro.generation import node_analysis
+from retrobiocat_web.retro.evaluation import complexity
 import uuid
+import heapq
+import itertools
+import time
 import networkx as nx
 from retrobiocat_web.retro.rdchiral.main import rdchiralReactants, rdchiralRun
-from retrobiocat_web.retro.rdchiral.clean import combine_enantiomers_into_racemic
+from retrobiocat_web.retro.generation.retrosynthesis_engine.product_normalization import ProductNormalizer, combine_enantiomers
 from retrobiocat_web.retro.generation.retrosynthesis_engine import aizynthfinder_actions
+from retrobiocat_web.retro.generation.retrosynthesis_engine.rule_prefilter import RuleApplicabilityIndex
+from retrobiocat_web.retro.generation.retrosynthesis_engine.expansion_cache import expansion_cache, ExpansionCache
+from retrobiocat_web.retro.generation.retrosynthesis_engine import frontier_expansion
+from retrobiocat_web.retro.generation.load.rxn_class import get_rule_set_id
 
 
 
@@ -78,7 +86,6 @@ class ReactionSelector():
             return listProducts, listReactions
 
         listProductsToKeep = listProducts
-        self.network.get_node_types()
         for product in listProducts:
             if product in disallowedProducts:
                 for reaction in list(self.network.graph.predecessors(product)):
@@ -93,7 +100,6 @@ class ReactionSelector():
         if (len(listReactions) < max_reactions) or (max_reactions == False):
             return listProducts, listReactions
 
-        self.network.get_node_types()
         self.network.evaluator.add_scores_complexity(self.network)
         changes_in_complexity = []
         for reaction in listReactions:
@@ -138,17 +144,80 @@ class RuleApplicator():
         self.network = network
         self.small_precursors = ['N', 'O', 'O=O', 'H+', '[H+]']
         self.bracket_cleaner = BracketCleaner()
+        self.product_normalizer = ProductNormalizer(self.bracket_cleaner)
+        self.rule_index = RuleApplicabilityIndex()
+        self.use_prefilter = True
+
+    def run(self, smile, rxns, graph, explicit_hydrogens=False, precursor_dict=None):
+        if precursor_dict is None:
+            precursor_dict = self.get_precursors(smile, rxns)
 
-    def run(self, smile, rxns, graph, explicit_hydrogens=False):
-        precursor_dict = self.apply_rules(smile, rxns)
         precursor_dict = self._remove_precursors_already_in_graph(graph, smile, precursor_dict)
 
+        return precursor_dict
+
+    def get_precursors(self, smile, rxns):
+        """ Returns the precursor dict for smile, from the expansion cache where possible """
+        cache_key = self._expansion_cache_key(smile, rxns)
+        precursor_dict = None
+        if cache_key is not None:
+            precursor_dict = expansion_cache.get(cache_key)
+
+        if precursor_dict is None:
+            precursor_dict = self.find_precursors(smile, rxns)
+            if cache_key is not None:
+                expansion_cache.set(cache_key, precursor_dict)
+
+        return precursor_dict
+
+    def get_precursors_for_frontier(self, list_smiles, rxns, frontier_pool):
+        """ Returns {smiles: precursor_dict} for list_smiles, applying rules to any not in the cache in parallel """
+        precursor_dicts = {}
+        to_expand = []
+        for smile in dict.fromkeys(list_smiles):
+            cache_key = self._expansion_cache_key(smile, rxns)
+            cached = None
+            if cache_key is not None:
+                cached = expansion_cache.get(cache_key)
+            if cached is None:
+                to_expand.append(smile)
+            else:
+                precursor_dicts[smile] = cached
+
+        if len(to_expand) != 0:
+            for smile, (precursor_dict, counts) in zip(to_expand, frontier_pool.find_precursors(to_expand)):
+                self.rule_index.add_counts(counts)
+                precursor_dicts[smile] = precursor_dict
+                cache_key = self._expansion_cache_key(smile, rxns)
+                if cache_key is not None:
+                    expansion_cache.set(cache_key, precursor_dict)
+
+        return precursor_dicts
+
+    def find_precursors(self, smile, rxns):
+        """ Applies rxns to smile, returning the precursor dict without reference to any graph """
+        precursor_dict = self.apply_rules(smile, rxns)
+
         if self.network.settings['remove_simple'] == True:
             for name in precursor_dict:
                 precursor_dict[name] = self._remove_simple_precursors(precursor_dict[name])
 
         return precursor_dict
 
+    def _expansion_cache_key(self, smile, rxns):
+        """ Returns the expansion cache key, or None if these rxns are not a cached rule set (eg rules being tested) """
+        if self.network.settings.get('use_expansion_cache', True) == False:
+            return None
+
+        rule_set_id = get_rule_set_id(rxns)
+        if rule_set_id is None:
+            return None
+
+        return ExpansionCache.make_key(smile, rule_set_id,
+                                       self.network.settings['combine_enantiomers'],
+                                       self.network.settings['clean_brackets'],
+                                       self.network.settings['remove_simple'])
+
     def _split_products(self, smi):
         mol = AllChem.MolFromSmiles(smi)
         splitMols = rdmolops.GetMolFrags(mol, asMols=True)
@@ -174,10 +243,16 @@ class RuleApplicator():
 
         reactants = rdchiralReactants(smile)
 
+        features = None
+        if self._should_prefilter() == True:
+            features = self.rule_index.get_features(smile)
+
         rxn_product_dict = {}
         for rxn_name, rxn_list in rxns.items():
             reaction_products = []
             for rxn in rxn_list:
+                if self.rule_index.is_candidate(rxn, features) == False:
+                    continue
                 try:
                     reaction_products.extend(rdchiralRun(rxn, reactants, combine_enantiomers=False))
 
@@ -186,21 +261,17 @@ class RuleApplicator():
                     print('Error running reactants for: ' + str(smile) + ' ' + str(rxn_name))
 
             if self.network == None:
-                reaction_products_combined = list(combine_enantiomers_into_racemic(set(reaction_products)))
+                reaction_products_combined = list(combine_enantiomers(set(reaction_products)))
                 reaction_products = list(set(reaction_products_combined + reaction_products))
             elif self.network.settings["combine_enantiomers"] == True:
-                reaction_products = combine_enantiomers_into_racemic(set(reaction_products))
+                reaction_products = combine_enantiomers(set(reaction_products))
+
+            clean_brackets = self.network == None or self.network.settings["clean_brackets"] == True
 
             parsed_reaction_products = []
             for smi in reaction_products:
-                if self.network == None:
-                    smi = self.bracket_cleaner.clean_brackets(smi)
-                elif self.network.settings["clean_brackets"] == True:
-                    smi = self.bracket_cleaner.clean_brackets(smi)
-
-                if self._check_valid_smile(smi, rxn_name=rxn_name) == True:
-                    products = self._split_products(smi)
-                    products = self._rdkit_products(products)
+                products = self.product_normalizer.normalize(smi, clean_brackets=clean_brackets)
+                if products is not None:
                     parsed_reaction_products.append(products)
 
             if len(parsed_reaction_products) != 0:
@@ -208,6 +279,13 @@ class RuleApplicator():
 
         return rxn_product_dict
 
+    def _should_prefilter(self):
+        if self.use_prefilter == False:
+            return False
+        if self.network == None:
+            return True
+        return self.network.settings.get('prefilter_rules', True)
+
     def apply_rules_rdkit(self, smile, rxns):
 
         mol = Chem.MolFromSmiles(smile)
@@ -287,6 +365,7 @@ class GraphManipulator():
 
         if 'node_type' not in graph.nodes[p_smile]['attributes']:
             graph.nodes[p_smile]['attributes']['node_type'] = 'substrate'
+            self._index_node(graph, p_smile)
 
         reaction_node = self._add_reaction_node_to_graph(graph, reaction_name, p_smile, 'custom', {})
 
@@ -302,6 +381,8 @@ class GraphManipulator():
                                                  'node_num': self._get_node_number(s_smiles, graph),
                                                  'substrate_num': i + 1})
             graph.add_edge(reaction_node, s_smiles)
+            self._index_node(graph, s_smiles)
+            self._index_edge(graph, reaction_node, s_smiles)
 
         return list_s_smiles, [reaction_node]
 
@@ -329,6 +410,8 @@ class GraphManipulator():
                                                          'metadata': metadata.get(reaction_name, {}),
                                                          'node_num': self._get_node_number(unique_reaction_name, graph)})
         graph.add_edge(source_smile, unique_reaction_name)
+        self._index_node(graph, unique_reaction_name)
+        self._index_edge(graph, source_smile, unique_reaction_name)
         return unique_reaction_name
 
     def _add_substrate_node_to_graph(self, graph, substrate_names, source_reaction):
@@ -339,14 +422,24 @@ class GraphManipulator():
                                                   'node_num': self._get_node_number(precursor, graph),
                                                   'substrate_num': i + 1})
             graph.add_edge(source_reaction, precursor)
+            self._index_node(graph, precursor)
+            self._index_edge(graph, source_reaction, precursor)
             products.append(precursor)
         return products
 
+    def _index_node(self, graph, node):
+        if self.network is not None and graph is self.network.graph:
+            self.network.index_node(node)
+
+    def _index_edge(self, graph, source, target):
+        if self.network is not None and graph is self.network.graph:
+            self.network.index_edge(source, target)
+
     def _get_node_number(self, node, graph):
-        if node in list(graph.nodes()):
+        if node in graph:
             return graph.nodes[node]['attributes']['node_num']
         else:
-            return len(list(graph.nodes())) + 1
+            return len(graph) + 1
 
     def _check_if_reaction_goes_backwards(self, graph, reactionProducts, targetSmi):
         are_predecessor = node_analysis.check_substrates_nx_predecessor(graph, reactionProducts, targetSmi)
@@ -360,6 +453,18 @@ class GraphManipulator():
                 return True
         return False
 
+class PruneHeapEntry():
+    """ Pops the most complex node first, breaking ties as node_analysis.sort_by_score(reverse=True) does """
+
+    __slots__ = ('complexity', 'node')
+
+    def __init__(self, complexity, node):
+        self.complexity = complexity
+        self.node = node
+
+    def __lt__(self, other):
+        return (self.complexity, self.node) > (other.complexity, other.node)
+
 class GraphPruner():
 
     def __init__(self, print_log=False):
@@ -393,22 +498,15 @@ class GraphPruner():
             return []
 
         to_delete = [node_to_remove]
-        network.graph.remove_node(node_to_remove)
-        network.reaction_nodes.remove(node_to_remove)
-
-        # if any node is now not connected to the target, delete also
-        connected_nodes = list(nx.dfs_preorder_nodes(network.graph, source=network.target_smiles))
-
-        while len(connected_nodes) != len(list(network.graph.nodes)):
-            for node in list(network.graph.nodes):
-                if node not in connected_nodes:
-                    to_delete.append(node)
-                    network.graph.remove_node(node)
-                    if node in network.reaction_nodes:
-                        network.reaction_nodes.remove(node)
-                    if node in network.substrate_nodes:
-                        network.substrate_nodes.remove(node)
-            connected_nodes = list(nx.dfs_preorder_nodes(network.graph, source=network.target_smiles))
+        network.remove_node(node_to_remove)
+
+        # any node which is now not connected to the target is deleted also.
+        # removing unconnected nodes can't disconnect any others, so one search from the target is enough
+        connected_nodes = set(nx.dfs_preorder_nodes(network.graph, source=network.target_smiles))
+        for node in list(network.graph.nodes):
+            if node not in connected_nodes:
+                to_delete.append(node)
+                network.remove_node(node)
 
         return to_delete
 
@@ -425,13 +523,11 @@ class GraphPruner():
 
         to_delete = [node_to_remove]
 
-        network.graph.remove_node(node_to_remove)
-        network.reaction_nodes.remove(node_to_remove)
+        network.remove_node(node_to_remove)
 
         for node in substrate_successors:
             if len(list(network.graph.predecessors(node))) == 0:
-                network.graph.remove_node(node)
-                network.substrate_nodes.remove(node)
+                network.remove_node(node)
                 to_delete.append(node)
 
         return to_delete
@@ -482,6 +578,9 @@ class GraphPruner():
 
     def _run_prune(self, network, steps=5, on_substrates=True):
         self._log('Prune network')
+        if on_substrates == True:
+            return self._run_prune_on_substrates(network, steps)
+
         network.evaluator.add_scores_complexity(network)
         nodes_removed = []
         self._log('- delete nodes')
@@ -489,17 +588,70 @@ class GraphPruner():
             to_remove = self._get_nodes_to_prune(network.graph, steps, on_substrates=on_substrates)
 
             for node in to_remove:
-                if node in list(network.graph.nodes()):
+                if node in network.graph:
+                    deleted_nodes = self.delete_terminal_reaction_node(network, node)
+                    nodes_removed.extend(deleted_nodes)
+                    if len(network.substrate_nodes) >= network.settings['max_nodes']:
+                        break
+                else:
+                    print('Node not present - could not delete - ' + str(node))
+
+        return nodes_removed
+
+    def _run_prune_on_substrates(self, network, steps):
+        """
+        Delete the terminal reactions of the most complex end nodes until there are fewer than max_nodes substrates.
+
+        End nodes are kept in a heap ordered by complexity, so each round only pops the nodes it looks at,
+        and only the end nodes made by a deletion need scoring and pushing.
+        Rounds take end nodes in the same order as sorting every end node by complexity would.
+        """
+        graph = network.graph
+        network.evaluator.add_complexity_to_nodes(network, network.end_nodes)
+
+        heap = []
+        for node in network.end_nodes:
+            self._push_end_node(heap, graph, node)
+
+        nodes_removed = []
+        self._log('- delete nodes')
+        while len(network.substrate_nodes) >= network.settings['max_nodes']:
+            popped, to_remove = [], []
+            while len(to_remove) < steps:
+                if len(heap) == 0:
+                    self._log('No more terminal reactions to prune')
+                    return nodes_removed
+                node = heapq.heappop(heap).node
+                if node not in network.end_nodes or node in popped:
+                    continue
+                popped.append(node)
+                to_remove.extend(list(graph.predecessors(node)))
+                to_remove = self._check_other_substrates_of_end_node_reactions(graph, to_remove)
+
+            new_end_nodes = []
+            for node in to_remove:
+                if node in graph:
+                    products = list(graph.predecessors(node))
                     deleted_nodes = self.delete_terminal_reaction_node(network, node)
                     nodes_removed.extend(deleted_nodes)
+                    new_end_nodes.extend([product for product in products if product in network.end_nodes])
                     if len(network.substrate_nodes) >= network.settings['max_nodes']:
                         break
                 else:
                     print('Node not present - could not delete - ' + str(node))
-            network.get_node_types()
+
+            network.evaluator.add_complexity_to_nodes(network, new_end_nodes)
+            for node in popped + new_end_nodes:
+                if node in network.end_nodes:
+                    self._push_end_node(heap, graph, node)
 
         return nodes_removed
 
+    @staticmethod
+    def _push_end_node(heap, graph, node):
+        complexity = graph.nodes[node]['attributes'].get('complexity', 0)
+        heapq.heappush(heap, PruneHeapEntry(complexity, node))
+
     def _log(self, msg):
         if self.print_log == True:
             print(msg)
@@ -510,8 +662,13 @@ class AIZynthfinder_RuleApplicator(RuleApplicator):
         super().__init__(network)
         self.action_applier = aizynthfinder_actions.aizynth_action_applier
 
-    def run(self, smile, graph):
-        rxns, metadata = self.action_applier.get_rxns(smile)
+        # policy templates are already selected for this molecule, and are compiled fresh each call
+        self.use_prefilter = False
+
+    def run(self, smile, graph, rxns_metadata=None):
+        if rxns_metadata is None:
+            rxns_metadata = self.action_applier.get_rxns(smile)
+        rxns, metadata = rxns_metadata
 
         precursor_dict = self.apply_rules(smile, rxns)
         precursor_dict = self._remove_precursors_already_in_graph(graph, smile, precursor_dict)
@@ -532,31 +689,29 @@ class RetrosynthesisEngine():
         self.graphPruner = GraphPruner()
         self.aizynth_rule_application = AIZynthfinder_RuleApplicator(network)
 
-    def single_step(self, smile, rxns, graph, disallowedProducts=[]):
+    def single_step(self, smile, rxns, graph, disallowedProducts=[], precursor_dict=None):
         rxn_type = 'retrobiocat'
         rxn_mode = self.network.settings.get('retrobiocat_reaction_mode', 'complexity')
 
         if self._should_rules_be_applied(smile, graph) == False:
             return [],[]
 
-        rxnsSubstratesDict = self.ruleApplication.run(smile, rxns, graph)
+        rxnsSubstratesDict = self.ruleApplication.run(smile, rxns, graph, precursor_dict=precursor_dict)
         listProducts, listReactions = self.graphManipulator.add_nodes_to_graph(rxnsSubstratesDict, smile, graph, rxn_type)
-        self.network.get_node_types()
         listProducts, listReactions = self.reactionSelector.remove_disallowed_products(disallowedProducts, listProducts, listReactions)
         if rxn_mode == 'complexity':
             listProducts, listReactions = self.reactionSelector.select_best_by_complexity(listProducts, listReactions, self.network.settings['max_reactions'])
         return listProducts, listReactions
 
-    def single_aizynth_step(self, smile, graph, disallowedProducts=[]):
+    def single_aizynth_step(self, smile, graph, disallowedProducts=[], rxns_metadata=None):
         rxn_type = 'aizynth'
         rxn_mode = self.network.settings.get('aizynth_reaction_mode', 'complexity')
 
         if self._should_rules_be_applied(smile, graph) == False:
             return [],[]
 
-        rxnsSubstratesDict, metadata = self.aizynth_rule_application.run(smile, graph)
+        rxnsSubstratesDict, metadata = self.aizynth_rule_application.run(smile, graph, rxns_metadata=rxns_metadata)
         listProducts, listReactions = self.graphManipulator.add_nodes_to_graph(rxnsSubstratesDict, smile, graph, rxn_type, metadata=metadata)
-        self.network.get_node_types()
         listProducts, listReactions = self.reactionSelector.remove_disallowed_products(disallowedProducts, listProducts, listReactions)
 
         if rxn_mode == 'complexity':
@@ -569,21 +724,132 @@ class RetrosynthesisEngine():
                                                                                               self.network.settings['max_reactions'])
         return listProducts, listReactions
 
+    def aizynth_frontier_step(self, list_smiles, graph, disallowedProducts=[]):
+        """ Apply chemical steps to every molecule in list_smiles, predicting templates for them all in one batch """
+        frontier = [smi for smi in dict.fromkeys(list_smiles) if smi in graph]
+        batch = self.aizynth_rule_application.action_applier.get_rxns_batch(frontier)
+        rxns_metadata = dict(zip(frontier, batch))
+
+        listProducts, listReactions = [], []
+        for smi in list_smiles:
+            newProducts, newReactions = self.single_aizynth_step(smi, graph, disallowedProducts=disallowedProducts,
+                                                                 rxns_metadata=rxns_metadata.get(smi))
+            listProducts.extend(newProducts)
+            listReactions.extend(newReactions)
+        return listProducts, listReactions
+
     def generate_network(self, target_smile, number_steps, rxns, graph, disallowedProducts=[]):
+        if self.network.settings.get('expansion_mode', 'breadth_first') == 'best_first':
+            return self.generate_network_best_first(target_smile, number_steps, rxns, graph, disallowedProducts=disallowedProducts)
+        if self.network.settings.get('expansion_mode', 'breadth_first') == 'chemical':
+            return self.generate_chemical_network(target_smile, number_steps, graph, disallowedProducts=disallowedProducts)
+
+        self.ruleApplication.rule_index.reset_counts()
+        frontier_pool = frontier_expansion.make_pool(self.network.settings.get('parallel_processes', False),
+                                                     self.ruleApplication, rxns)
+        try:
+            listSmiles = [target_smile]
+            for i in range(number_steps):
+                precursor_dicts = {}
+                if frontier_pool is not None and len(listSmiles) >= self.network.settings.get('parallel_min_frontier', 8):
+                    # only molecules single_step will expand, so workers don't apply rules to the rest
+                    frontier = [smi for smi in dict.fromkeys(listSmiles)
+                                if smi in graph and self._should_rules_be_applied(smi, graph) == True]
+                    precursor_dicts = self.ruleApplication.get_precursors_for_frontier(frontier, rxns, frontier_pool)
+
+                newListSmiles, newListReactions = [], []
+                for smi in listSmiles:
+                    newSmiles, newReactions = self.single_step(smi, rxns, graph, disallowedProducts=disallowedProducts,
+                                                               precursor_dict=precursor_dicts.get(smi))
+                    newListSmiles.extend(newSmiles)
+                    newListReactions.extend(newReactions)
+
+                self._log('-- Step ' + str(i + 1) + ' --')
+                self._log(str(len(newListReactions)) + ' reactions added, ' + str(len(self.network.substrate_nodes)) + ' substrate nodes')
+                self._log(f"{self.ruleApplication.rule_index.num_skipped} of {self.ruleApplication.rule_index.num_screened} rule applications skipped by prefilter")
+
+                listSmiles = self.graphPruner.prune(self.network, newListSmiles)
+        finally:
+            if frontier_pool is not None:
+                frontier_pool.close()
+
+    def generate_network_best_first(self, target_smile, number_steps, rxns, graph, disallowedProducts=[]):
+        """
+        Expand the most promising molecules first, rather than every molecule at each step.
+
+        Molecules are taken from a priority queue ordered by 'best_first_priority' -
+        'complexity' expands the molecules with the lowest SCScore first,
+        'change_in_complexity' expands the precursors of the reactions which most reduce complexity first.
+        Building blocks are not expanded, so expansion stops once every open branch has reached one,
+        or there is nothing left within number_steps, or max_nodes or 'time_budget' (seconds) is reached.
+        """
+        t0 = time.time()
+        priority = self.network.settings.get('best_first_priority', 'complexity')
+        time_budget = self.network.settings.get('time_budget', False)
+        max_nodes = self.network.settings['max_nodes']
+
+        # ties are expanded in the order they were found
+        order = itertools.count()
+        queue = [(0, next(order), 0, target_smile)]
+        expanded = set()
+
+        while len(queue) != 0:
+            if (time_budget != False) and (time.time() - t0 > time_budget):
+                self._log(f'Time budget of {time_budget} seconds reached')
+                break
+            if (max_nodes != False) and (len(self.network.substrate_nodes) >= max_nodes):
+                self._log(f'Node budget of {max_nodes} reached')
+                break
+
+            score, _, depth, smi = heapq.heappop(queue)
+            if (smi in expanded) or (smi not in graph):
+                continue
+            expanded.add(smi)
+
+            newSmiles, newReactions = self.single_step(smi, rxns, graph, disallowedProducts=disallowedProducts)
+            if depth + 1 >= number_steps:
+                continue
+
+            self.network.evaluator.add_complexity_to_nodes(self.network, [smi] + newSmiles)
+            for reaction in newReactions:
+                if reaction not in graph:
+                    continue
+                precursors = list(graph.successors(reaction))
+                for precursor in precursors:
+                    if (precursor in expanded) or self._is_building_block(precursor, graph):
+                        continue
+                    if priority == 'change_in_complexity':
+                        change = complexity.max_complexity(graph, [smi]) - complexity.max_complexity(graph, precursors)
+                        score = -change
+                    else:
+                        score = graph.nodes[precursor]['attributes'].get('complexity', 0)
+                    heapq.heappush(queue, (score, next(order), depth + 1, precursor))
+
+        self._log(f'{len(expanded)} molecules expanded best first in {round(time.time() - t0, 2)} seconds')
+
+        if (max_nodes != False) and (len(self.network.substrate_nodes) > max_nodes):
+            self.graphPruner.prune(self.network, [])
+
+    def generate_chemical_network(self, target_smile, number_steps, graph, disallowedProducts=[]):
+        """ Breadth first expansion with chemical (AIZynthfinder) steps, predicting each level as one batch """
         listSmiles = [target_smile]
         for i in range(number_steps):
-            newListSmiles, newListReactions = [], []
-            for smi in listSmiles:
-                newSmiles, newReactions = self.single_step(smi, rxns, graph, disallowedProducts=disallowedProducts)
-                newListSmiles.extend(newSmiles)
-                newListReactions.extend(newReactions)
-
-            self.network.get_node_types()
-            self._log('-- Step ' + str(i + 1) + ' --')
+            newListSmiles, newListReactions = self.aizynth_frontier_step(listSmiles, graph, disallowedProducts=disallowedProducts)
+
+            self._log('-- Chemical step ' + str(i + 1) + ' --')
             self._log(str(len(newListReactions)) + ' reactions added, ' + str(len(self.network.substrate_nodes)) + ' substrate nodes')
 
             listSmiles = self.graphPruner.prune(self.network, newListSmiles)
 
+    def _is_building_block(self, smi, graph):
+        if self.network.settings['get_building_blocks'] == False:
+            return False
+
+        attributes = graph.nodes[smi]['attributes']
+        if 'is_starting_material' not in attributes:
+            attributes['is_starting_material'] = self.network.evaluator.buyable_scorer.eval(smi)
+        return attributes['is_starting_material'] == 1
+
     def custom_reaction(self, graph, product_smiles, substrate_smiles, reaction_name):
         listSmiles, listReactions = self.graphManipulator.add_custom_reaction(graph, product_smiles, substrate_smiles, reaction_name)
         return listSmiles, listReactions
@@ -591,12 +857,13 @@ class RetrosynthesisEngine():
     def _should_rules_be_applied(self, smile, graph):
         def check_target_is_present_and_substrate(smi, graph):
             """ Returns true is the provided smiles is in the graph as a substrate"""
-            if smi not in list(graph.nodes):
+            if smi not in graph:
                 print('WARNING SMILE NOT IN GRAPH ' + str(smi))
                 return False
             if graph.nodes[smi]['attributes']['node_type'] != 'substrate':
                 print('Warning - target SMILES was not a substrate')
                 graph.nodes[smi]['attributes']['node_type'] = 'substrate'
+                self.graphManipulator._index_node(graph, smi)
             return True
 
         def are_substrates_already_in_graph(smi, graph):
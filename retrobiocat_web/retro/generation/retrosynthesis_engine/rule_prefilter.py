@@ -0,0 +1,133 @@
+"""
+A screening index over the reactant templates of rdchiral reactions.
+
+Each rule gets a screen of features its reactant template (template_r) requires - element counts,
+ring or aromatic atoms, and a substructure pattern fingerprint.  A molecule which is missing any of these
+can not match the template, so the rule can be skipped without running rdchiral.
+Screens are only built from query features which are certain, so a rule is never skipped when it could match.
+"""
+
+from collections import Counter
+from rdkit import Chem, DataStructs
+
+
+class RuleScreen():
+
+    def __init__(self, template_r):
+        self.element_counts = Counter()
+        self.requires_ring = False
+        self.requires_aromatic = False
+
+        for atom in template_r.GetAtoms():
+            description = self._describe(atom)
+            if self._is_certain(description) == False:
+                continue
+            if ('AtomAtomicNum' in description or 'AtomType' in description) and atom.GetAtomicNum() > 1:
+                self.element_counts[atom.GetAtomicNum()] += 1
+            if 'AtomInRing' in description:
+                self.requires_ring = True
+            if atom.GetIsAromatic() or 'AtomIsAromatic' in description:
+                self.requires_aromatic = True
+
+        for bond in template_r.GetBonds():
+            description = self._describe(bond)
+            if self._is_certain(description) and 'BondInRing' in description:
+                self.requires_ring = True
+
+        self.pattern_fp = Chem.PatternFingerprint(template_r)
+
+    def passes(self, features):
+        """ Returns False if the molecule described by features can not match this template """
+        for atomic_num, count in self.element_counts.items():
+            if features.element_counts[atomic_num] < count:
+                return False
+        if self.requires_ring == True and features.num_rings == 0:
+            return False
+        if self.requires_aromatic == True and features.num_aromatic == 0:
+            return False
+        if not DataStructs.AllProbeBitsMatch(self.pattern_fp, features.pattern_fp):
+            return False
+        return True
+
+    @staticmethod
+    def _describe(atom_or_bond):
+        if atom_or_bond.HasQuery():
+            return atom_or_bond.DescribeQuery()
+        return ''
+
+    @staticmethod
+    def _is_certain(description):
+        """ Query features under an OR or a negation are not certain requirements """
+        if description == '':
+            return False
+        for token in ['Or', 'Not', '!=', 'Recursive']:
+            if token in description:
+                return False
+        return True
+
+
+class MoleculeFeatures():
+
+    def __init__(self, mol):
+        self.element_counts = Counter(atom.GetAtomicNum() for atom in mol.GetAtoms())
+        self.num_rings = mol.GetRingInfo().NumRings()
+        self.num_aromatic = sum(1 for atom in mol.GetAtoms() if atom.GetIsAromatic())
+        self.pattern_fp = Chem.PatternFingerprint(mol)
+
+
+class RuleApplicabilityIndex():
+
+    def __init__(self, print_log=False):
+        """
+        Screens molecules against rules before they are run with rdchiral.
+        Screens are stored on the rdchiralReaction objects, so are built once per process for cached rule sets.
+
+        num_screened and num_skipped count the rules checked and the rules skipped since the last reset_counts()
+        """
+        self.print_log = print_log
+        self.num_screened = 0
+        self.num_skipped = 0
+
+    def get_features(self, smile):
+        mol = Chem.MolFromSmiles(smile)
+        if mol is None:
+            return None
+        return MoleculeFeatures(mol)
+
+    def is_candidate(self, rxn, features):
+        """ Returns True if rxn could match the molecule with these features """
+        if features is None:
+            return True
+
+        screen = self._get_screen(rxn)
+        self.num_screened += 1
+        if screen is None or screen.passes(features):
+            return True
+
+        self.num_skipped += 1
+        return False
+
+    def reset_counts(self):
+        self.num_screened = 0
+        self.num_skipped = 0
+
+    def report(self):
+        return {'screened': self.num_screened, 'skipped': self.num_skipped}
+
+    def add_counts(self, report):
+        """ Add the counts from another index's report(), eg from a frontier worker process """
+        self.num_screened += report['screened']
+        self.num_skipped += report['skipped']
+
+    def _get_screen(self, rxn):
+        if not hasattr(rxn, 'applicability_screen'):
+            try:
+                rxn.applicability_screen = RuleScreen(rxn.template_r)
+            except Exception as e:
+                self._log(f'Could not build screen for {rxn.reaction_smarts} - {e}')
+                rxn.applicability_screen = None
+        return rxn.applicability_screen
+
+    def _log(self, msg):
+        if self.print_log == True:
+            print(msg)
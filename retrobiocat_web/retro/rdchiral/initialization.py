@@ -68,6 +68,64 @@ class rdchiralReaction(object):
         self.required_rt_bond_defs, self.required_bond_defs_coreatoms = \
             enumerate_possible_cistrans_defs(self.template_r)
 
+    def to_dict(self):
+        '''Serialize the compiled reaction and its pre-computed template metadata,
+        so it can be restored with `from_dict` without re-parsing the SMARTS
+
+        Returns:
+            dict: picklable dictionary of the reaction
+        '''
+        return {'reaction_smarts': self.reaction_smarts,
+                'rxn_binary': self.rxn.ToBinary(Chem.PropertyPickleOptions.AllProps),
+                'reactant_mapnums': [[a.GetAtomMapNum() for a in rct.GetAtoms()]
+                                     for rct in self.rxn.GetReactants()],
+                'atoms_rt_idx_to_map': self.atoms_rt_idx_to_map,
+                'atoms_pt_idx_to_map': self.atoms_pt_idx_to_map,
+                'rt_bond_dirs_by_mapnum': {k: int(v) for k, v in self.rt_bond_dirs_by_mapnum.items()},
+                'pt_bond_dirs_by_mapnum': {k: int(v) for k, v in self.pt_bond_dirs_by_mapnum.items()},
+                'required_rt_bond_defs': {k: (int(v[0]), int(v[1])) for k, v in self.required_rt_bond_defs.items()},
+                'required_bond_defs_coreatoms': self.required_bond_defs_coreatoms}
+
+    @classmethod
+    def from_dict(cls, rxn_dict):
+        '''Restore a reaction serialized with `to_dict`
+
+        Args:
+            rxn_dict (dict): dictionary from `to_dict`
+
+        Returns:
+            rdchiralReaction: the restored reaction
+        '''
+        self = cls.__new__(cls)
+        self.reaction_smarts = rxn_dict['reaction_smarts']
+
+        self.rxn = AllChem.ChemicalReaction(rxn_dict['rxn_binary'])
+        for rct, mapnums in zip(self.rxn.GetReactants(), rxn_dict['reactant_mapnums']):
+            [a.SetAtomMapNum(mapnum) for a, mapnum in zip(rct.GetAtoms(), mapnums)]
+        if not self.rxn.IsInitialized():
+            self.rxn.Initialize()
+
+        self.template_r, self.template_p = get_template_frags_from_rxn(self.rxn)
+        self.atoms_rt_idx_to_map = rxn_dict['atoms_rt_idx_to_map']
+        self.atoms_pt_idx_to_map = rxn_dict['atoms_pt_idx_to_map']
+        self.reset()
+
+        self.atoms_rt_map = {a.GetAtomMapNum(): a \
+            for a in self.template_r.GetAtoms() if a.GetAtomMapNum()}
+        self.atoms_pt_map = {a.GetAtomMapNum(): a \
+            for a in self.template_p.GetAtoms() if a.GetAtomMapNum()}
+
+        [template_atom_could_have_been_tetra(a) for a in self.template_r.GetAtoms()]
+        [template_atom_could_have_been_tetra(a) for a in self.template_p.GetAtoms()]
+
+        self.rt_bond_dirs_by_mapnum = {k: BondDir.values[v] for k, v in rxn_dict['rt_bond_dirs_by_mapnum'].items()}
+        self.pt_bond_dirs_by_mapnum = {k: BondDir.values[v] for k, v in rxn_dict['pt_bond_dirs_by_mapnum'].items()}
+        self.required_rt_bond_defs = {k: (BondDir.values[v[0]], BondDir.values[v[1]])
+                                      for k, v in rxn_dict['required_rt_bond_defs'].items()}
+        self.required_bond_defs_coreatoms = rxn_dict['required_bond_defs_coreatoms']
+
+        return self
+
     def reset(self):
         '''Reset atom map numbers for template fragment atoms'''
         for (idx, mapnum) in self.atoms_rt_idx_to_map.items():
@@ -4,10 +4,23 @@ from rq import Connection, Worker
 import os
 
 from retrobiocat_web.app.app import create_app
+from retrobiocat_web.retro.enzyme_identification import activity_index
 
 scheduler = os.environ.get('SCHEDULER') or False
 production_mode = os.environ.get('PRODUCTION') or False
 
+
+class WarmWorker(Worker):
+    """ Jobs run in a process forked from the worker, so caches loaded here before each job are inherited by it """
+
+    def execute_job(self, job, queue):
+        try:
+            activity_index.warm_activity_index()
+        except Exception as e:
+            print(f"WARNING could not load the activity index before the job - {e}")
+        return super().execute_job(job, queue)
+
+
 if __name__ == '__main__':
     app = create_app(use_talisman=production_mode)
     app.app_context().push()
@@ -17,5 +30,5 @@ if __name__ == '__main__':
                               'alignment', 'blast', 'preprocess', 'osra']
         if 'auto_jobs' in qs:
             scheduler = True
-        w = Worker(qs, log_job_description=False)
+        w = WarmWorker(qs, log_job_description=False)
         w.work(with_scheduler=scheduler)
@@ -0,0 +1,218 @@
+"""
+Compile building block catalogues into a .bbi index (see retrobiocat_web.retro.evaluation.building_block_index),
+as an alternative to buyable_df_to_db.py which does not need every catalogue in memory at once.
+
+Catalogues are read in chunks and canonicalised in parallel.  Hashes are sorted and de-duplicated in runs of
+run_size which are written to disk, then the runs are merged block by block into the final file (an external sort),
+so memory stays flat however large the catalogues are.  Each hash keeps a bitmask of the vendors which stock it.
+
+Copy the output to retrobiocat_web/retro/data/buyability/building_blocks.bbi to use it.
+"""
+
+import collections
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from retrobiocat_web.retro.generation.node_analysis import rdkit_smile
+from retrobiocat_web.retro.evaluation.building_block_index import smiles_hash, write_bbi_header, mask_bytes_for, MASK_DTYPES
+
+RUN_DTYPE = np.dtype([('hash', np.uint64), ('mask', np.uint64)])
+
+
+def read_smiles_chunks(path, smiles_col='SMILES', sep=',', chunk_size=50000):
+    """ Yield lists of chunk_size smiles from a csv, using the first column if there is no smiles_col header """
+    with open(path, newline='') as f:
+        reader = csv.reader(f, delimiter=sep)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        if smiles_col in header:
+            col = header.index(smiles_col)
+            chunk = []
+        else:
+            col = 0
+            chunk = [header[0]]
+
+        for row in reader:
+            if len(row) > col:
+                chunk.append(row[col])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) != 0:
+            yield chunk
+
+def canonical_hashes(args):
+    """ The unique hashes of the rdkit canonical smiles in a chunk, with the vendor mask of the chunk """
+    mask, chunk = args
+    hashes = []
+    for smi in chunk:
+        canonical = rdkit_smile(smi)
+        if canonical:
+            hashes.append(smiles_hash(canonical))
+    return mask, np.unique(np.array(hashes, dtype=np.uint64))
+
+def combine_duplicates(hashes, masks):
+    """ Sort by hash, merging the vendor masks of duplicate hashes """
+    order = np.argsort(hashes, kind='stable')
+    hashes, masks = hashes[order], masks[order]
+    if len(hashes) == 0:
+        return hashes, masks
+    starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]]))
+    return hashes[starts], np.bitwise_or.reduceat(masks, starts)
+
+
+class RunReader():
+
+    def __init__(self, path, block_size):
+        """ Reads a sorted run from disk block_size rows at a time """
+        self.run = np.load(path, mmap_mode='r')
+        self.block_size = block_size
+        self.position = 0
+        self.buffer = np.zeros(0, dtype=RUN_DTYPE)
+
+    def more_on_disk(self):
+        return self.position < len(self.run)
+
+    def refill(self):
+        if len(self.buffer) == 0 and self.more_on_disk():
+            self.buffer = np.array(self.run[self.position:self.position + self.block_size])
+            self.position += len(self.buffer)
+
+    def take_up_to(self, threshold):
+        split = np.searchsorted(self.buffer['hash'], threshold, side='right')
+        taken, self.buffer = self.buffer[:split], self.buffer[split:]
+        return taken
+
+
+class BuildingBlockCompiler():
+
+    def __init__(self, processes=None, chunk_size=50000, run_size=5000000, block_size=1000000, print_log=True):
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.run_size = run_size
+        self.block_size = block_size
+        self.print_log = print_log
+
+    def compile(self, sources, output_path, with_vendors=True):
+        """ sources is a list of dicts of vendor, path and optionally smiles_col and sep """
+        vendors = [source['vendor'] for source in sources] if with_vendors == True else []
+        mask_bytes_for(len(vendors))
+
+        tmp_dir = tempfile.mkdtemp(prefix='building_blocks_')
+        try:
+            run_paths = self._write_runs(sources, tmp_dir)
+            count = self._merge_runs(run_paths, tmp_dir, len(vendors))
+            self._write_output(output_path, tmp_dir, count, vendors)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self._log(f"Compiled {count} building blocks to {output_path}")
+        return count
+
+    def _chunks(self, sources):
+        for i, source in enumerate(sources):
+            self._log(f"Reading {source['vendor']} from {source['path']}")
+            for chunk in read_smiles_chunks(source['path'], smiles_col=source.get('smiles_col', 'SMILES'),
+                                            sep=source.get('sep', ','), chunk_size=self.chunk_size):
+                yield 1 << i, chunk
+
+    def _hash_chunks(self, sources, pool):
+        """ Yield (mask, hashes) for each chunk in order, with at most 2 x processes chunks read ahead of the results """
+        if pool is None:
+            yield from map(canonical_hashes, self._chunks(sources))
+            return
+
+        in_flight = collections.deque()
+        for args in self._chunks(sources):
+            if len(in_flight) >= self.processes * 2:
+                yield in_flight.popleft().get()
+            in_flight.append(pool.apply_async(canonical_hashes, (args,)))
+        while len(in_flight) != 0:
+            yield in_flight.popleft().get()
+
+    def _write_runs(self, sources, tmp_dir):
+        run_paths = []
+        pending_hashes, pending_masks, pending_size = [], [], 0
+
+        def flush():
+            hashes, masks = combine_duplicates(np.concatenate(pending_hashes), np.concatenate(pending_masks))
+            run = np.zeros(len(hashes), dtype=RUN_DTYPE)
+            run['hash'], run['mask'] = hashes, masks
+            path = f"{tmp_dir}/run_{len(run_paths)}.npy"
+            np.save(path, run)
+            run_paths.append(path)
+            self._log(f"Wrote run {len(run_paths)} of {len(run)} building blocks")
+
+        pool = multiprocessing.Pool(self.processes) if self.processes > 1 else None
+        try:
+            for mask, hashes in self._hash_chunks(sources, pool):
+                pending_hashes.append(hashes)
+                pending_masks.append(np.full(len(hashes), mask, dtype=np.uint64))
+                pending_size += len(hashes)
+                if pending_size >= self.run_size:
+                    flush()
+                    pending_hashes, pending_masks, pending_size = [], [], 0
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if pending_size != 0:
+            flush()
+        return run_paths
+
+    def _merge_runs(self, run_paths, tmp_dir, num_vendors):
+        """ Merge the sorted runs into hashes.bin and masks.bin, returning the number of unique hashes """
+        mask_dtype = MASK_DTYPES.get(mask_bytes_for(num_vendors))
+        readers = [RunReader(path, self.block_size) for path in run_paths]
+        count = 0
+
+        with open(f"{tmp_dir}/hashes.bin", 'wb') as hashes_file, open(f"{tmp_dir}/masks.bin", 'wb') as masks_file:
+            while True:
+                for reader in readers:
+                    reader.refill()
+                readers = [reader for reader in readers if len(reader.buffer) != 0]
+                if len(readers) == 0:
+                    break
+
+                # every hash up to the end of the shortest buffer is in memory, for every run
+                still_reading = [reader.buffer['hash'][-1] for reader in readers if reader.more_on_disk()]
+                threshold = min(still_reading) if len(still_reading) != 0 else np.iinfo(np.uint64).max
+
+                block = np.concatenate([reader.take_up_to(threshold) for reader in readers])
+                hashes, masks = combine_duplicates(block['hash'], block['mask'])
+                hashes_file.write(hashes.tobytes())
+                if mask_dtype is not None:
+                    masks_file.write(masks.astype(mask_dtype).tobytes())
+                count += len(hashes)
+
+        return count
+
+    def _write_output(self, output_path, tmp_dir, count, vendors):
+        with open(output_path, 'wb') as f:
+            write_bbi_header(f, count, vendors)
+            for name in ['hashes.bin', 'masks.bin']:
+                with open(f"{tmp_dir}/{name}", 'rb') as part:
+                    shutil.copyfileobj(part, f)
+
+    def _log(self, msg):
+        if self.print_log == True:
+            print(msg)
+
+
+if __name__ == '__main__':
+    sources = [{'vendor': 'zinc', 'path': 'zinc_in_stock.csv'},
+               {'vendor': 'emolecules', 'path': 'salt_removed_emolecules.csv'},
+               {'vendor': 'molport', 'path': 'molport_building_blocks.csv'}]
+    sources = [source for source in sources if os.path.exists(source['path'])]
+
+    t0 = time.time()
+    BuildingBlockCompiler().compile(sources, 'building_blocks.bbi')
+    t1 = time.time()
+    print(f"Time = {round(t1 - t0, 2)} seconds")
@@ -25,4 +25,8 @@ if __name__ == '__main__':
     time_function(AllChem.ReactionFromSmarts, [test_smarts])
 
     print("Timing rdchiral load reaction from smarts..")
-    time_function(rdchiralReaction, [test_smarts])
\ No newline at end of file
+    time_function(rdchiralReaction, [test_smarts])
+
+    print("Timing rdchiral load reaction from a serialized bundle entry..")
+    rxn_dict = rdchiralReaction(test_smarts).to_dict()
+    time_function(rdchiralReaction.from_dict, [rxn_dict])
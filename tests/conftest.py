@@ -0,0 +1,24 @@
+import pytest
+from retrobiocat_web.retro.enzyme_identification.load import make_fingerprints
+from retrobiocat_web.retro.enzyme_identification.packed_fingerprints import FingerprintMatrix
+
+MOLECULES = ['CCO', 'CCCO', 'CCCCO', 'CC(=O)O', 'CCC(=O)O', 'CC(=O)OCC', 'c1ccccc1', 'Cc1ccccc1', 'CCc1ccc(C=O)cc1',
+             'O=Cc1ccccc1', 'OCc1ccccc1', 'NC(Cc1ccccc1)C(=O)O', 'CC(N)C(=O)O', 'NCC(=O)O', 'O=C1CCCCC1',
+             'OC1CCCCC1', 'CC(C)=O', 'CC(C)O', 'CCCCCCCCCC(=O)O', 'C', 'O=C(O)c1ccccc1', 'CC(=O)c1ccccc1',
+             'C[C@H](O)c1ccccc1', 'C[C@@H](O)c1ccccc1']
+
+
+@pytest.fixture(scope='session')
+def fp_gen():
+    fingerprint_settings = make_fingerprints.fingerprint_options[make_fingerprints.default_fp_mode]
+    return make_fingerprints.make_fp_generator(fingerprint_settings[0], fingerprint_settings[1])
+
+@pytest.fixture(scope='session')
+def rdkit_fps(fp_gen):
+    """ {smiles: rdkit fingerprint} for MOLECULES """
+    from rdkit import Chem
+    return {smi: fp_gen.GetFingerprint(Chem.MolFromSmiles(smi)) for smi in MOLECULES}
+
+@pytest.fixture(scope='session')
+def fp_matrix(rdkit_fps):
+    return FingerprintMatrix.from_bitstrings(list(rdkit_fps), [fp.ToBitString() for fp in rdkit_fps.values()], version='v1')
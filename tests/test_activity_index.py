@@ -0,0 +1,271 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit import Chem, DataStructs
+from retrobiocat_web.retro.enzyme_identification import activity_index
+from retrobiocat_web.retro.enzyme_identification.activity_index import ActivityIndex
+from retrobiocat_web.retro.enzyme_identification.load import make_fingerprints
+from retrobiocat_web.retro.enzyme_identification.molecular_similarity import SubstrateSpecificityScorer, ACTIVITY_LEVELS
+from retrobiocat_web.retro.enzyme_identification.query_mongodb import COLUMNS
+from conftest import MOLECULES
+
+REACTIONS = ['Carboxylic acid reduction', 'Ketone reduction', 'Ester hydrolysis']
+ENZYMES = ['CAR', 'KRED', 'EST']
+
+
+def make_activity_df(seed=0, num_rows=300):
+    """ Activity data over MOLECULES (plus some molecules with no fingerprint), with a mix of activity measures """
+    rng = np.random.default_rng(seed)
+    molecules = MOLECULES + ['CCCCCCN', 'OCCCCCO']
+    rows = []
+    for i in range(num_rows):
+        reaction = rng.integers(len(REACTIONS))
+        has_sub_two = rng.random() < 0.3
+        measure = rng.integers(3)
+        rows.append({'reaction': REACTIONS[reaction],
+                     'enzyme_type': ENZYMES[reaction],
+                     'enzyme_name': f"enzyme{rng.integers(8)}",
+                     'short_citation': f"paper {i}",
+                     'html_doi': '',
+                     'substrate_1_smiles': molecules[rng.integers(len(molecules))],
+                     # mongo leaves out unset fields, so a missing substrate 2 can come back as '', None or NaN
+                     'substrate_2_smiles': molecules[rng.integers(len(molecules))] if has_sub_two else ['', None, np.nan][i % 3],
+                     'product_1_smiles': molecules[rng.integers(len(molecules))],
+                     'specific_activity': round(float(rng.uniform(0, 10)), 2) if measure == 0 else np.nan,
+                     'conversion': round(float(rng.uniform(0, 100)), 0) if measure <= 1 else np.nan,
+                     'categorical': ['High', 'Medium', 'Low', 'None'][rng.integers(4)] if rng.random() < 0.8 else np.nan,
+                     'binary': int(rng.random() < 0.8),
+                     'auto_generated': int(rng.random() < 0.1),
+                     'paper': f"p{i}",
+                     '_id': f"a{i}",
+                     'reviewed': bool(rng.random() < 0.5)})
+    return pd.DataFrame(rows).reindex(columns=COLUMNS + ['reviewed'])
+
+
+class BaselineScorer():
+    """
+    The dataframe and rdkit scoring path which SubstrateSpecificityScorer used before the activity index,
+    as the reference the index must agree with.  Sorts are stable, so ties keep the order of the activity data.
+    """
+
+    def __init__(self, activity_df, rdkit_fps, fp_gen, score_substrates=False):
+        self.df = activity_df
+        self.fingerprint_df = pd.DataFrame({'smiles': list(rdkit_fps), 'fp': list(rdkit_fps.values())})
+        self.fp_gen = fp_gen
+        self.score_substrates = score_substrates
+
+    def select(self, reactions, enzymes, only_reviewed=False):
+        df = self.df
+        if not ("All" in enzymes or len(enzymes) == 0 or enzymes == ['']):
+            df = df[df['enzyme_type'].isin(enzymes)]
+        if not ("All" in reactions or len(reactions) == 0 or reactions == ['']):
+            df = df[df['reaction'].isin(reactions)]
+        if only_reviewed == True:
+            df = df[df['reviewed'] == True]
+        return df
+
+    def get_fingerprints(self, df):
+        columns = [('product_1_smiles', 'product_1_fingerprint')]
+        if self.score_substrates == True:
+            columns += [('substrate_1_smiles', 'substrate_1_fingerprint'), ('substrate_2_smiles', 'substrate_2_fingerprint')]
+        for smi_col, fp_col in columns:
+            df = df.merge(self.fingerprint_df, how='left', left_on=smi_col, right_on='smiles')
+            df = df.rename(columns={'fp': fp_col}).drop(columns=['smiles'])
+        return df
+
+    def fingerprint(self, smi):
+        if smi is None:
+            return None
+        return self.fp_gen.GetFingerprint(Chem.MolFromSmiles(smi))
+
+    def calculate_similarity(self, df, p, s1, s2):
+        p_fp, s1_fp, s2_fp = self.fingerprint(p), self.fingerprint(s1), self.fingerprint(s2)
+        if p_fp is not None:
+            df['product_1_similarity'] = DataStructs.BulkTanimotoSimilarity(p_fp, list(df['product_1_fingerprint']))
+        if self.score_substrates == True and s1_fp is not None:
+            one = list(df['substrate_1_fingerprint'])
+            if s2_fp is None:
+                df['substrate_similarity'] = DataStructs.BulkTanimotoSimilarity(s1_fp, one)
+            else:
+                two = list(df['substrate_2_fingerprint'])
+                same = np.add(DataStructs.BulkTanimotoSimilarity(s1_fp, one), DataStructs.BulkTanimotoSimilarity(s2_fp, two))
+                swapped = np.add(DataStructs.BulkTanimotoSimilarity(s1_fp, two), DataStructs.BulkTanimotoSimilarity(s2_fp, one))
+                df['substrate_similarity'] = np.maximum(same, swapped)
+
+        if 'product_1_similarity' in df and 'substrate_similarity' in df:
+            df['similarity'] = (df['product_1_similarity'] + df['substrate_similarity']) / 2
+        elif 'product_1_similarity' in df:
+            df['similarity'] = df['product_1_similarity']
+        elif 'substrate_similarity' in df:
+            df['similarity'] = df['substrate_similarity']
+        else:
+            df['similarity'] = 0
+        return df.sort_values('similarity', ascending=False, kind='stable')
+
+    def get_best_enzymes(self, top_df, num_enzymes, max_hits):
+        best = []
+        seen = []
+        for _, row in top_df.iterrows():
+            row_smi = str([row['substrate_1_smiles'], row['substrate_2_smiles'], row['product_1_smiles']])
+            if (row_smi not in seen) and (len(seen) < max_hits or max_hits == False):
+                seen.append(row_smi)
+                candidates = top_df[top_df['substrate_1_smiles'].isin([row['substrate_1_smiles']]) &
+                                    top_df['substrate_2_smiles'].isin([row['substrate_2_smiles']]) &
+                                    top_df['product_1_smiles'].isin([row['product_1_smiles']])]
+                if candidates['specific_activity'].notnull().all():
+                    sort_on = 'specific_activity'
+                elif candidates['conversion'].notnull().all():
+                    sort_on = 'conversion'
+                elif candidates['categorical'].isin(list(ACTIVITY_LEVELS)).all():
+                    # the old code meant to sort on categorical here, but its check (!= type(str)) never passed
+                    sort_on = 'categorical'
+                else:
+                    sort_on = 'binary'
+                key = (lambda col: col.map(ACTIVITY_LEVELS)) if sort_on == 'categorical' else None
+                best.append(candidates.sort_values(sort_on, ascending=False, kind='stable', key=key).iloc[0:num_enzymes])
+        return pd.concat(best) if len(best) != 0 else pd.DataFrame()
+
+    def score_reaction(self, reaction, enzyme, p, s1, s2, sim_cutoff=0.7, only_active=True, max_enzymes=1, max_hits=4):
+        df = self.get_fingerprints(self.select([reaction], [enzyme]))
+        df = df.dropna(subset=['product_1_fingerprint'])
+        if self.score_substrates == True:
+            if s1 is not None:
+                df = df.dropna(subset=['substrate_1_fingerprint'])
+            if s2 is not None:
+                df = df.dropna(subset=['substrate_2_fingerprint'])
+        if len(df.index) == 0:
+            return 0, []
+
+        df = self.calculate_similarity(df, p, s1, s2)
+        df = df[df['similarity'] >= sim_cutoff]
+        if only_active == True:
+            df = df[df['binary'] == 1]
+        best = self.get_best_enzymes(df, max_enzymes, max_hits)
+        if len(best) == 0:
+            return 0, []
+        score = best.iloc[0]['similarity']
+        if best.iloc[0]['binary'] == 0:
+            score = score * -1
+        return score, list(best['_id'])
+
+    def query(self, product, reactions, enzymes, num_enzymes=5, num_hits=2, sim_cutoff=0.65):
+        df = self.get_fingerprints(self.select(reactions, enzymes)).dropna(subset=['product_1_fingerprint'])
+        df = self.calculate_similarity(df, product, None, None)
+        df = df[df['similarity'] >= sim_cutoff]
+        return self.get_best_enzymes(df, num_enzymes, num_hits)
+
+
+@pytest.fixture(scope='module')
+def activity_df():
+    return make_activity_df()
+
+@pytest.fixture
+def scorer_for(monkeypatch, fp_matrix, activity_df):
+    monkeypatch.setattr(make_fingerprints, 'load_fp_matrix', lambda mode: fp_matrix)
+    index = ActivityIndex(activity_df, fp_matrix, version='v1')
+
+    def make_scorer(score_substrates=False):
+        scorer = SubstrateSpecificityScorer(score_substrates=score_substrates)
+        scorer.activity_index = index
+        return scorer
+    return make_scorer
+
+
+def test_groups_match_a_query(fp_matrix, activity_df):
+    index = ActivityIndex(activity_df, fp_matrix)
+    for reaction, enzyme in [('Ketone reduction', 'KRED'), ('All', 'CAR'), ('Ester hydrolysis', 'All'), ('', ''), ('Ketone reduction', 'CAR')]:
+        group = index.get_group(reaction, enzyme)
+        expected = activity_df
+        if reaction not in ['All', '']:
+            expected = expected[expected['reaction'] == reaction]
+        if enzyme not in ['All', '']:
+            expected = expected[expected['enzyme_type'] == enzyme]
+        assert list(group.rows) == list(expected.index)
+        assert list(group.has_product_fp) == [smi in MOLECULES for smi in expected['product_1_smiles']]
+
+def test_select_rows_only_reviewed(fp_matrix, activity_df):
+    index = ActivityIndex(activity_df, fp_matrix)
+    rows = index.select_rows(['Ketone reduction'], ['All'], only_reviewed=True)
+    expected = activity_df[(activity_df['reaction'] == 'Ketone reduction') & (activity_df['reviewed'] == True)]
+    assert list(rows) == list(expected.index)
+
+def test_smiles_columns_missing_from_every_record(fp_matrix, activity_df):
+    df = activity_df.copy()
+    df['substrate_2_smiles'] = np.nan
+    index = ActivityIndex(df, fp_matrix)
+    assert (index.sub_two_rows == -1).all()
+    assert not index.get_group('Ketone reduction', 'KRED').has_sub_two_fp.any()
+
+def test_empty_activity_data(fp_matrix):
+    index = ActivityIndex(make_activity_df(num_rows=0), fp_matrix)
+    assert len(index.get_group('Ketone reduction', 'KRED')) == 0
+    assert len(index.select_rows(['All'], ['All'])) == 0
+
+
+@pytest.mark.parametrize('score_substrates', [False, True])
+def test_score_reaction_matches_baseline(scorer_for, activity_df, rdkit_fps, fp_gen, score_substrates):
+    scorer = scorer_for(score_substrates)
+    baseline = BaselineScorer(activity_df, rdkit_fps, fp_gen, score_substrates=score_substrates)
+
+    queries = [('Carboxylic acid reduction', 'CAR', 'O=Cc1ccccc1', 'O=C(O)c1ccccc1', None),
+               ('Ketone reduction', 'KRED', 'C[C@H](O)c1ccccc1', 'CC(=O)c1ccccc1', None),
+               ('Ketone reduction', 'KRED', 'OC1CCCCC1', 'O=C1CCCCC1', None),
+               ('Ester hydrolysis', 'EST', 'CCO', 'CC(=O)OCC', 'CC(=O)O'),
+               ('All', 'All', 'CCCO', 'CCO', 'CCCO')]
+    for reaction, enzyme, p, s1, s2 in queries:
+        for sim_cutoff, only_active, max_enzymes in [(0.7, True, 1), (0.2, False, 3), (0.0, True, 2)]:
+            expected_score, expected_ids = baseline.score_reaction(reaction, enzyme, p, s1, s2, sim_cutoff=sim_cutoff,
+                                                                   only_active=only_active, max_enzymes=max_enzymes)
+            score, info = scorer.scoreReaction(reaction, enzyme, p, s1, s2, sim_cutoff=sim_cutoff,
+                                               onlyActive=only_active, maxEnzymes=max_enzymes)
+            assert score == pytest.approx(expected_score)
+            if expected_ids == []:
+                assert info == False
+            else:
+                # info is keyed by product, so holds the last row for each product of the best enzymes
+                expected_info = {activity_df.loc[activity_df['_id'] == i, 'product_1_smiles'].iloc[0]: i for i in expected_ids}
+                assert {smi: hit['activity_id'] for smi, hit in info.items()} == expected_info
+
+def test_query_specificity_df_matches_baseline(scorer_for, activity_df, rdkit_fps, fp_gen):
+    scorer = scorer_for()
+    baseline = BaselineScorer(activity_df, rdkit_fps, fp_gen)
+
+    for product, enzymes in [('CCc1ccc(C=O)cc1', ['CAR']), ('C[C@@H](O)c1ccccc1', ['All']), ('CC(C)O', ['KRED', 'EST'])]:
+        for num_enzymes, num_hits, sim_cutoff in [(5, 2, 0.65), (1, 5, 0.3), (2, 10, 0.0)]:
+            expected = baseline.query(product, [''], enzymes, num_enzymes=num_enzymes, num_hits=num_hits, sim_cutoff=sim_cutoff)
+            result = scorer.querySpecificityDf(product, [''], enzymes, numEnzymes=num_enzymes, numHits=num_hits, simCutoff=sim_cutoff)
+            assert list(result['_id']) == list(expected['_id'])
+            assert np.allclose(result['similarity'], expected['similarity'])
+
+def test_get_best_enzymes_matches_baseline_row_order(scorer_for, activity_df, rdkit_fps, fp_gen):
+    scorer = scorer_for()
+    baseline = BaselineScorer(activity_df, rdkit_fps, fp_gen)
+    for num_enzymes, max_hits in [(1, 4), (3, 2), (5, False), (2, 100)]:
+        expected = baseline.get_best_enzymes(activity_df, num_enzymes, max_hits)
+        assert list(scorer.get_best_enzymes(activity_df, num_enzymes, max_hits)['_id']) == list(expected['_id'])
+
+def test_get_best_enzymes_with_only_categorical_data(scorer_for):
+    rows = [('CCO', 'Low', 1), ('CCO', 'High', 1), ('CCO', 'None', 0), ('CCO', 'Medium', 1),
+            ('CCN', 'Low', 1), ('CCN', np.nan, 0), ('CCN', 'High', 1)]
+    df = pd.DataFrame({'substrate_1_smiles': 'CC=O', 'substrate_2_smiles': '', 'product_1_smiles': [r[0] for r in rows],
+                       'specific_activity': np.nan, 'conversion': np.nan,
+                       'categorical': [r[1] for r in rows], 'binary': [r[2] for r in rows],
+                       '_id': [f"a{i}" for i in range(len(rows))]})
+
+    best = scorer_for().get_best_enzymes(df, 3, False)
+    # CCN has a row with no level, so is sorted on binary activity instead
+    assert list(best['_id']) == ['a1', 'a3', 'a0', 'a4', 'a6', 'a5']
+
+
+def test_activity_index_is_rebuilt_when_the_version_changes(monkeypatch, fp_matrix, activity_df):
+    versions = iter(['v1', 'v1', 'v2'])
+    monkeypatch.setattr(activity_index.query_mongodb, 'get_activity_version', lambda: next(versions))
+    monkeypatch.setattr(activity_index.query_mongodb, 'query_all_activity_data', lambda: activity_df)
+    monkeypatch.setattr(activity_index, 'CHECK_INTERVAL', 0)
+    activity_index.clear_activity_indexes()
+
+    first = activity_index.get_activity_index('mode', fp_matrix)
+    assert activity_index.get_activity_index('mode', fp_matrix) is first
+    second = activity_index.get_activity_index('mode', fp_matrix)
+    assert second is not first and second.version == 'v2'
+    activity_index.clear_activity_indexes()
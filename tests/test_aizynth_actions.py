@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('rdkit')
+from retrobiocat_web.retro.generation.retrosynthesis_engine.aizynthfinder_actions import ActionApplier
+
+TEMPLATES = pd.DataFrame({'retro_template': ['[C:1][OH:2]>>[C:1]=[O:2]', '[C:1][NH2:2]>>[C:1]=[O:2].[N:2]'],
+                          'classification': ['Alcohol oxidation', 'Reductive amination']})
+
+
+class FakePolicyModel():
+    """ Stands in for the policy, favouring the first template, and recording the size of each batch """
+
+    def __init__(self, nbits=64):
+        self.nbits = nbits
+        self.batch_sizes = []
+
+    def __len__(self):
+        return self.nbits
+
+    def predict(self, fp_matrix):
+        self.batch_sizes.append(len(fp_matrix))
+        return np.tile([0.6, 0.3], (len(fp_matrix), 1))
+
+
+@pytest.fixture
+def applier():
+    applier = ActionApplier()
+    applier.policy_model = FakePolicyModel()
+    applier.templates = TEMPLATES
+    return applier
+
+
+def test_unparsable_smiles_does_not_fail_the_batch(applier):
+    batch = applier.get_rxns_batch(['CCO', 'not a smiles', 'CCN'])
+
+    assert applier.policy_model.batch_sizes == [2]
+    assert len(batch) == 3
+    assert batch[1] == ({}, {})
+    for rxns, metadata in [batch[0], batch[2]]:
+        assert list(rxns) == ['Chem_Alcohol oxidation', 'Chem_Reductive amination']
+
+def test_batch_of_only_unparsable_smiles(applier):
+    assert applier.get_actions_batch(['not a smiles']) == [[]]
+    assert applier.policy_model.batch_sizes == []
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import sqlite3
+import numpy as np
+from retrobiocat_web.retro.evaluation import building_block_index
+from retrobiocat_web.retro.evaluation.building_block_index import BuildingBlockIndex, write_bbi_header, read_bbi, hash_many
+
+BUILDING_BLOCKS = ['CCO', 'CC(=O)O', 'c1ccccc1', 'NCC(=O)O', 'O=C(O)c1ccccc1']
+NOT_BUILDING_BLOCKS = ['CCCCCCCCO', 'CCN', '', 'C1CC1']
+
+
+def make_db(path, list_smiles):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE BUYABLE (SMILES TEXT);")
+    conn.executemany("INSERT INTO BUYABLE (SMILES) VALUES (?);", [(smi,) for smi in list_smiles])
+    conn.commit()
+    conn.close()
+
+
+def test_contains_many_matches_a_set():
+    index = BuildingBlockIndex.from_smiles(BUILDING_BLOCKS)
+    queries = BUILDING_BLOCKS + NOT_BUILDING_BLOCKS
+    assert list(index.contains_many(queries)) == [smi in BUILDING_BLOCKS for smi in queries]
+    assert index.contains('CCO') == True
+
+def test_empty_index_and_empty_query():
+    empty = BuildingBlockIndex.from_smiles([])
+    assert list(empty.contains_many(['CCO'])) == [False]
+    assert len(BuildingBlockIndex.from_smiles(BUILDING_BLOCKS).contains_many([])) == 0
+
+def test_hashes_are_the_same_in_every_process():
+    # blake2b rather than hash(), so a saved index can be used by other processes
+    expected = int.from_bytes(hashlib.blake2b(b'CCO', digest_size=8).digest(), 'little')
+    assert int(hash_many(['CCO'])[0]) == expected
+    assert building_block_index.smiles_hash('CCO') == expected
+
+def test_load_index_for_db_builds_saves_and_reloads(tmp_path):
+    db_path = str(tmp_path / 'buyable.db')
+    make_db(db_path, BUILDING_BLOCKS + [None])
+
+    index = building_block_index.load_index_for_db(db_path)
+    assert os.path.exists(building_block_index.index_path_for_db(db_path))
+    assert list(index.contains_many(BUILDING_BLOCKS)) == [True] * len(BUILDING_BLOCKS)
+
+    reloaded = building_block_index.load_index_for_db(db_path)
+    assert isinstance(reloaded.hashes, np.memmap)
+    assert list(reloaded.contains_many(NOT_BUILDING_BLOCKS)) == [False] * len(NOT_BUILDING_BLOCKS)
+
+def test_bbi_file_with_vendor_masks(tmp_path):
+    vendors = ['sigma', 'enamine', 'molport']
+    stock = {'CCO': ['sigma', 'molport'], 'c1ccccc1': ['enamine'], 'CC(=O)O': []}
+
+    hashes = hash_many(list(stock))
+    order = np.argsort(hashes)
+    masks = np.array([sum(1 << vendors.index(v) for v in stock[smi]) for smi in stock], dtype=np.uint8)
+
+    path = str(tmp_path / 'blocks.bbi')
+    with open(path, 'wb') as f:
+        offset = write_bbi_header(f, len(stock), vendors)
+        assert f.tell() == offset
+        f.write(hashes[order].tobytes())
+        f.write(masks[order].tobytes())
+
+    loaded_hashes, loaded_masks, loaded_vendors = read_bbi(path)
+    assert loaded_vendors == vendors
+    assert list(loaded_hashes) == list(hashes[order])
+
+    index = BuildingBlockIndex.load(path)
+    assert index.vendors_many(['CCO', 'c1ccccc1', 'CC(=O)O', 'CCN']) == [['sigma', 'molport'], ['enamine'], [], []]
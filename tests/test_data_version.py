@@ -0,0 +1,51 @@
+import pytest
+import mongoengine
+from retrobiocat_web.mongo.models.biocatdb_models import Activity, Molecule, bump_data_version
+from retrobiocat_web.retro.enzyme_identification import query_mongodb
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture(autouse=True)
+def mock_db():
+    mongoengine.connect('test_data_version', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient,
+                        uuidRepresentation='standard')
+    yield
+    mongoengine.disconnect()
+
+
+def test_version_changes_on_save_edit_and_delete():
+    versions = [query_mongodb.get_activity_version()]
+
+    activity = Activity(reaction='Ketone reduction', enzyme_type='KRED', product_1_smiles='CCO')
+    activity.save()
+    versions.append(query_mongodb.get_activity_version())
+
+    activity.product_1_smiles = 'CCCO'
+    activity.save()
+    versions.append(query_mongodb.get_activity_version())
+
+    activity.delete()
+    versions.append(query_mongodb.get_activity_version())
+
+    assert len(set(versions)) == 4
+    assert query_mongodb.get_activity_version() == versions[-1]
+
+def test_versions_are_per_collection():
+    activity_version = query_mongodb.get_activity_version()
+    Molecule(smiles='CCO').save()
+    assert query_mongodb.get_activity_version() == activity_version
+    assert query_mongodb.get_data_version(Molecule) != query_mongodb.get_data_version(Activity)
+
+def test_drop_and_queryset_deletes():
+    Activity(reaction='Ketone reduction').save()
+    before_drop = query_mongodb.get_activity_version()
+    Activity.drop_collection()
+    assert query_mongodb.get_activity_version() != before_drop
+
+    # queryset deletes skip Document.delete, so callers bump the version themselves
+    Activity(reaction='Ketone reduction').save()
+    before_delete = query_mongodb.get_activity_version()
+    Activity.objects(reaction='Ketone reduction').delete()
+    bump_data_version(Activity._get_collection_name())
+    assert query_mongodb.get_activity_version() != before_delete
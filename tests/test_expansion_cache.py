@@ -0,0 +1,122 @@
+import threading
+import pytest
+from retrobiocat_web.retro.generation.retrosynthesis_engine.expansion_cache import ExpansionCache, LRUTier, RedisTier, SQLiteTier
+
+
+def test_lru_tier_evicts_least_recently_used():
+    tier = LRUTier(max_entries=2)
+    tier.set('a', 1)
+    tier.set('b', 2)
+    tier.get('a')
+    tier.set('c', 3)
+
+    assert tier.get('a') == 1
+    assert tier.get('b') is None
+    assert tier.get('c') == 3
+
+def test_lru_tier_from_many_threads():
+    tier = LRUTier(max_entries=100)
+
+    def work(n):
+        for i in range(2000):
+            tier.set(f"{n}-{i}", i)
+            tier.get(f"{n}-{i // 2}")
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(tier.entries) == 100
+
+
+def test_sqlite_tier_round_trip(tmp_path):
+    tier = SQLiteTier(str(tmp_path / 'cache.db'), max_entries=100)
+    tier.set_many({'a': {'rxn': [['CCO']]}, 'b': {}})
+
+    assert tier.get('a') == {'rxn': [['CCO']]}
+    assert tier.get_many(['a', 'b', 'missing']) == {'a': {'rxn': [['CCO']]}, 'b': {}}
+
+    # a second connection (eg another process) sees the same entries
+    assert SQLiteTier(str(tmp_path / 'cache.db')).get('b') == {}
+
+def test_sqlite_tier_evicts_in_a_batch(tmp_path):
+    tier = SQLiteTier(str(tmp_path / 'cache.db'), max_entries=10)
+    for i in range(10):
+        tier.set(f"k{i}", i)
+    tier.get('k0')
+    tier.set('k10', 10)
+
+    assert tier._count() == 9
+    assert tier.num_entries == 9
+    assert tier.get('k0') == 0
+    assert tier.get('k10') == 10
+    assert tier.get('k1') is None
+
+def test_sqlite_tier_from_many_threads(tmp_path):
+    tier = SQLiteTier(str(tmp_path / 'cache.db'), max_entries=1000)
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(50):
+                tier.set(f"{n}-{i}", i)
+                assert tier.get(f"{n}-{i}") == i
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert tier._count() == 200
+
+def test_sqlite_tier_clear(tmp_path):
+    tier = SQLiteTier(str(tmp_path / 'cache.db'))
+    tier.set('a', 1)
+    tier.clear()
+    assert tier.get('a') is None
+    assert tier.num_entries == 0
+
+
+def test_redis_tier_round_trip_and_eviction():
+    fakeredis = pytest.importorskip('fakeredis')
+    tier = RedisTier(fakeredis.FakeRedis(), max_entries=10, prefix='test')
+
+    tier.set_many({f"k{i}": [i] for i in range(10)})
+    assert tier.get_many(['k0', 'k9', 'missing']) == {'k0': [0], 'k9': [9]}
+
+    tier.set('k10', [10])
+    assert tier.connection.zcard('test:index') == 9
+    assert tier.get('k10') == [10]
+
+    tier.clear()
+    assert tier.get('k10') is None
+    assert tier.connection.zcard('test:index') == 0
+
+def test_redis_tier_get_does_not_index_missing_keys():
+    fakeredis = pytest.importorskip('fakeredis')
+    tier = RedisTier(fakeredis.FakeRedis(), prefix='test')
+    tier.get_many(['missing'])
+    assert tier.connection.zcard('test:index') == 0
+
+
+def test_expansion_cache_fills_memory_tier_from_shared_tier(tmp_path):
+    shared = SQLiteTier(str(tmp_path / 'cache.db'))
+    shared.set('key', {'rxn': []})
+
+    cache = ExpansionCache()
+    cache.shared_tier = shared
+    assert cache.get('key') == {'rxn': []}
+    assert cache.memory_tier.get('key') == {'rxn': []}
+    assert cache.get('missing') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_make_key_depends_on_options():
+    keys = {ExpansionCache.make_key('CCO', 'rules', *options)
+            for options in [(True, True, True), (False, True, True), (True, False, True), (True, True, False)]}
+    assert len(keys) == 4
@@ -0,0 +1,38 @@
+import pytest
+from retrobiocat_web.retro.generation.retrosynthesis_engine import frontier_expansion
+from retrobiocat_web.retro.generation.retrosynthesis_engine.frontier_expansion import SettingsOnlyNetwork
+
+rdchiral_main = pytest.importorskip('rdchiral.main')
+from retrobiocat_web.retro.generation.retrosynthesis_engine.retrosynthesis_engine import RuleApplicator
+
+SETTINGS = {'combine_enantiomers': True, 'clean_brackets': True, 'remove_simple': False,
+            'use_expansion_cache': False, 'prefilter_rules': True}
+FRONTIER = ['CCOC(=O)C', 'CCN', 'c1ccccc1', 'CCOC(=O)CCN', 'CCN']
+
+
+@pytest.fixture(scope='module')
+def rxns():
+    return {'Ester hydrolysis': [rdchiral_main.rdchiralReaction('[C:1](=[O:2])[O:3][C:4]>>[C:1](=[O:2])[OH].[OH][C:4]')],
+            'Reductive amination': [rdchiral_main.rdchiralReaction('[N;H2:1][C:2]>>[O]=[C:2].[N:1]')]}
+
+
+def test_parallel_frontier_matches_serial(rxns):
+    serial = RuleApplicator(SettingsOnlyNetwork(SETTINGS))
+    expected = {smi: serial.find_precursors(smi, rxns) for smi in dict.fromkeys(FRONTIER)}
+
+    parallel = RuleApplicator(SettingsOnlyNetwork(SETTINGS))
+    pool = frontier_expansion.make_pool(2, parallel, rxns)
+    try:
+        result = parallel.get_precursors_for_frontier(FRONTIER, rxns, pool)
+    finally:
+        pool.close()
+
+    assert result == expected
+    assert expected['CCOC(=O)CCN'] == {'Ester hydrolysis': [['CCO', 'NCCC(=O)O']], 'Reductive amination': [['CCOC(=O)CC=O', 'N']]}
+    # the prefilter counts come back from the workers
+    assert parallel.rule_index.report() == serial.rule_index.report()
+    assert parallel.rule_index.num_skipped > 0
+
+def test_no_pool_for_one_process(rxns):
+    assert frontier_expansion.make_pool(1, RuleApplicator(SettingsOnlyNetwork(SETTINGS)), rxns) is None
+    assert frontier_expansion.make_pool(False, RuleApplicator(SettingsOnlyNetwork(SETTINGS)), rxns) is None
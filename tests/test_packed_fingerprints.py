@@ -0,0 +1,70 @@
+import numpy as np
+from rdkit import DataStructs
+from retrobiocat_web.retro.enzyme_identification.packed_fingerprints import (FingerprintMatrix, pack_bitstrings, pack_fingerprint,
+                                                                             popcount, tanimoto, tanimoto_pairs)
+
+
+def test_popcount_matches_rdkit(rdkit_fps, fp_matrix):
+    assert list(fp_matrix.counts) == [fp.GetNumOnBits() for fp in rdkit_fps.values()]
+    assert list(popcount(fp_matrix.matrix)) == list(fp_matrix.counts)
+
+def test_pack_bitstrings_pads_to_whole_words():
+    packed = pack_bitstrings(['1' + '0' * 68 + '1'])
+    assert packed.shape == (1, 2)
+    assert popcount(packed)[0] == 2
+
+def test_tanimoto_matches_bulk_tanimoto(rdkit_fps, fp_matrix):
+    fps = list(rdkit_fps.values())
+    for query in fps:
+        expected = DataStructs.BulkTanimotoSimilarity(query, fps)
+        assert np.allclose(tanimoto(pack_fingerprint(query), fp_matrix.matrix, fp_matrix.counts), expected)
+
+def test_tanimoto_of_empty_fingerprints_is_zero():
+    empty = np.zeros((1, 2), dtype=np.uint64)
+    assert tanimoto(empty[0], empty)[0] == 0.0
+
+def test_tanimoto_pairs_matches_tanimoto(fp_matrix):
+    queries = fp_matrix.matrix[[0, 5, 8]]
+    targets = np.stack([fp_matrix.matrix[3:10], fp_matrix.matrix[10:17]])
+    target_counts = np.stack([fp_matrix.counts[3:10], fp_matrix.counts[10:17]])
+    pairs = [(0, 0), (1, 1), (2, 0)]
+
+    sims = tanimoto_pairs(queries, popcount(queries), targets, target_counts, pairs)
+    for sim, (q, t) in zip(sims, pairs):
+        assert np.allclose(sim, tanimoto(queries[q], targets[t]))
+
+def test_rows_for(fp_matrix):
+    smiles = ['CCCO', 'missing', 'c1ccccc1']
+    rows = fp_matrix.rows_for(smiles)
+    assert list(rows) == [1, -1, 6]
+
+    fps, counts = fp_matrix.get_rows(rows)
+    assert (fps[0] == fp_matrix.matrix[1]).all()
+    assert not fps[1].any() and counts[1] == 0
+
+def test_rows_for_values_which_are_not_smiles(fp_matrix):
+    assert list(fp_matrix.rows_for(['', None, float('nan'), 'CCO'])) == [-1, -1, -1, 0]
+    assert list(fp_matrix.rows_for([None])) == [-1]
+
+def test_repeated_smiles_use_the_first_row():
+    matrix = pack_bitstrings(['1100', '0011', '1111'])
+    fp_matrix = FingerprintMatrix.from_smiles(['CCO', 'CCO', 'CC'], matrix)
+    assert list(fp_matrix.rows_for(['CCO', 'CC'])) == [0, 2]
+
+def test_save_and_load(tmp_path, fp_matrix):
+    fp_matrix.save(str(tmp_path), 'fps')
+    loaded = FingerprintMatrix.load(str(tmp_path), 'fps', version='v1')
+
+    assert isinstance(loaded.matrix, np.memmap)
+    assert (np.asarray(loaded.matrix) == fp_matrix.matrix).all()
+    assert list(loaded.rows_for(['CCO', 'C', 'missing'])) == list(fp_matrix.rows_for(['CCO', 'C', 'missing']))
+
+    assert FingerprintMatrix.load(str(tmp_path), 'fps', version='v2') is None
+    assert FingerprintMatrix.load(str(tmp_path), 'missing') is None
+
+def test_save_and_load_empty(tmp_path):
+    empty = FingerprintMatrix.from_bitstrings([], [])
+    empty.save(str(tmp_path), 'empty')
+    loaded = FingerprintMatrix.load(str(tmp_path), 'empty')
+    assert len(loaded) == 0
+    assert list(loaded.rows_for(['CCO'])) == [-1]
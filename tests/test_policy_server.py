@@ -0,0 +1,133 @@
+import socket
+import threading
+import time
+import pytest
+from retrobiocat_web.retro.generation.retrosynthesis_engine.policy_server import MicroBatcher, PolicyClient, PolicyServer
+
+
+class FakeActionApplier():
+    """ Stands in for ActionApplier, giving each smiles one action, and failing batches containing 'bad' """
+
+    def __init__(self):
+        self.policy_model = 'loaded'
+        self.batches = []
+
+    def get_actions_batch(self, list_smiles):
+        self.batches.append(list(list_smiles))
+        if 'bad' in list_smiles:
+            raise ValueError('could not parse bad')
+        return [[{'smiles': smi, 'prior': 0.5}] for smi in list_smiles]
+
+
+class SlowActionApplier(FakeActionApplier):
+    """ A FakeActionApplier which takes longer than the client will wait """
+
+    def get_actions_batch(self, list_smiles):
+        time.sleep(0.5)
+        return super().get_actions_batch(list_smiles)
+
+
+def start_server(socket_path, applier):
+    server = PolicyServer(socket_path, applier, batch_window=0.001)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+def submit_together(batcher, requests):
+    """ Submit each list of smiles from its own thread at once, returning the results (or exceptions) in order """
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def submit(i):
+        barrier.wait()
+        try:
+            results[i] = batcher.submit(requests[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_requests_are_batched_and_each_gets_its_own_actions():
+    applier = FakeActionApplier()
+    batcher = MicroBatcher(applier, batch_window=0.5, max_batch=64)
+    batcher.start()
+
+    requests = [[f"C{i}", f"O{i}"] for i in range(6)]
+    results = submit_together(batcher, requests)
+
+    for list_smiles, actions in zip(requests, results):
+        assert [action[0]['smiles'] for action in actions] == list_smiles
+    assert len(applier.batches) < len(requests)
+
+def test_a_failing_request_does_not_fail_the_rest_of_its_batch():
+    applier = FakeActionApplier()
+    batcher = MicroBatcher(applier, batch_window=0.5, max_batch=64)
+    batcher.start()
+
+    results = submit_together(batcher, [['CCO'], ['bad'], ['CCN', 'CC']])
+
+    assert results[0] == [[{'smiles': 'CCO', 'prior': 0.5}]]
+    assert isinstance(results[1], RuntimeError)
+    assert [action[0]['smiles'] for action in results[2]] == ['CCN', 'CC']
+
+def test_batches_stop_at_max_batch():
+    applier = FakeActionApplier()
+    batcher = MicroBatcher(applier, batch_window=0.5, max_batch=4)
+    batcher.start()
+
+    submit_together(batcher, [['C', 'CC', 'CCC'] for i in range(4)])
+    assert max(len(batch) for batch in applier.batches) <= 6
+
+
+def test_client_and_server_over_a_socket(tmp_path):
+    socket_path = str(tmp_path / 'policy.sock')
+    server = start_server(socket_path, FakeActionApplier())
+
+    client = PolicyClient(socket_path, timeout=10)
+    try:
+        assert client.get_actions_batch(['CCO']) == [[{'smiles': 'CCO', 'prior': 0.5}]]
+        with pytest.raises(RuntimeError):
+            client.get_actions_batch(['bad'])
+        assert client.get_actions_batch(['CCN']) == [[{'smiles': 'CCN', 'prior': 0.5}]]
+    finally:
+        client.close()
+        stop_server(server)
+
+def test_client_does_not_resend_a_batch_after_a_timeout(tmp_path):
+    socket_path = str(tmp_path / 'policy.sock')
+    applier = SlowActionApplier()
+    server = start_server(socket_path, applier)
+
+    client = PolicyClient(socket_path, timeout=0.1)
+    try:
+        with pytest.raises(socket.timeout):
+            client.get_actions_batch(['CCO'])
+        assert client.sock is None
+        time.sleep(0.6)
+        assert applier.batches == [['CCO']]
+    finally:
+        client.close()
+        stop_server(server)
+
+def test_client_reconnects_once_after_the_server_restarts(tmp_path):
+    socket_path = str(tmp_path / 'policy.sock')
+    server = start_server(socket_path, FakeActionApplier())
+    client = PolicyClient(socket_path, timeout=10)
+    try:
+        assert client.get_actions_batch(['CCO']) == [[{'smiles': 'CCO', 'prior': 0.5}]]
+        stop_server(server)
+        server = start_server(socket_path, FakeActionApplier())
+        assert client.get_actions_batch(['CCN']) == [[{'smiles': 'CCN', 'prior': 0.5}]]
+    finally:
+        client.close()
+        stop_server(server)
@@ -0,0 +1,54 @@
+import pytest
+import mongoengine
+from retrobiocat_web.mongo.models.reaction_models import Reaction
+from retrobiocat_web.retro.generation.load import load_from_mongo, rule_bundle, rxn_class
+
+mongomock = pytest.importorskip('mongomock')
+
+SMARTS = "[#6:1][#6H1:2]=[#8:4]>>[#6:1][#6H2:2][#8H1:4]"
+
+
+@pytest.fixture(autouse=True)
+def mock_db():
+    mongoengine.connect('test_rule_bundle', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient,
+                        uuidRepresentation='standard')
+    Reaction(name='Aldehyde reduction', smarts=[SMARTS], enzyme_types=['ADH'],
+             cofactors={'ADH': {'cofactors_plus': ['NAD+'], 'cofactors_minus': ['NADH']}}).save()
+    rxn_class.clear_rule_set_cache()
+    yield
+    rxn_class.clear_rule_set_cache()
+    Reaction.drop_collection()
+    load_from_mongo.ReactionRulesVersion.drop_collection()
+    mongoengine.disconnect()
+
+
+def test_rules_version_stamp_includes_the_version_doc():
+    first = load_from_mongo.get_rules_version()
+    assert first == load_from_mongo.get_rules_version()
+    load_from_mongo.bump_rules_version()
+    assert load_from_mongo.get_rules_version() != first
+
+    # a replaced database starts its counter at 0 again, but the stamp is not reused
+    load_from_mongo.ReactionRulesVersion.drop_collection()
+    assert load_from_mongo.get_rules_version() != first
+
+def test_loading_rules_does_not_write_bundles(monkeypatch):
+    saved = []
+    monkeypatch.setattr(rule_bundle, 'save_bundle', lambda bundle, path: saved.append(path))
+    rule_set = rxn_class.load_mongo_rule_set()
+    assert list(rule_set['rxns']) == ['Aldehyde reduction']
+    assert saved == []
+
+def test_exported_bundle_is_used_only_for_the_same_stamp(tmp_path):
+    paths = rule_bundle.export_bundles(folder=str(tmp_path))
+    path = rule_bundle.bundle_path_for_options(folder=str(tmp_path))
+    assert path in paths
+
+    version = load_from_mongo.get_rules_version()
+    rule_set = rule_bundle.load_rule_set(path, rules_version=version)
+    assert rule_set['version'] == version
+    assert list(rule_set['rxns']) == ['Aldehyde reduction']
+    assert rule_set['reactionEnzymeCofactorDict'] == {'Aldehyde reduction': {'ADH': [['NAD+'], ['NADH']]}}
+
+    load_from_mongo.bump_rules_version()
+    assert rule_bundle.load_rule_set(path, rules_version=load_from_mongo.get_rules_version()) is None
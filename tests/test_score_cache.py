@@ -0,0 +1,45 @@
+from retrobiocat_web.retro.evaluation.score_cache import ScoreCache, get_scscores
+from retrobiocat_web.retro.generation.retrosynthesis_engine.expansion_cache import SQLiteTier
+
+
+class CountingModel():
+    """ Stands in for the SCScore model, scoring each smiles by its length """
+
+    def __init__(self):
+        self.batches = []
+
+    def get_scores_from_smis(self, list_smiles):
+        self.batches.append(list(list_smiles))
+        return [len(smi) for smi in list_smiles]
+
+
+def test_only_uncached_smiles_are_scored_in_one_batch():
+    cache = ScoreCache()
+    model = CountingModel()
+
+    assert get_scscores(['CC', 'CCO'], model, cache=cache) == {'CC': 2.0, 'CCO': 3.0}
+    assert get_scscores(['CCO', 'CCCC', 'CCCC', 'C'], model, cache=cache) == {'CCO': 3.0, 'CCCC': 4.0, 'C': 1.0}
+    assert model.batches == [['CC', 'CCO'], ['CCCC', 'C']]
+
+def test_scores_are_shared_through_the_shared_tier(tmp_path):
+    first, second = ScoreCache(), ScoreCache()
+    first.shared_tier = SQLiteTier(str(tmp_path / 'scores.db'))
+    second.shared_tier = SQLiteTier(str(tmp_path / 'scores.db'))
+
+    get_scscores(['CCO'], CountingModel(), cache=first)
+    model = CountingModel()
+    assert get_scscores(['CCO'], model, cache=second) == {'CCO': 3.0}
+    assert model.batches == []
+
+def test_shared_tier_failure_is_not_raised():
+    class BrokenTier():
+        def get_many(self, keys):
+            raise ConnectionError('down')
+
+        def set_many(self, values):
+            raise ConnectionError('down')
+
+    cache = ScoreCache()
+    cache.shared_tier = BrokenTier()
+    assert get_scscores(['CC'], CountingModel(), cache=cache) == {'CC': 2.0}
+    assert cache.get_many(['CC']) == {'CC': 2.0}
@@ -0,0 +1,46 @@
+import threading
+import networkx as nx
+import pytest
+from retrobiocat_web.retro.generation.network_generation.scoring_scheduler import ScoringScheduler, merge_attributes
+
+
+def test_stages_run_at_the_same_time():
+    # each stage waits for the others, so this only finishes if they run concurrently
+    barrier = threading.Barrier(3, timeout=5)
+
+    def stage(name):
+        def run():
+            barrier.wait()
+            return {name: {'stage': name}}
+        return name, run
+
+    scheduler = ScoringScheduler(max_workers=3)
+    results = scheduler.run([stage('a'), stage('b'), stage('c')])
+
+    assert results == [{'a': {'stage': 'a'}}, {'b': {'stage': 'b'}}, {'c': {'stage': 'c'}}]
+    assert set(scheduler.stage_times) == {'a', 'b', 'c'}
+
+def test_one_worker_runs_stages_in_order():
+    order = []
+    stages = [(name, lambda name=name: order.append(name) or {}) for name in ['a', 'b', 'c']]
+
+    for max_workers in [1, False]:
+        order.clear()
+        ScoringScheduler(max_workers=max_workers).run(stages)
+        assert order == ['a', 'b', 'c']
+
+def test_stage_errors_are_raised():
+    def fail():
+        raise ValueError('stage failed')
+
+    with pytest.raises(ValueError, match='stage failed'):
+        ScoringScheduler(max_workers=True).run([('ok', lambda: {}), ('fail', fail)])
+
+def test_merge_attributes_skips_nodes_no_longer_in_the_graph():
+    graph = nx.DiGraph()
+    graph.add_node('CCO', attributes={'node_type': 'substrate'})
+
+    merge_attributes(graph, {'CCO': {'complexity': 1.2}, 'removed': {'complexity': 3}})
+
+    assert graph.nodes['CCO']['attributes'] == {'node_type': 'substrate', 'complexity': 1.2}
+    assert 'removed' not in graph
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from retrobiocat_web.retro.enzyme_identification.packed_fingerprints import FingerprintMatrix, tanimoto
+from retrobiocat_web.retro.enzyme_identification.similarity_search import PopcountSearchIndex, tanimoto_upper_bound
+
+
+def brute_force(fp_matrix, rows, query, cutoff, k=None):
+    """ Every row scored, sorted best first (ties by row) - what the search must return """
+    rows = np.unique(rows)
+    sims = tanimoto(query, fp_matrix.matrix[rows], fp_matrix.counts[rows])
+    keep = sims >= cutoff
+    rows, sims = rows[keep], sims[keep]
+    order = np.lexsort((rows, -sims))
+    if k is not None:
+        order = order[:k]
+    return rows[order], sims[order]
+
+@pytest.fixture(scope='module')
+def random_matrix():
+    rng = np.random.default_rng(0)
+    bits = rng.random((500, 256)) < rng.uniform(0.02, 0.4, size=(500, 1))
+    bitstrings = [''.join('1' if b else '0' for b in row) for row in bits]
+    return FingerprintMatrix.from_bitstrings([f"mol{i}" for i in range(500)], bitstrings)
+
+
+@pytest.mark.parametrize('cutoff', [0, 0.3, 0.5, 0.8])
+@pytest.mark.parametrize('k', [None, 1, 5, 50])
+def test_search_equals_brute_force(random_matrix, cutoff, k):
+    index = PopcountSearchIndex(random_matrix, np.arange(len(random_matrix)))
+    for query_row in [0, 17, 250, 499]:
+        query = random_matrix.matrix[query_row]
+        rows, sims = index.search(query, cutoff=cutoff, k=k)
+        expected_rows, expected_sims = brute_force(random_matrix, np.arange(len(random_matrix)), query, cutoff, k)
+        assert list(rows) == list(expected_rows)
+        assert np.allclose(sims, expected_sims)
+
+def test_search_with_allowed_rows(random_matrix):
+    rows = np.arange(0, 500, 3)
+    index = PopcountSearchIndex(random_matrix, np.append(rows, [-1, -1]))
+    allowed = np.zeros(len(random_matrix), dtype=bool)
+    allowed[rows[::2]] = True
+
+    query = random_matrix.matrix[1]
+    found, sims = index.search(query, cutoff=0.2, k=10, allowed=allowed)
+    expected, expected_sims = brute_force(random_matrix, rows[::2], query, 0.2, 10)
+    assert list(found) == list(expected)
+    assert np.allclose(sims, expected_sims)
+
+def test_search_skips_buckets_which_can_not_reach_the_cutoff(random_matrix):
+    index = PopcountSearchIndex(random_matrix, np.arange(len(random_matrix)))
+    index.search(random_matrix.matrix[0], cutoff=0.9)
+    assert index.last_scanned < len(index)
+
+def test_search_of_real_fingerprints(fp_matrix):
+    index = PopcountSearchIndex(fp_matrix, np.arange(len(fp_matrix)))
+    query_row = fp_matrix.rows_for(['CCc1ccc(C=O)cc1'])[0]
+    rows, sims = index.search(fp_matrix.matrix[query_row], cutoff=0.3, k=3)
+    assert rows[0] == query_row and sims[0] == 1.0
+    assert list(rows) == list(brute_force(fp_matrix, np.arange(len(fp_matrix)), fp_matrix.matrix[query_row], 0.3, 3)[0])
+
+def test_upper_bound_is_never_below_the_similarity(random_matrix):
+    query = random_matrix.matrix[3]
+    sims = tanimoto(query, random_matrix.matrix, random_matrix.counts)
+    bounds = tanimoto_upper_bound(random_matrix.counts, int(random_matrix.counts[3]))
+    assert (bounds >= sims - 1e-12).all()